@@ -0,0 +1,73 @@
+"""
+Recall and latency of the IVF approximate index against exact search with
+``VectorStore``, for a range of ``nprobe`` values.
+
+Usage:
+    python benchmarks/bench_ann_recall.py [--size N] [--dim D] [--queries Q]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from truffle_python_sdk.ann import IVFIndex
+from truffle_python_sdk.vector_store import VectorStore
+
+
+def clustered_data(size, dim, n_clusters=500, seed=0):
+    # Embeddings of real corpora are clustered rather than uniform
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim))
+    labels = rng.integers(n_clusters, size=size)
+    return (centers[labels] + 0.5 * rng.normal(size=(size, dim))).astype(np.float32)
+
+
+def timed_search(index, queries, k, **kwargs):
+    start = time.perf_counter()
+    results = [index.search(query, k=k, **kwargs) for query in queries]
+    elapsed = (time.perf_counter() - start) / len(queries)
+    return [{r.index for r in result} for result in results], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=200_000, help="Stored vectors")
+    parser.add_argument("--dim", type=int, default=128, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Queries to run")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    args = parser.parse_args()
+
+    data = clustered_data(args.size + args.queries, args.dim)
+    vectors, queries = data[: args.size], data[args.size :]
+    texts = [str(i) for i in range(args.size)]
+
+    exact = VectorStore(dim=args.dim)
+    exact.add_many(vectors, texts)
+    index = IVFIndex(dim=args.dim, min_train_size=0)
+    index.add_many(vectors, texts)
+
+    start = time.perf_counter()
+    index.train()
+    print(f"trained {index.n_lists} lists in {time.perf_counter() - start:.2f} s")
+
+    truth, exact_time = timed_search(exact, queries, args.k)
+    print(f"{'search':<14}{'recall@' + str(args.k):>12}{'latency':>14}{'speedup':>10}")
+    print(f"{'exact':<14}{1.0:>12.3f}{exact_time * 1e3:>11.2f} ms{1.0:>9.1f}x")
+    nprobe = 1
+    while nprobe <= index.n_lists:
+        found, elapsed = timed_search(index, queries, args.k, nprobe=nprobe)
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        print(
+            f"{'nprobe=' + str(nprobe):<14}{recall:>12.3f}"
+            f"{elapsed * 1e3:>11.2f} ms{exact_time / elapsed:>9.1f}x"
+        )
+        nprobe *= 2
+
+
+if __name__ == "__main__":
+    main()
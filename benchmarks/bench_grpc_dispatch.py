@@ -0,0 +1,119 @@
+"""
+Per-call overhead of the gRPC rpc_method wrapped around each tool: the time
+from a parsed request message to a built response message, compared with
+calling the tool directly. The handlers are built as a default ``Client``
+builds them, with tool metrics on; the share of the overhead spent recording
+the metrics is reported separately.
+
+Usage:
+    python benchmarks/bench_grpc_dispatch.py [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from truffle_python_sdk import Client, TruffleApp, tool
+from truffle_python_sdk._grpc_server import build_grpc_handlers
+from truffle_python_sdk._proto import compile_proto, load_proto_messages
+
+
+class DispatchApp(TruffleApp):
+    @tool()
+    def ping(self) -> str:
+        return "pong"
+
+    @tool()
+    def add(self, a: float, b: float) -> float:
+        return a + b
+
+    @tool()
+    async def add_async(self, a: float, b: float) -> float:
+        return a + b
+
+    @tool()
+    def greet(self, name: str, greeting: str, punctuation: str) -> str:
+        return greeting
+
+    @tool()
+    def total(self, values: List[float]) -> float:
+        return values[0]
+
+    @tool()
+    def scale(self, values: np.ndarray, factor: float) -> np.ndarray:
+        return values
+
+
+CASES = [
+    ("ping", {}),
+    ("add", {"a": 1.0, "b": 2.0}),
+    ("add_async", {"a": 1.0, "b": 2.0}),
+    ("greet", {"name": "Ada", "greeting": "Hello", "punctuation": "!"}),
+    ("total", {"values": [0.5] * 1024}),
+    ("scale", {"values": np.ones(1024, dtype=np.float32), "factor": 2.0}),
+]
+
+
+class _Context:
+    def invocation_metadata(self):
+        return ()
+
+
+def per_call_us(func, number):
+    return timeit.timeit(func, number=number) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=20000, help="Calls per case")
+    args = parser.parse_args()
+
+    app = DispatchApp()
+    tools = type(app).__truffle_tools__
+    messages = load_proto_messages(compile_proto(tools.proto))
+    # What a server started by a default Client runs, and the same without metrics
+    handlers = build_grpc_handlers(tools, messages, app, metrics=Client().metrics)
+    unmeasured = build_grpc_handlers(tools, messages, app)
+    context = _Context()
+
+    print(
+        f"{'tool':<12}{'direct':>14}{'rpc_method':>14}{'overhead':>14}{'metrics':>14}"
+    )
+    for name, kwargs in CASES:
+        spec = tools[name]
+        func = spec.function
+        wire = tools.schema.codecs[name].request_fields(kwargs)
+        request = messages[f"{name}Request"](**wire)
+        rpc_method = handlers[name].unary_unary
+        unmeasured_method = unmeasured[name].unary_unary
+
+        if spec.is_async:
+            from truffle_python_sdk._utils import run_coroutine
+
+            def direct():
+                return run_coroutine(func(app, **kwargs))
+
+        else:
+
+            def direct():
+                return func(app, **kwargs)
+
+        direct_us = per_call_us(direct, args.number)
+        rpc_us = per_call_us(lambda: rpc_method(request, context), args.number)
+        unmeasured_us = per_call_us(
+            lambda: unmeasured_method(request, context), args.number
+        )
+        print(
+            f"{name:<12}{direct_us:>11.2f} us{rpc_us:>11.2f} us"
+            f"{rpc_us - direct_us:>11.2f} us{rpc_us - unmeasured_us:>11.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
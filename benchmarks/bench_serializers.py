@@ -0,0 +1,60 @@
+"""
+Per-call overhead of converting tool results: the generic recursive
+``standardize`` walk versus the serializer compiled from the tool's return
+annotation.
+
+Usage:
+    python benchmarks/bench_serializers.py [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from examples.calculator import Operation
+from truffle_python_sdk._serializers import compile_serializer
+from truffle_python_sdk._utils import standardize
+
+
+CASES = [
+    ("float", float, 3.14),
+    ("str", str, "Hello, Truffle!"),
+    ("List[float] (1024)", List[float], [0.5] * 1024),
+    ("np.ndarray (1024)", np.ndarray, np.ones(1024, dtype=np.float32)),
+    (
+        "List[Operation] (1000)",
+        List[Operation],
+        [
+            Operation(operation_type="add", operands=(i, i), result=2 * i)
+            for i in range(1000)
+        ],
+    ),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=200, help="Calls per case")
+    args = parser.parse_args()
+
+    print(f"{'case':<26}{'standardize':>16}{'compiled':>16}{'speedup':>10}")
+    for name, annotation, value in CASES:
+        serialize = compile_serializer(annotation)
+        before = timeit.timeit(lambda: standardize(value), number=args.number)
+        after = timeit.timeit(lambda: serialize(value), number=args.number)
+        before_us = before / args.number * 1e6
+        after_us = after / args.number * 1e6
+        print(
+            f"{name:<26}{before_us:>13.2f} us{after_us:>13.2f} us"
+            f"{before_us / after_us:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
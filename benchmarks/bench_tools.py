@@ -0,0 +1,63 @@
+"""
+Latency and throughput of the example apps' tools over the direct Python,
+REST and gRPC paths, against a local stand-in for the inference server.
+
+Results are saved as JSON; pass an earlier file with ``--compare`` to list
+regressions (exits with 1 if there are any).
+
+Usage:
+    python benchmarks/bench_tools.py [--requests N] [--concurrency C]
+        [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from truffle_python_sdk import bench
+
+MODULES = ["examples.echo", "examples.calculator", "examples.chat", "examples.rag_chat"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=1000, help="Calls per tool")
+    parser.add_argument("--concurrency", type=int, default=8, help="Callers")
+    parser.add_argument(
+        "--paths", nargs="+", choices=bench.PATHS, default=list(bench.PATHS)
+    )
+    parser.add_argument("--output", default="bench_tools.json", help="Results file")
+    parser.add_argument("--compare", default=None, help="Earlier results file")
+    args = parser.parse_args()
+
+    reports = {}
+    for module in MODULES:
+        print(f"== {module}")
+        reports[module] = bench.run_benchmark(
+            module,
+            paths=args.paths,
+            requests=args.requests,
+            concurrency=args.concurrency,
+        )
+    with open(args.output, "w") as f:
+        json.dump(reports, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare is None:
+        return
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = []
+    for module, report in reports.items():
+        if module in baseline:
+            regressions += bench.compare(baseline[module], report)
+    for tool, path, metric, before, after in regressions:
+        print(f"REGRESSION {tool} {path} {metric}: {before:.2f} -> {after:.2f}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from truffle_python_sdk import TruffleApp, tool, Client
-from typing import List
+from typing import Iterator, List
 
 
 class ChatApp(TruffleApp):
@@ -21,6 +21,23 @@ class ChatApp(TruffleApp):
 
         return response_text
 
+    @tool()
+    def chat_stream(self, message: str) -> Iterator[str]:
+        # Add the user's message to the conversation
+        self.conversation.append(f"User: {message}")
+
+        # Construct the prompt
+        prompt = "\n".join(self.conversation) + "\nAssistant:"
+
+        # Stream the response to the caller as it is generated
+        chunks = []
+        for chunk in self._client.stream_completion(prompt):
+            chunks.append(chunk)
+            yield chunk
+
+        # Add the assistant's response to the conversation
+        self.conversation.append(f"Assistant: {''.join(chunks)}")
+
 
 app = ChatApp()
 
@@ -1,6 +1,7 @@
 from truffle_python_sdk import TruffleApp, tool, Client
+from truffle_python_sdk.vector_store import VectorStore
 from typing import List, Dict
-import numpy as np  # For local computations
+from pydantic import Field
 
 
 class ChatApp(TruffleApp):
@@ -9,7 +10,7 @@ class ChatApp(TruffleApp):
     """
 
     conversation: List[Dict[str, str]] = []
-    knowledge_base: List[Dict[str, List[float]]] = []  # Use List[float] instead of np.ndarray
+    knowledge_base: VectorStore = Field(default_factory=VectorStore)
 
     def add_to_knowledge_base(self, text: str):
         """
@@ -18,27 +19,23 @@ class ChatApp(TruffleApp):
         # Get embedding for the text using client's embed method
         embedding_vector = self._client.embed(text)  # Should return a List[float]
         # Store the text and its embedding
-        self.knowledge_base.append({"text": text, "embedding": embedding_vector})
+        self.knowledge_base.add(embedding_vector, text)
+
+    def add_many_to_knowledge_base(self, texts: List[str]):
+        """
+        Add several texts to the knowledge base, embedding them in batches.
+        """
+        embedding_vectors = self._client.embed_many(texts)
+        self.knowledge_base.add_many(embedding_vectors, texts)
 
     def retrieve_relevant_docs(self, query: str, top_k: int = 3) -> List[str]:
         """
         Retrieve the most relevant documents from the knowledge base for the given query.
         """
         query_embedding = self._client.embed(query)  # Get embedding as List[float]
-        query_embedding_np = np.array(query_embedding)  # Convert to numpy array locally
-        similarities = []
-        for doc in self.knowledge_base:
-            doc_embedding_np = np.array(doc["embedding"])  # Convert to numpy array locally
-            # Compute cosine similarity
-            similarity = np.dot(query_embedding_np, doc_embedding_np) / (
-                np.linalg.norm(query_embedding_np) * np.linalg.norm(doc_embedding_np)
-            )
-            similarities.append((similarity, doc["text"]))
-        # Sort the documents by similarity in descending order
-        similarities.sort(reverse=True)
-        # Return the top_k most similar documents
-        relevant_texts = [text for _, text in similarities[:top_k]]
-        return relevant_texts
+        # Score every document at once and keep the top_k most similar
+        results = self.knowledge_base.search(query_embedding, k=top_k)
+        return [result.text for result in results]
 
     @tool()
     def add_knowledge(self, text: str) -> str:
@@ -48,6 +45,14 @@ class ChatApp(TruffleApp):
         self.add_to_knowledge_base(text)
         return f"Added to knowledge base: {text}"
 
+    @tool()
+    def add_knowledge_batch(self, texts: List[str]) -> str:
+        """
+        Add several texts to the knowledge base in one call.
+        """
+        self.add_many_to_knowledge_base(texts)
+        return f"Added {len(texts)} documents to knowledge base."
+
     @tool()
     def chat(self, message: str) -> str:
         """
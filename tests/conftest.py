@@ -0,0 +1,10 @@
+import pytest
+
+from truffle_python_sdk.testing import FakeBackend, fake_embedding  # noqa: F401
+
+
+@pytest.fixture
+def fake_backend():
+    """A local stand-in for the Truffle completion/embedding server."""
+    with FakeBackend() as server:
+        yield server
@@ -0,0 +1,133 @@
+import copy
+import threading
+
+import numpy as np
+import pytest
+from pydantic import Field
+
+from truffle_python_sdk import TruffleApp
+from truffle_python_sdk.ann import IVFIndex
+from truffle_python_sdk.vector_store import VectorStore
+
+
+def clustered(size, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    return centers[rng.integers(20, size=size)] + 0.3 * rng.normal(size=(size, dim))
+
+
+def recall(index, exact, queries, k=10, **kwargs):
+    hits = 0
+    for query in queries:
+        found = {r.index for r in index.search(query, k=k, **kwargs)}
+        hits += len(found & {r.index for r in exact.search(query, k=k)})
+    return hits / (k * len(queries))
+
+
+def test_ivf_recall_against_exact_search():
+    vectors = clustered(3000)
+    queries = clustered(30, seed=1)
+    texts = [str(i) for i in range(len(vectors))]
+    exact = VectorStore()
+    exact.add_many(vectors, texts)
+    index = IVFIndex(n_lists=32, nprobe=4, min_train_size=1000)
+    index.add_many(vectors, texts)
+
+    assert not index.is_trained
+    index.search(queries[0])
+    assert index.is_trained
+
+    assert recall(index, exact, queries) > 0.8
+    # Probing every list is exact
+    assert recall(index, exact, queries, nprobe=32) == 1.0
+
+
+def test_ivf_incremental_inserts_and_deletes():
+    index = IVFIndex(n_lists=8, min_train_size=0)
+    vectors = clustered(500)
+    index.add_many(vectors[:400], [str(i) for i in range(400)])
+    index.train()
+
+    # Vectors added after training are searchable
+    for i in range(400, 500):
+        assert index.add(vectors[i], str(i)) == i
+    assert index.search(vectors[450], k=1, nprobe=8)[0].index == 450
+
+    index.delete(450)
+    assert len(index) == 499
+    assert 450 not in {r.index for r in index.search(vectors[450], k=5, nprobe=8)}
+    with pytest.raises(IndexError):
+        index.delete(1000)
+
+
+def test_first_searches_train_once(monkeypatch):
+    from truffle_python_sdk import ann
+
+    index = IVFIndex(n_lists=8, min_train_size=100)
+    vectors = clustered(500)
+    index.add_many(vectors, [str(i) for i in range(500)])
+
+    calls = []
+    kmeans = ann.spherical_kmeans
+
+    def counting_kmeans(*args, **kwargs):
+        calls.append(1)
+        return kmeans(*args, **kwargs)
+
+    monkeypatch.setattr(ann, "spherical_kmeans", counting_kmeans)
+    barrier = threading.Barrier(4)
+
+    def search():
+        barrier.wait()
+        index.search(vectors[0], k=1)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+
+    # Copies get a lock of their own
+    assert copy.deepcopy(index).search(vectors[1], k=1, nprobe=8)[0].index == 1
+
+
+def test_deleted_vectors_are_compacted_out_of_the_lists():
+    index = IVFIndex(n_lists=4, min_train_size=0, compact_fraction=0.1)
+    vectors = clustered(100)
+    index.add_many(vectors, [str(i) for i in range(100)])
+    index.train()
+
+    for i in range(10):
+        index.delete(i)
+    _, lists, sizes = index._clusters
+    assert sum(sizes) == 100
+    index.delete(10)
+    _, lists, sizes = index._clusters
+    assert sum(sizes) == 89
+    members = np.concatenate([lists[i][: sizes[i]] for i in range(len(lists))])
+    assert not set(range(11)) & set(members.tolist())
+    assert index.search(vectors[50], k=1, nprobe=4)[0].index == 50
+
+
+def test_untrained_index_searches_exactly():
+    index = IVFIndex()
+    index.add_many([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]], ["x", "y", "xy"])
+    index.delete(0)
+    assert [r.text for r in index.search([1.0, 0.1], k=5)] == ["xy", "y"]
+
+
+class IndexedApp(TruffleApp):
+    index: IVFIndex = Field(default_factory=lambda: IVFIndex(min_train_size=0, seed=7))
+
+
+def test_ivf_index_as_app_field():
+    app = IndexedApp()
+    app.index.add_many([[1.0, 0.0], [0.0, 1.0]], ["x", "y"])
+    app.index.delete(0)
+
+    restored = IndexedApp.model_validate_json(app.model_dump_json())
+    assert isinstance(restored.index, IVFIndex)
+    assert restored.index.seed == 7
+    assert len(restored.index) == 1
+    assert [r.text for r in restored.index.search([1.0, 0.0])] == ["y"]
@@ -0,0 +1,70 @@
+import json
+from typing import List, Optional
+
+import numpy as np
+
+from truffle_python_sdk import bench
+
+
+def test_sample_values():
+    assert bench.sample_value(float) == 1.5
+    assert bench.sample_value(List[int]) == [3, 3, 3, 3]
+    assert bench.sample_value(Optional[str]).startswith("The quick")
+    assert isinstance(bench.sample_value(np.ndarray), np.ndarray)
+
+
+def test_summary_and_regressions():
+    summary = bench.summarize([i / 1000 for i in range(1, 101)], elapsed=2.0)
+    assert summary["rps"] == 50
+    assert summary["p50_ms"] == 50
+    assert summary["p99_ms"] == 99
+
+    baseline = {"results": [{"tool": "add", "path": "rest", **summary}]}
+    slower = dict(summary, p99_ms=150, rps=49)
+    current = {"results": [{"tool": "add", "path": "rest", **slower}]}
+    assert bench.compare(baseline, current) == [("add", "rest", "p99_ms", 99, 150)]
+
+    # Baselines with nothing served or sub-resolution latencies are skipped
+    idle = dict(summary, rps=0, p50_ms=0)
+    baseline = {"results": [{"tool": "add", "path": "rest", **idle}]}
+    assert bench.compare(baseline, baseline) == []
+
+
+def test_stages_leave_the_app_untouched():
+    from truffle_python_sdk import TruffleApp, tool
+
+    class CounterApp(TruffleApp):
+        count: int = 0
+
+        @tool()
+        def increment(self) -> int:
+            self.count += 1
+            return self.count
+
+    app = CounterApp()
+    stages = bench.measure_stages(
+        CounterApp.__truffle_tools__["increment"], app, {}, number=5
+    )
+    assert stages["call_us"] > 0
+    assert app.count == 0
+
+
+def test_run_benchmark(tmp_path):
+    report = bench.run_benchmark(
+        "examples.echo",
+        paths=["python", "rest"],
+        requests=50,
+        concurrency=2,
+        stage_number=10,
+        log=lambda line: None,
+    )
+    assert [(r["tool"], r["path"]) for r in report["results"]] == [
+        ("echo", "python"),
+        ("echo", "rest"),
+    ]
+    assert all(r["requests"] == 50 and r["errors"] == 0 for r in report["results"])
+    assert report["stages"][0]["validation_us"] > 0
+
+    path = tmp_path / "results.json"
+    bench.save_report(report, str(path))
+    assert json.loads(path.read_text())["module"] == "examples.echo"
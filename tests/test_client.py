@@ -0,0 +1,263 @@
+from truffle_python_sdk import Client
+
+
+def test_completion_and_embed(fake_backend):
+    client = Client(base_url=fake_backend.url)
+
+    assert client.completion("Hello") == "echo: Hello"
+    embedding = client.embed("Hello")
+    assert isinstance(embedding, list)
+    assert len(embedding) == 8
+
+    client.close()
+
+
+def test_connections_are_reused(fake_backend):
+    client = Client(base_url=fake_backend.url, pool_size=1)
+
+    for _ in range(5):
+        client.completion("Hello")
+        client.embed("Hello")
+
+    # All ten calls should go over a single keep-alive connection
+    assert len(fake_backend.requests) == 10
+    assert fake_backend.connections == 1
+
+    client.close()
+
+
+def test_resolved_address_is_cached(fake_backend, monkeypatch):
+    import socket
+
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def counting_getaddrinfo(*args, **kwargs):
+        lookups.append(args[0])
+        return getaddrinfo(*args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", counting_getaddrinfo)
+
+    url = fake_backend.url.replace("127.0.0.1", "localhost")
+    with Client(base_url=url) as client:
+        client.completion("Hello")
+        client.completion("Hello again")
+
+    assert lookups.count("localhost") == 1
+
+
+def test_failed_lookups_are_retried_soon(fake_backend, monkeypatch):
+    import socket
+
+    from truffle_python_sdk import _transport
+
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def flaky_getaddrinfo(*args, **kwargs):
+        if "type" not in kwargs:
+            # The HTTP library connecting to the unresolved URL
+            return getaddrinfo(*args, **kwargs)
+        lookups.append(args[0])
+        if len(lookups) == 1:
+            raise socket.gaierror("temporary failure")
+        return getaddrinfo(*args, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", flaky_getaddrinfo)
+    monkeypatch.setattr(_transport, "_FAILED_LOOKUP_TTL", 0.0)
+
+    url = fake_backend.url.replace("127.0.0.1", "localhost")
+    with Client(base_url=url) as client:
+        client.completion("Hello")
+        client.completion("Hello again")
+        client.completion("Hello once more")
+
+    # The failure is not cached for the full TTL; the success is
+    assert lookups.count("localhost") == 2
+
+
+def test_embed_many_preserves_order(fake_backend):
+    from tests.conftest import fake_embedding
+
+    texts = [f"document {i}" for i in range(10)]
+    with Client(base_url=fake_backend.url) as client:
+        embeddings = client.embed_many(texts, batch_size=3)
+
+    assert embeddings == [fake_embedding(text) for text in texts]
+    # 10 inputs in chunks of 3 -> 4 upstream requests
+    assert len(fake_backend.requests) == 4
+
+
+def test_concurrent_embeds_are_coalesced(fake_backend):
+    from concurrent.futures import ThreadPoolExecutor
+    from tests.conftest import fake_embedding
+
+    texts = [f"query {i}" for i in range(8)]
+    client = Client(
+        base_url=fake_backend.url, embed_batching=True, embed_batch_wait=0.05
+    )
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        embeddings = list(executor.map(client.embed, texts))
+    client.close()
+
+    assert embeddings == [fake_embedding(text) for text in texts]
+    assert len(fake_backend.requests) < len(texts)
+
+
+def test_stream_completion(fake_backend):
+    with Client(base_url=fake_backend.url) as client:
+        chunks = list(client.stream_completion("one two three"))
+
+    assert chunks == ["one ", "two ", "three "]
+    assert fake_backend.requests[0][1]["stream"] is True
+
+
+def test_async_client(fake_backend):
+    import asyncio
+    from truffle_python_sdk import AsyncClient
+    from tests.conftest import fake_embedding
+
+    async def main():
+        async with AsyncClient(base_url=fake_backend.url) as client:
+            completion, embedding = await asyncio.gather(
+                client.completion("Hello"), client.embed("Hello")
+            )
+            embeddings = await client.embed_many(["a", "b", "c"], batch_size=2)
+            chunks = [chunk async for chunk in client.stream_completion("one two")]
+        return completion, embedding, embeddings, chunks
+
+    completion, embedding, embeddings, chunks = asyncio.run(main())
+
+    assert completion == "echo: Hello"
+    assert embedding == fake_embedding("Hello")
+    assert embeddings == [fake_embedding(text) for text in "abc"]
+    assert chunks == ["one ", "two "]
+
+
+def test_responses_are_cached(fake_backend):
+    from truffle_python_sdk.cache import ResponseCache
+
+    cache = ResponseCache()
+    with Client(base_url=fake_backend.url, cache=cache) as client:
+        first = client.embed("Hello")
+        first.append(0.0)
+        assert client.embed("Hello") == first[:-1]
+        greedy = client.completion("Hello", temperature=0)
+        assert client.completion("Hello", temperature=0) == greedy
+        # Sampled completions are not deterministic, so never cached
+        client.completion("Hello", temperature=0.7)
+        client.completion("Hello", temperature=0.7)
+        # Only "again" is sent upstream
+        client.embed_many(["Hello", "again"])
+
+    paths = [path for path, _ in fake_backend.requests]
+    assert paths.count("/v1/embeddings") == 2
+    assert paths.count("/v1/completions") == 3
+    assert fake_backend.requests[-1][1]["input"] == ["again"]
+    assert cache.stats.hits == 3
+
+
+def test_concurrent_identical_requests_are_coalesced(fake_backend):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from truffle_python_sdk.cache import ResponseCache
+
+    cache = ResponseCache()
+    with Client(base_url=fake_backend.url, cache=cache) as client:
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: client.embed("Hello"), range(32)))
+
+    assert all(result == results[0] for result in results)
+    assert len(fake_backend.requests) == 1
+
+
+def test_cache_eviction_and_disk_tier(fake_backend, tmp_path):
+    import time
+
+    from truffle_python_sdk.cache import MISSING, ResponseCache
+
+    cache = ResponseCache(max_bytes=1000)
+    for i in range(20):
+        cache.set(f"key {i}", [0.5] * 10)
+    assert cache.size <= 1000
+    assert cache.get("key 0") is MISSING
+    assert cache.get("key 19") == [0.5] * 10
+
+    cache = ResponseCache(ttl=0.05)
+    cache.set("key", "value")
+    time.sleep(0.1)
+    assert cache.get("key") is MISSING
+
+    path = str(tmp_path / "cache.sqlite")
+    with Client(base_url=fake_backend.url, cache=ResponseCache(path=path)) as client:
+        embedding = client.embed("Hello")
+        client.cache.close()
+    # A new cache over the same file starts warm
+    cache = ResponseCache(path=path)
+    with Client(base_url=fake_backend.url, cache=cache) as client:
+        assert client.embed("Hello") == embedding
+    assert cache.stats.disk_hits == 1
+    assert len(fake_backend.requests) == 1
+
+
+def test_disk_hits_keep_their_remaining_ttl(tmp_path):
+    import time
+
+    from truffle_python_sdk.cache import MISSING, ResponseCache
+
+    path = str(tmp_path / "cache.sqlite")
+    cache = ResponseCache(ttl=0.3, path=path)
+    cache.set("key", "value")
+    cache.close()
+    time.sleep(0.2)
+    # Promoted to memory with about 0.1 s left, not a fresh 0.3 s
+    cache = ResponseCache(ttl=0.3, path=path)
+    assert cache.get("key") == "value"
+    time.sleep(0.15)
+    assert cache.get("key") is MISSING
+
+
+def test_cache_metrics(tmp_path):
+    from truffle_python_sdk.cache import ResponseCache
+    from truffle_python_sdk.metrics import MetricsRegistry
+
+    registry = MetricsRegistry()
+    cache = ResponseCache(max_bytes=1000, path=str(tmp_path / "c"), metrics=registry)
+    for i in range(20):
+        cache.set(f"key {i}", [0.5] * 10)
+    cache.get("key 19")
+    cache.get("key 0")
+    cache.get("missing")
+
+    def value(name, **labels):
+        (metric,) = [m for m in registry.snapshot()[name] if m["labels"] == labels]
+        return metric["value"]
+
+    assert value("truffle_cache_hits_total", tier="memory") == 1
+    assert value("truffle_cache_hits_total", tier="disk") == 1
+    assert value("truffle_cache_misses_total") == 1
+    assert value("truffle_cache_evictions_total", tier="memory") > 0
+    assert value("truffle_cache_bytes", tier="memory") == cache.size
+    assert value("truffle_cache_bytes", tier="disk") > 0
+    assert "truffle_cache_hits_total" in registry.render()
+    cache.close()
+
+
+def test_async_client_cache(fake_backend):
+    import asyncio
+
+    from truffle_python_sdk import AsyncClient
+    from truffle_python_sdk.cache import ResponseCache
+
+    async def main():
+        cache = ResponseCache()
+        async with AsyncClient(base_url=fake_backend.url, cache=cache) as client:
+            results = await asyncio.gather(*(client.embed("Hello") for _ in range(8)))
+            await client.completion("Hello", temperature=0)
+            await client.completion("Hello", temperature=0)
+        return results, cache
+
+    results, cache = asyncio.run(main())
+    assert all(result == results[0] for result in results)
+    assert len(fake_backend.requests) == 2
+    assert cache.stats.coalesced == 7
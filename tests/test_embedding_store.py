@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+from pydantic import Field
+
+from truffle_python_sdk import TruffleApp
+from truffle_python_sdk.embedding_store import MemmapVectorStore
+
+
+def test_reopen_and_grow_in_place(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8))
+
+    with MemmapVectorStore(tmp_path / "kb", capacity=4) as store:
+        store.add_many(vectors[:30], [f"doc {i}" for i in range(30)])
+        store.add(vectors[30], "doc 30", {"source": "unit"})
+        assert isinstance(store.vectors, np.memmap)
+
+    reopened = MemmapVectorStore(tmp_path / "kb")
+    assert reopened.dim == 8
+    assert len(reopened) == 31
+    assert reopened.texts[30] == "doc 30"
+    assert reopened.metadata[30] == {"source": "unit"}
+    assert reopened.search(vectors[12], k=1)[0].text == "doc 12"
+
+    # Appending grows the existing files rather than rewriting them
+    inode = os.stat(tmp_path / "kb" / "vectors.f32").st_ino
+    reopened.add_many(vectors[31:], [f"doc {i}" for i in range(31, 50)])
+    assert os.stat(tmp_path / "kb" / "vectors.f32").st_ino == inode
+    assert [r.text for r in reopened.search(vectors[45], k=1)] == ["doc 45"]
+    reopened.close()
+
+    with pytest.raises(ValueError):
+        MemmapVectorStore(tmp_path / "kb", dim=4)
+
+
+def test_uncommitted_records_are_ignored(tmp_path):
+    store = MemmapVectorStore(tmp_path, dim=2)
+    store.add([1.0, 0.0], "x")
+    # A crash after writing a record but before committing its offset
+    with open(tmp_path / "records.jsonl", "ab") as f:
+        f.write(b'{"text": "partial')
+
+    store = MemmapVectorStore(tmp_path)
+    assert len(store) == 1
+    store.add([0.0, 1.0], "y")
+    assert list(store.texts) == ["x", "y"]
+
+
+def test_records_are_synced_before_they_are_committed(tmp_path, monkeypatch):
+    store = MemmapVectorStore(tmp_path, dim=2)
+    index = tmp_path / "records.idx"
+    synced = []
+    fsync = os.fsync
+
+    def record_fsync(fd):
+        # Rows committed in the index when each file was synced
+        synced.append(os.path.getsize(index) // 8 if index.exists() else 0)
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", record_fsync)
+    store.add_many([[1.0, 0.0], [0.0, 1.0]], ["x", "y"])
+    assert synced == [0]
+    assert len(MemmapVectorStore(tmp_path)) == 2
+
+
+def _search_in_child(path, queue):
+    store = MemmapVectorStore(path, read_only=True)
+    queue.put([r.text for r in store.search([0.0, 1.0], k=2)])
+
+
+def test_read_only_readers(tmp_path):
+    writer = MemmapVectorStore(tmp_path, dim=2)
+    writer.add([1.0, 0.0], "x")
+    reader = MemmapVectorStore(tmp_path, read_only=True)
+    with pytest.raises(PermissionError):
+        reader.add([1.0, 0.0], "x")
+
+    # Readers see rows appended after they opened the store
+    writer.add([0.0, 1.0], "y")
+    writer.flush()
+    assert [r.text for r in reader.search([0.0, 1.0], k=1)] == ["y"]
+
+    queue = multiprocessing.get_context("spawn").Queue()
+    child = multiprocessing.get_context("spawn").Process(
+        target=_search_in_child, args=(str(tmp_path), queue)
+    )
+    child.start()
+    assert queue.get(timeout=30) == ["y", "x"]
+    child.join()
+
+
+def test_as_app_field(tmp_path):
+    class KnowledgeApp(TruffleApp):
+        knowledge_base: MemmapVectorStore = Field(
+            default_factory=lambda: MemmapVectorStore(tmp_path)
+        )
+
+    app = KnowledgeApp()
+    app.knowledge_base.add([1.0, 0.0], "x")
+    data = app.model_dump(mode="json")
+    assert data["knowledge_base"] == {"path": str(tmp_path), "read_only": False}
+
+    restored = KnowledgeApp.model_validate(data)
+    assert restored.knowledge_base.texts[0] == "x"
@@ -8,6 +8,8 @@ import grpc
 # Add the parent directory to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from truffle_python_sdk import Client
+
 # Test functions for direct Python method calls
 
 
@@ -71,7 +73,7 @@ def test_rag_chat_app_python():
 def run_app_in_background(app_instance, mode, host, port):
     # Start the app in a separate thread
     client = Client()
-    
+
     def start():
         client.start(
             app=app_instance,
@@ -79,7 +81,7 @@ def run_app_in_background(app_instance, mode, host, port):
             host=host,
             port=port,
         )
-    
+
     thread = threading.Thread(target=start)
     thread.daemon = True
     thread.start()
@@ -88,6 +90,35 @@ def run_app_in_background(app_instance, mode, host, port):
     return thread
 
 
+def load_grpc_modules(app_instance):
+    """
+    Message classes and a ``TruffleStub`` for the app, standing in for the
+    generated ``truffle_pb2``/``truffle_pb2_grpc`` modules. They are built in
+    a private descriptor pool: importing generated stubs registers
+    ``truffle.proto`` in the default pool, which only works once per process.
+    """
+    import types
+    from truffle_python_sdk import _proto
+
+    tools = type(app_instance).__truffle_tools__
+    messages = _proto.load_proto_messages(_proto.compile_proto(tools.proto))
+
+    class TruffleStub:
+        def __init__(self, channel):
+            for name, tool in tools.items():
+                method = channel.unary_stream if tool.stream else channel.unary_unary
+                rpc = method(
+                    f"/truffle.Truffle/{name}",
+                    request_serializer=messages[f"{name}Request"].SerializeToString,
+                    response_deserializer=messages[f"{name}Response"].FromString,
+                )
+                setattr(self, name, rpc)
+
+    return types.SimpleNamespace(**messages), types.SimpleNamespace(
+        TruffleStub=TruffleStub
+    )
+
+
 # Test functions for REST mode
 
 
@@ -214,9 +245,8 @@ def test_echo_app_grpc():
     # Start the app in gRPC mode
     run_app_in_background(echo_app, mode="grpc", host=host, port=port)
 
-    # Import the generated gRPC modules
-    import truffle_pb2
-    import truffle_pb2_grpc
+    # Generate the gRPC client modules
+    truffle_pb2, truffle_pb2_grpc = load_grpc_modules(echo_app)
 
     # Create a gRPC channel and stub
     channel = grpc.insecure_channel(f"{host}:{port}")
@@ -238,9 +268,8 @@ def test_calculator_app_grpc():
     # Start the app in gRPC mode
     run_app_in_background(calculator_app, mode="grpc", host=host, port=port)
 
-    # Import the generated gRPC modules
-    import truffle_pb2
-    import truffle_pb2_grpc
+    # Generate the gRPC client modules
+    truffle_pb2, truffle_pb2_grpc = load_grpc_modules(calculator_app)
 
     # Create a gRPC channel and stub
     channel = grpc.insecure_channel(f"{host}:{port}")
@@ -286,9 +315,8 @@ def test_chat_app_grpc():
     # Start the app in gRPC mode
     run_app_in_background(chat_app, mode="grpc", host=host, port=port)
 
-    # Import the generated gRPC modules
-    import truffle_pb2
-    import truffle_pb2_grpc
+    # Generate the gRPC client modules
+    truffle_pb2, truffle_pb2_grpc = load_grpc_modules(chat_app)
 
     # Create a gRPC channel and stub
     channel = grpc.insecure_channel(f"{host}:{port}")
@@ -311,9 +339,8 @@ def test_rag_chat_app_grpc():
     # Start the app in gRPC mode
     run_app_in_background(rag_chat_app, mode="grpc", host=host, port=port)
 
-    # Import the generated gRPC modules
-    import truffle_pb2
-    import truffle_pb2_grpc
+    # Generate the gRPC client modules
+    truffle_pb2, truffle_pb2_grpc = load_grpc_modules(rag_chat_app)
 
     # Create a gRPC channel and stub
     channel = grpc.insecure_channel(f"{host}:{port}")
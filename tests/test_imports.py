@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from tests.test_server import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative time ``python -X importtime`` may report for importing the
+# package, in microseconds: about 2.5 times the 120-130 ms measured for the
+# lazy import. The module checks below catch the usual regressions exactly.
+IMPORT_BUDGET_US = 300_000
+
+GRPC_MODULES = {"grpc", "grpc_tools", "google.protobuf"}
+REST_MODULES = {"fastapi", "uvicorn", "starlette", "requests", "httpx"}
+
+SERVE = """
+import os, socket, threading, time
+from truffle_python_sdk import Client
+from truffle_python_sdk.__main__ import load_app
+
+app = load_app("examples.echo")
+kwargs = dict(mode={mode!r}, host="127.0.0.1", port={port}, log_level="error")
+threading.Thread(target=Client().start, args=(app,), kwargs=kwargs, daemon=True).start()
+deadline = time.monotonic() + 30
+while time.monotonic() < deadline:
+    try:
+        socket.create_connection(("127.0.0.1", {port}), timeout=0.1).close()
+        os._exit(0)
+    except OSError:
+        time.sleep(0.05)
+os._exit(1)
+"""
+
+
+def import_times(*args: str) -> dict:
+    """
+    Run ``python -X importtime`` with ``args`` (such as ``"-c", code``) and
+    return the cumulative import time of every module it imported, in
+    microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def top_level(times: dict, packages: set) -> set:
+    return {
+        name
+        for name in times
+        if any(
+            name == package or name.startswith(package + ".") for package in packages
+        )
+    }
+
+
+def test_package_import_budget():
+    runs = [import_times("-c", "import truffle_python_sdk") for _ in range(3)]
+    # Neither transport, nor numpy, is needed to define an app
+    assert not top_level(runs[0], GRPC_MODULES | REST_MODULES | {"numpy"})
+    fastest = min(times["truffle_python_sdk"] for times in runs)
+    assert fastest < IMPORT_BUDGET_US, f"import took {fastest} us"
+
+
+def test_cli_proto_imports(tmp_path):
+    output = tmp_path / "calculator.proto"
+    times = import_times(
+        "-m",
+        "truffle_python_sdk",
+        "proto",
+        "examples.calculator",
+        "--output",
+        str(output),
+    )
+    assert "service Truffle" in output.read_text()
+    assert not top_level(times, GRPC_MODULES | REST_MODULES)
+
+
+@pytest.mark.parametrize(
+    "mode, used, unused",
+    [("rest", REST_MODULES, GRPC_MODULES), ("grpc", GRPC_MODULES, REST_MODULES)],
+)
+def test_server_imports_only_its_transport(mode, used, unused):
+    times = import_times("-c", SERVE.format(mode=mode, port=free_port()))
+    assert top_level(times, used)
+    assert not top_level(times, unused | {"numpy"})
@@ -0,0 +1,113 @@
+import threading
+from typing import Iterator
+
+import pytest
+import requests
+
+from truffle_python_sdk import Client, TruffleApp, tool
+from truffle_python_sdk.metrics import Histogram, MetricsRegistry
+from tests.test_server import GrpcTestClient, free_port, wait_for_port
+
+
+class UpstreamApp(TruffleApp):
+    @tool()
+    def ask(self, question: str) -> str:
+        return self._client.completion(question)
+
+    @tool()
+    def fail(self) -> str:
+        raise RuntimeError("boom")
+
+    @tool()
+    def words(self, text: str) -> Iterator[str]:
+        yield from text.split()
+
+
+def serve(app, mode, metrics, base_url, **options):
+    port = free_port()
+    client = Client(base_url=base_url, metrics=metrics)
+    thread = threading.Thread(
+        target=client.start,
+        kwargs=dict(app=app, mode=mode, host="127.0.0.1", port=port, **options),
+        daemon=True,
+    )
+    thread.start()
+    wait_for_port(port)
+    return port
+
+
+def only(snapshot, name, **labels):
+    (metric,) = [m for m in snapshot[name] if m["labels"] == labels]
+    return metric["value"]
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(1, 10001):
+        histogram.record(i / 1e6)
+    assert histogram.count == 10000
+    assert histogram.percentile(50) == pytest.approx(5000e-6, rel=1 / 16)
+    assert histogram.percentile(99) == pytest.approx(9900e-6, rel=1 / 16)
+    assert histogram.max == 10000e-6
+    # Outliers many orders of magnitude away stay accurate
+    histogram.record(42.0)
+    assert histogram.max == 42.0
+    buckets = dict(zip(histogram.prometheus_buckets, histogram.cumulative_counts()))
+    assert buckets[0.001] == 1000
+    assert buckets[0.01] == 10000
+    assert buckets[60.0] == 10001
+
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls", tool='say "hi"').inc(3)
+    registry.histogram("size_bytes", unit="bytes").record(100)
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{tool="say \\"hi\\""} 3' in text
+    assert 'size_bytes_bucket{le="64.0"} 0' in text
+    assert 'size_bytes_bucket{le="256.0"} 1' in text
+    assert "size_bytes_count 1" in text
+
+
+def test_rest_metrics_endpoint(fake_backend):
+    registry = MetricsRegistry()
+    port = serve(UpstreamApp(), "rest", registry, fake_backend.url)
+    url = f"http://127.0.0.1:{port}"
+
+    for _ in range(3):
+        requests.post(f"{url}/ask", json={"question": "Hello"})
+    requests.post(f"{url}/fail")
+    requests.post(f"{url}/words", json={"text": "a b c"})
+
+    snapshot = registry.snapshot()
+    assert only(snapshot, "truffle_tool_duration_seconds", tool="ask")["count"] == 3
+    assert only(snapshot, "truffle_tool_errors_total", tool="fail") == 1
+    assert only(snapshot, "truffle_tool_in_flight", tool="ask") == 0
+    streamed = only(snapshot, "truffle_tool_response_bytes", tool="words")
+    assert streamed["count"] == 1 and streamed["sum"] > 0
+    upstream = only(
+        snapshot, "truffle_upstream_duration_seconds", endpoint="/v1/completions"
+    )
+    assert upstream["count"] == 3
+    assert only(snapshot, "truffle_executor_queue_wait_seconds")["count"] == 4
+
+    text = requests.get(f"{url}/metrics").text
+    assert 'truffle_tool_duration_seconds_count{tool="ask"} 3' in text
+    assert 'truffle_upstream_errors_total{endpoint="/v1/completions"} 0' in text
+
+
+@pytest.mark.parametrize("runtime", ["thread", "aio"])
+def test_grpc_metrics(fake_backend, runtime):
+    registry = MetricsRegistry()
+    app = UpstreamApp()
+    port = serve(app, "grpc", registry, fake_backend.url, grpc_runtime=runtime)
+    client = GrpcTestClient(app, port)
+
+    assert client.call("ask", question="Hello").result == "echo: Hello"
+    assert [chunk.result for chunk in client.call("words", text="a b")] == ["a", "b"]
+
+    snapshot = registry.snapshot()
+    assert only(snapshot, "truffle_tool_duration_seconds", tool="ask")["count"] == 1
+    assert only(snapshot, "truffle_tool_request_bytes", tool="ask")["sum"] > 0
+    assert only(snapshot, "truffle_tool_duration_seconds", tool="words")["count"] == 1
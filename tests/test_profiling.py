@@ -0,0 +1,179 @@
+import asyncio
+import marshal
+import pstats
+import threading
+from typing import Iterator
+
+import pytest
+import requests
+
+from truffle_python_sdk import TruffleApp, tool
+from truffle_python_sdk.profiling import Profiler, fetch
+from tests.test_server import GrpcTestClient, run_app_in_background
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class WorkApp(TruffleApp):
+    @tool()
+    def fib(self, n: int) -> int:
+        return fibonacci(n)
+
+    @tool()
+    async def fib_async(self, n: int) -> int:
+        return fibonacci(n)
+
+    @tool()
+    def fib_stream(self, n: int) -> Iterator[int]:
+        for i in range(n):
+            yield fibonacci(i)
+
+    @tool()
+    def allocate(self, n: int) -> int:
+        self.__dict__.setdefault("_kept", []).append(bytearray(n))
+        return n
+
+
+def test_cpu_profile_outputs(tmp_path):
+    profiler = Profiler()
+    assert profiler.run("fib", "cpu", lambda: fibonacci(15)) == 610
+    (summary,) = profiler.profiles()
+    assert summary["tool"] == "fib" and summary["kind"] == "cpu"
+
+    profile = profiler.get(summary["id"])
+    assert "fibonacci" in profile.text()
+    # Recursive calls are folded into the outermost one
+    (line,) = [line for line in profile.collapsed().splitlines() if "fib" in line]
+    assert line.startswith("<lambda> (test_profiling.py:")
+    lineno = fibonacci.__code__.co_firstlineno
+    assert f";fibonacci (test_profiling.py:{lineno}) " in line
+
+    path = tmp_path / "fib.pstats"
+    path.write_bytes(profiler.render(summary["id"], "pstats"))
+    stats = pstats.Stats(str(path))
+    (calls,) = [v for k, v in stats.stats.items() if k[2] == "fibonacci"]
+    assert calls[1] == 1973  # Total calls, including recursive ones
+
+
+def test_memory_profile_and_errors():
+    profiler = Profiler(kind="memory", capacity=2)
+    kept = []
+    profiler.run("allocate", "memory", lambda: kept.append(bytearray(1 << 20)))
+    profile = profiler.get(profiler.profiles()[0]["id"])
+    assert sum(size for size, _, _ in profile.allocations) >= 1 << 20
+    assert "test_profiling.py" in profile.collapsed()
+    with pytest.raises(ValueError):
+        profile.pstats()
+
+    with pytest.raises(ZeroDivisionError):
+        profiler.run("divide", "cpu", lambda: 1 / 0)
+    profiler.run("noop", None, lambda: None)
+    summaries = profiler.profiles()
+    # The ring buffer keeps the last two profiles, and skips unprofiled calls
+    assert [s["tool"] for s in summaries] == ["allocate", "divide"]
+    assert "ZeroDivisionError" in summaries[1]["error"]
+
+
+def test_concurrent_cpu_profiles():
+    profiler = Profiler()
+    barrier = threading.Barrier(4)
+    results = []
+
+    def work():
+        # Every call is still running when the others start
+        barrier.wait()
+        return fibonacci(10)
+
+    def call():
+        results.append(profiler.run("fib", "cpu", work))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Only one call is profiled at a time; the others run unprofiled
+    assert results == [55] * 4
+    errors = [summary["error"] for summary in profiler.profiles()]
+    assert errors.count(None) == 1
+    assert errors.count("skipped: another CPU profile was running") == 3
+
+    async def fib_later():
+        await asyncio.sleep(0.01)
+        return fibonacci(10)
+
+    async def main():
+        return await asyncio.gather(
+            profiler.arun("fib_async", "cpu", fib_later),
+            profiler.arun("fib_async", "cpu", fib_later),
+        )
+
+    assert asyncio.run(main()) == [55, 55]
+    summaries = profiler.profiles()[-2:]
+    assert summaries[0]["error"] is None
+    assert summaries[1]["error"].startswith("skipped")
+    assert "fibonacci" in profiler.get(summaries[0]["id"]).text()
+
+
+def test_profiler_choice():
+    assert Profiler().choose() is None
+    assert Profiler().choose("memory") == "memory"
+    assert Profiler(kind="memory").choose("1") == "memory"
+    assert Profiler(sample_rate=1.0).choose() == "cpu"
+
+
+def test_rest_profiles():
+    profiler = Profiler()
+    port = run_app_in_background(WorkApp(), "rest", profiler=profiler)
+    url = f"http://127.0.0.1:{port}"
+
+    assert requests.post(f"{url}/fib", json={"n": 10}).json()["result"] == 55
+    assert requests.get(f"{url}/_profiles").json() == []
+
+    headers = {"X-Truffle-Profile": "cpu"}
+    requests.post(f"{url}/fib", json={"n": 12}, headers=headers)
+    requests.post(f"{url}/fib_async", json={"n": 12}, headers=headers)
+    headers = {"X-Truffle-Profile": "memory"}
+    requests.post(f"{url}/allocate", json={"n": 1 << 20}, headers=headers)
+    # Streams are profiled over all their chunks
+    headers = {"X-Truffle-Profile": "cpu"}
+    response = requests.post(f"{url}/fib_stream", json={"n": 15}, headers=headers)
+    assert response.text.count("data:") == 16
+
+    summaries = fetch(url)
+    assert [s["tool"] for s in summaries] == [
+        "fib",
+        "fib_async",
+        "allocate",
+        "fib_stream",
+    ]
+    assert [s["kind"] for s in summaries] == ["cpu", "cpu", "memory", "cpu"]
+    assert "fibonacci" in fetch(url, summaries[3]["id"], "collapsed")
+    collapsed = fetch(url, summaries[1]["id"], "collapsed")
+    assert "fibonacci" in collapsed
+    assert "test_profiling.py" in fetch(url, summaries[2]["id"])
+    stats = marshal.loads(fetch(url, summaries[0]["id"], "pstats"))
+    assert any(func[2] == "fibonacci" for func in stats)
+
+    assert requests.get(f"{url}/_profiles/999").status_code == 404
+    response = requests.get(f"{url}/_profiles/{summaries[2]['id']}?format=pstats")
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("runtime", ["thread", "aio"])
+def test_grpc_sampled_profiles(runtime):
+    app = WorkApp()
+    profiler = Profiler(sample_rate=1.0)
+    port = run_app_in_background(app, "grpc", profiler=profiler, grpc_runtime=runtime)
+    client = GrpcTestClient(app, port)
+
+    assert client.call("fib", n=10).result == 55
+    client.call("fib", metadata=[("x-truffle-profile", "memory")], n=10)
+
+    server = f"grpc://127.0.0.1:{port}"
+    summaries = fetch(server)
+    assert [s["kind"] for s in summaries] == ["cpu", "memory"]
+    assert "fibonacci" in fetch(server, summaries[0]["id"], "collapsed")
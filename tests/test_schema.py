@@ -0,0 +1,236 @@
+import datetime
+import enum
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+import numpy as np
+import pytest
+from pydantic import BaseModel
+
+from truffle_python_sdk import TruffleApp, tool
+from truffle_python_sdk._schema import ProtoSchema
+from truffle_python_sdk._proto import compile_proto, load_proto_messages
+from tests.test_server import GrpcTestClient, run_app_in_background
+
+
+class Color(enum.Enum):
+    RED = "red"
+    GREEN = "green"
+
+
+class Point(BaseModel):
+    x: float
+    y: float
+
+
+class Shape(BaseModel):
+    name: str
+    color: Color
+    points: List[Point]
+    center: Optional[Point] = None
+    label: Optional[str] = None
+    tags: Dict[str, int] = {}
+    created: datetime.datetime
+    children: List["Shape"] = []
+
+
+@dataclass
+class Span:
+    start: int
+    length: datetime.timedelta
+
+
+class SchemaApp(TruffleApp):
+    @tool()
+    def count(self, n: int, scale: float) -> int:
+        return n * int(scale)
+
+    @tool()
+    def grow(self, shape: Shape, factor: float) -> Shape:
+        points = [Point(x=p.x * factor, y=p.y * factor) for p in shape.points]
+        return shape.model_copy(update={"points": points})
+
+    @tool()
+    def pick(self, value: Union[int, str, Point]) -> Union[int, str, Point]:
+        return value
+
+    @tool()
+    def maybe(self, value: Optional[int]) -> Optional[int]:
+        return value
+
+    @tool()
+    def pair(self, pair: Tuple[int, str], rest: Tuple[float, ...]) -> Tuple[str, int]:
+        return pair[1], pair[0] + len(rest)
+
+    @tool()
+    def nested(self, rows: List[List[float]]) -> Dict[str, List[float]]:
+        return {str(i): row for i, row in enumerate(rows)}
+
+    @tool()
+    def blob(self, data: bytes, span: Span) -> bytes:
+        return data[span.start :]
+
+    @tool()
+    def anything(self, value: Any, mode: Literal["a", "b"]) -> Any:
+        return {"value": value, "mode": mode}
+
+    @tool()
+    def scale(self, values: np.ndarray, factor: float) -> np.ndarray:
+        return values * factor
+
+
+class StateApp(TruffleApp):
+    notes: List[str] = []
+    count: int = 0
+
+
+def test_schema_types():
+    proto = ProtoSchema(SchemaApp.__truffle_tools__.values()).text
+
+    assert "  int64 n = 1;\n  double scale = 2;" in proto
+    assert "  int64 result = 1;" in proto
+    assert "enum Color {\n  COLOR_UNSPECIFIED = 0;\n  COLOR_RED = 1;" in proto
+    assert "  Color color = 2;\n  repeated Point points = 3;" in proto
+    assert "  optional Point center = 4;\n  optional string label = 5;" in proto
+    assert "  map<string, int64> tags = 6;" in proto
+    assert "  google.protobuf.Timestamp created = 7;" in proto
+    assert "  repeated Shape children = 8;" in proto
+    assert "  oneof value {\n    int64 value_int64 = 1;" in proto
+    assert "    Point value_point = 3;" in proto
+    assert "  optional int64 value = 1;" in proto
+    assert "message Int64StringTuple {" in proto
+    assert "  repeated double rest = 2;" in proto
+    assert "  repeated DoubleList rows = 1;" in proto
+    assert "  map<string, DoubleList> result = 1;" in proto
+    assert "  google.protobuf.Duration length = 2;" in proto
+    assert "  google.protobuf.Value value = 1;\n  string mode = 2;" in proto
+    assert "  Tensor values = 1;" in proto
+    assert 'import "google/protobuf/struct.proto";' in proto
+
+    # Every generated schema compiles
+    messages = load_proto_messages(compile_proto(proto))
+    assert "ShapeRequest" not in messages and "growRequest" in messages
+
+
+class BatchError(BaseModel):
+    reason: str
+
+
+class Tensor(BaseModel):
+    rank: int
+
+
+class NameClashApp(TruffleApp):
+    @tool()
+    def fail(self, tensor: Tensor) -> BatchError:
+        return BatchError(reason=str(tensor.rank))
+
+
+def test_generated_names_are_reserved():
+    proto = NameClashApp.__truffle_tools__.proto
+    assert "message BatchError2 {" in proto and "message Tensor2 {" in proto
+    messages = load_proto_messages(compile_proto(proto))
+    assert "BatchError" in messages and "BatchError2" in messages
+
+    # Different messages can never share a name
+    schema = ProtoSchema([])
+    schema._define("Point", "message Point {\n}")
+    with pytest.raises(TypeError, match="'Point'"):
+        schema._define("Point", "message Point {\n  int64 x = 1;\n}")
+
+
+def test_codecs_round_trip():
+    schema = SchemaApp.__truffle_tools__.schema
+    messages = load_proto_messages(compile_proto(schema.text))
+
+    def round_trip(name, **kwargs):
+        codec = schema.codecs[name]
+        request = messages[f"{name}Request"](**codec.request_fields(kwargs))
+        request = type(request).FromString(request.SerializeToString())
+        return codec.arguments(request)
+
+    created = datetime.datetime(2024, 5, 1, 12, 30, 15, 250000)
+    shape = Shape(
+        name="tri",
+        color=Color.GREEN,
+        points=[Point(x=1, y=2)],
+        created=created,
+        children=[Shape(name="dot", color="red", points=[], created=created)],
+    )
+    decoded, factor = round_trip("grow", shape=shape, factor=2.0)
+    assert decoded.color is Color.GREEN and decoded.center is None
+    assert decoded.children[0].color is Color.RED
+    assert decoded.created == created.replace(tzinfo=datetime.timezone.utc)
+
+    assert round_trip("pick", value=True) == (1,)
+    assert round_trip("pick", value="a") == ("a",)
+    assert round_trip("pick", value={"x": 1, "y": 2}) == (Point(x=1, y=2),)
+    assert round_trip("maybe", value=None) == (None,)
+    assert round_trip("maybe", value=0) == (0,)
+    assert round_trip("pair", pair=(1, "a"), rest=(0.5,)) == ((1, "a"), (0.5,))
+    span = Span(start=1, length=datetime.timedelta(microseconds=-1))
+    assert round_trip("blob", data=b"abc", span=span) == (b"abc", span)
+    value = {"a": [1, None, "b"], "c": {"d": True}}
+    assert round_trip("anything", value=value, mode="a") == (
+        {"a": [1.0, None, "b"], "c": {"d": True}},
+        "a",
+    )
+
+
+@pytest.mark.parametrize("runtime", ["thread", "aio"])
+def test_grpc_typed_calls(runtime):
+    app = SchemaApp()
+    port = run_app_in_background(app, "grpc", grpc_runtime=runtime)
+    client = GrpcTestClient(app, port)
+    codecs = SchemaApp.__truffle_tools__.schema.codecs
+
+    def call(name, **kwargs):
+        response = client.call(name, **codecs[name].request_fields(kwargs))
+        return codecs[name].result(response)
+
+    # int64 and double carry values int32 and float could not
+    assert call("count", n=2**40, scale=3.0) == 3 * 2**40
+    shape = Shape(
+        name="tri",
+        color=Color.RED,
+        points=[Point(x=1, y=2)],
+        label="a",
+        tags={"a": 1},
+        created=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+    )
+    grown = call("grow", shape=shape, factor=0.1)
+    assert grown == shape.model_copy(update={"points": [Point(x=0.1, y=0.2)]})
+    assert call("pick", value=Point(x=1, y=2)) == Point(x=1, y=2)
+    assert call("pick", value=7) == 7
+    assert call("maybe", value=None) is None
+    assert call("pair", pair=(2, "b"), rest=[1.0, 2.0]) == ("b", 4)
+    assert call("nested", rows=[[1.0], [2.0, 3.0]]) == {"0": [1.0], "1": [2.0, 3.0]}
+    span = Span(start=2, length=datetime.timedelta(seconds=1))
+    assert call("blob", data=b"abcd", span=span) == b"cd"
+    assert call("anything", value=[1, "x"], mode="b") == {
+        "value": [1.0, "x"],
+        "mode": "b",
+    }
+    values = np.arange(4, dtype=np.float32).reshape(2, 2)
+    result = call("scale", values=values, factor=2.0)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, values * 2)
+
+
+def test_grpc_save_and_load():
+    proto = StateApp.__truffle_tools__.proto
+    assert "message BaseModel" not in proto
+    assert "  StateApp result = 1;" in proto and "  StateApp state = 1;" in proto
+
+    app = StateApp(notes=["a"], count=2)
+    port = run_app_in_background(app, "grpc")
+    client = GrpcTestClient(app, port)
+    codecs = StateApp.__truffle_tools__.schema.codecs
+
+    saved = codecs["save"].result(client.call("save"))
+    assert isinstance(saved, StateApp)
+    assert (saved.notes, saved.count) == (["a"], 2)
+
+    state = StateApp(notes=["b", "c"], count=5)
+    client.call("load", **codecs["load"].request_fields({"state": state}))
+    assert (app.notes, app.count) == (["b", "c"], 5)
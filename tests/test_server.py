@@ -0,0 +1,646 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from typing import AsyncIterator, Iterator, List
+
+import numpy as np
+import pytest
+import requests
+
+from truffle_python_sdk import Client, TruffleApp, tool
+
+
+class StreamingApp(TruffleApp):
+    @tool()
+    def echo(self, message: str) -> str:
+        return message
+
+    @tool()
+    async def echo_async(self, message: str) -> str:
+        return message
+
+    @tool()
+    def count(self, n: int) -> Iterator[str]:
+        for i in range(n):
+            yield str(i)
+
+    @tool()
+    async def count_async(self, n: int) -> AsyncIterator[str]:
+        for i in range(n):
+            yield str(i)
+
+
+class SlowApp(TruffleApp):
+    @tool()
+    def slow(self, seconds: float) -> str:
+        time.sleep(seconds)
+        return "done"
+
+    @tool()
+    async def ping(self) -> str:
+        return "pong"
+
+    @tool()
+    def trickle(self, n: int, seconds: float) -> Iterator[str]:
+        for i in range(n):
+            time.sleep(seconds)
+            yield str(i)
+
+
+# Helper functions
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Server on port {port} did not start")
+
+
+def run_app_in_background(app_instance, mode, **kwargs):
+    port = free_port()
+    client = Client()
+    thread = threading.Thread(
+        target=client.start,
+        kwargs=dict(app=app_instance, mode=mode, host="127.0.0.1", port=port, **kwargs),
+        daemon=True,
+    )
+    thread.start()
+    wait_for_port(port)
+    return port
+
+
+class GrpcTestClient:
+    """Calls tools over gRPC using message classes built from the app schema."""
+
+    def __init__(self, app_instance, port):
+        import grpc
+        from truffle_python_sdk import _proto
+
+        tools = type(app_instance).__truffle_tools__
+        self.messages = _proto.load_proto_messages(_proto.compile_proto(tools.proto))
+        self.streams = {tool.name for tool in tools.values() if tool.stream}
+        self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+
+    def call(self, tool_name, metadata=None, **kwargs):
+        request_class = self.messages[f"{tool_name}Request"]
+        response_class = self.messages[f"{tool_name}Response"]
+        method = (
+            self.channel.unary_stream
+            if tool_name in self.streams
+            else self.channel.unary_unary
+        )
+        rpc = method(
+            f"/truffle.Truffle/{tool_name}",
+            request_serializer=request_class.SerializeToString,
+            response_deserializer=response_class.FromString,
+        )
+        return rpc(request_class(**kwargs), metadata=metadata)
+
+
+# Tool registry
+
+
+def test_tools_are_registered_at_class_creation():
+    registry = StreamingApp.__truffle_tools__
+
+    assert {"echo", "echo_async", "count", "count_async", "save", "load"} <= set(
+        registry
+    )
+    assert registry["echo"].parameters[0].name == "message"
+    assert registry["echo_async"].is_async
+    assert registry["count"].stream
+    assert registry["count"].return_type is str
+    # The proto schema and the result serializers are built once and cached
+    assert registry.proto is registry.proto
+    assert registry["echo"].serializer is registry["echo"].serializer
+    assert registry["echo"].serializer("hi") == "hi"
+
+    class RenamedApp(StreamingApp):
+        @tool(name="shout")
+        def echo(self, message: str) -> str:
+            return message.upper()
+
+    assert "shout" in RenamedApp.__truffle_tools__
+    assert "echo" not in RenamedApp.__truffle_tools__
+    assert "echo" in StreamingApp.__truffle_tools__
+
+
+# Result serializers
+
+
+def test_compiled_serializers():
+    from typing import Any, Dict, List
+
+    import numpy as np
+    from pydantic import BaseModel
+    from truffle_python_sdk._serializers import compile_serializer
+
+    class Point(BaseModel):
+        x: float
+        y: tuple
+
+    assert compile_serializer(float)(1.5) == 1.5
+    assert compile_serializer(float)(np.float32(1.5)) == 1.5
+    assert compile_serializer(List[float])(np.arange(3.0)) == [0.0, 1.0, 2.0]
+    assert compile_serializer(np.ndarray)(np.ones((2, 2))) == [[1.0, 1.0], [1.0, 1.0]]
+    assert compile_serializer(Point)(Point(x=1, y=(2, 3))) == {"x": 1.0, "y": [2, 3]}
+    assert compile_serializer(List[Point])([Point(x=1, y=())]) == [{"x": 1.0, "y": []}]
+    assert compile_serializer(Dict[str, int])({"a": 1}) == {"a": 1}
+    # Results that do not match their annotation fall back to the generic walk
+    assert compile_serializer(Dict[str, int])([1, (2, 3)]) == [1, [2, 3]]
+    assert compile_serializer(Any)({1: (2, 3)}) == {"1": [2, 3]}
+
+
+# REST mode
+
+
+def test_rest_streaming_tool():
+    port = run_app_in_background(StreamingApp(), mode="rest")
+
+    for tool_name in ("count", "count_async"):
+        response = requests.post(
+            f"http://127.0.0.1:{port}/{tool_name}", json={"n": 3}, stream=True
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            line[len("data: ") :]
+            for line in response.iter_lines(decode_unicode=True)
+            if line
+        ]
+        assert events[-1] == "[DONE]"
+        assert [json.loads(event)["result"] for event in events[:-1]] == ["0", "1", "2"]
+
+
+def test_rest_sync_tools_do_not_block_event_loop():
+    from concurrent.futures import ThreadPoolExecutor
+
+    port = run_app_in_background(SlowApp(), mode="rest", max_workers=1, max_queue=0)
+    url = f"http://127.0.0.1:{port}"
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        slow_call = executor.submit(requests.post, f"{url}/slow", json={"seconds": 1})
+        time.sleep(0.2)
+
+        # The async tool is served while the sync tool is still running
+        start = time.monotonic()
+        response = requests.post(f"{url}/ping")
+        assert response.json()["result"] == "pong"
+        assert time.monotonic() - start < 0.5
+
+        # The only worker is busy and the queue is empty, so load is shed
+        response = requests.post(f"{url}/slow", json={"seconds": 0})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+        assert slow_call.result().json()["result"] == "done"
+
+
+def test_streams_count_toward_the_worker_queue():
+    from concurrent.futures import ThreadPoolExecutor
+
+    port = run_app_in_background(SlowApp(), mode="rest", max_workers=1, max_queue=0)
+    url = f"http://127.0.0.1:{port}"
+
+    def read_stream():
+        response = requests.post(
+            f"{url}/trickle", json={"n": 2, "seconds": 0.3}, stream=True
+        )
+        return [line for line in response.iter_lines() if line]
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        stream = executor.submit(read_stream)
+        time.sleep(0.15)
+        # The stream holds the only worker until it ends
+        response = requests.post(f"{url}/trickle", json={"n": 1, "seconds": 0})
+        assert response.status_code == 503
+        assert requests.post(f"{url}/slow", json={"seconds": 0}).status_code == 503
+        assert len(stream.result()) == 3
+
+    assert requests.post(f"{url}/slow", json={"seconds": 0}).json()["result"] == "done"
+
+
+def test_async_tools_stay_async():
+    import asyncio
+    import inspect
+
+    assert inspect.iscoroutinefunction(SlowApp.ping)
+    assert asyncio.run(SlowApp().ping()) == "pong"
+
+
+def test_rest_request_validation_and_numpy_results():
+    class ArrayApp(TruffleApp):
+        @tool()
+        def scale(self, values: List[float], factor: float) -> np.ndarray:
+            return np.asarray(values, dtype=np.float32) * factor
+
+    port = run_app_in_background(ArrayApp(), mode="rest")
+    url = f"http://127.0.0.1:{port}/scale"
+
+    response = requests.post(url, json={"values": [1, 2], "factor": 2})
+    assert response.status_code == 200
+    assert response.json() == {"result": [2.0, 4.0]}
+
+    response = requests.post(url, json={"values": "nope"})
+    assert response.status_code == 422
+    assert {error["loc"][0] for error in response.json()["detail"]} == {
+        "values",
+        "factor",
+    }
+
+
+def test_rest_model_parameters_and_bytes():
+    from pydantic import BaseModel
+    from truffle_python_sdk.responses import dumps
+
+    class Box(BaseModel):
+        width: float
+        height: float
+
+    class BoxApp(TruffleApp):
+        @tool()
+        def area(self, box: Box) -> float:
+            # Nested models arrive as instances, as over gRPC
+            assert isinstance(box, Box)
+            return box.width * box.height
+
+    port = run_app_in_background(BoxApp(), mode="rest")
+    response = requests.post(
+        f"http://127.0.0.1:{port}/area", json={"box": {"width": 2, "height": 3}}
+    )
+    assert response.json() == {"result": 6.0}
+
+    # Raw bytes are base64, as in JSON tensors
+    assert json.loads(dumps({"data": b"\xff\x00"})) == {"data": "/wA="}
+
+
+class TensorApp(TruffleApp):
+    @tool()
+    def scale(self, values: np.ndarray, factor: float) -> np.ndarray:
+        assert not values.flags.writeable  # wrapped, not copied
+        return values * factor
+
+
+def test_rest_tensor_transport():
+    from truffle_python_sdk.tensor import decode_tensor, encode_tensor_base64
+
+    port = run_app_in_background(TensorApp(), mode="rest")
+    url = f"http://127.0.0.1:{port}/scale"
+    values = np.arange(6, dtype=np.float32).reshape(2, 3)
+
+    # base64 tensor in, JSON list out
+    response = requests.post(
+        url, json={"values": encode_tensor_base64(values), "factor": 2}
+    )
+    assert response.status_code == 200
+    assert response.json()["result"] == (values * 2).tolist()
+
+    # raw bytes in and out
+    response = requests.post(
+        url,
+        params={"factor": 2},
+        data=values.tobytes(),
+        headers={
+            "Content-Type": "application/octet-stream",
+            "Accept": "application/octet-stream",
+            "X-Tensor-Dtype": "<f4",
+            "X-Tensor-Shape": "2,3",
+        },
+    )
+    assert response.status_code == 200
+    result = decode_tensor(
+        {
+            "data": response.content,
+            "dtype": response.headers["X-Tensor-Dtype"],
+            "shape": response.headers["X-Tensor-Shape"].split(","),
+        }
+    )
+    np.testing.assert_array_equal(result, values * 2)
+
+
+# gRPC mode
+
+
+def test_proto_descriptors_are_cached(tmp_path, monkeypatch):
+    from truffle_python_sdk import _proto
+
+    monkeypatch.setenv("TRUFFLE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(_proto, "_descriptor_sets", {})
+    proto = _proto.build_proto(Client()._get_tools(StreamingApp()))
+
+    descriptor_set = _proto.compile_proto(proto)
+    assert len(list(tmp_path.glob("*.pb"))) == 1
+
+    # A warm start reads the cached descriptors instead of running protoc
+    monkeypatch.setattr(_proto, "_descriptor_sets", {})
+    monkeypatch.setattr(_proto, "_run_protoc", None)
+    assert _proto.compile_proto(proto) == descriptor_set
+
+    messages = _proto.load_proto_messages(descriptor_set)
+    assert messages["echoRequest"](message="hi").message == "hi"
+
+
+def test_broken_proto_cache_entries_are_replaced(tmp_path, monkeypatch):
+    import os
+
+    from truffle_python_sdk import _proto
+
+    monkeypatch.setenv("TRUFFLE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(_proto, "_descriptor_sets", {})
+    proto = StreamingApp.__truffle_tools__.proto
+
+    # A failed write leaves no temporary file behind
+    def fail(*args):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "replace", fail)
+        descriptor_set = _proto.compile_proto(proto)
+    assert list(tmp_path.iterdir()) == []
+
+    # A truncated cache entry is compiled again and overwritten
+    monkeypatch.setattr(_proto, "_descriptor_sets", {})
+    _proto.compile_proto(proto)
+    (cached,) = tmp_path.glob("*.pb")
+    cached.write_bytes(descriptor_set[: len(descriptor_set) // 2])
+    monkeypatch.setattr(_proto, "_descriptor_sets", {})
+    assert _proto.compile_proto(proto) == descriptor_set
+    assert cached.read_bytes() == descriptor_set
+
+
+def test_grpc_streaming_tool():
+    app = StreamingApp()
+    port = run_app_in_background(app, mode="grpc")
+    client = GrpcTestClient(app, port)
+
+    assert client.call("echo", message="hi").result == "hi"
+    assert client.call("echo_async", message="hi").result == "hi"
+
+    for tool_name in ("count", "count_async"):
+        chunks = [response.result for response in client.call(tool_name, n=3)]
+        assert chunks == ["0", "1", "2"]
+
+
+def test_grpc_tensor_transport():
+    from truffle_python_sdk.tensor import decode_tensor, encode_tensor
+
+    app = TensorApp()
+    port = run_app_in_background(app, mode="grpc")
+    client = GrpcTestClient(app, port)
+
+    values = np.arange(6, dtype=np.float64).reshape(3, 2)
+    response = client.call("scale", values=encode_tensor(values), factor=0.5)
+    result = decode_tensor(response.result)
+    assert result.dtype == np.float64
+    np.testing.assert_array_equal(result, values * 0.5)
+
+
+def test_grpc_aio_runtime():
+    app = StreamingApp()
+    port = run_app_in_background(app, mode="grpc", grpc_runtime="aio")
+    client = GrpcTestClient(app, port)
+
+    assert client.call("echo", message="hi").result == "hi"
+    assert client.call("echo_async", message="hi").result == "hi"
+
+    for tool_name in ("count", "count_async"):
+        chunks = [response.result for response in client.call(tool_name, n=3)]
+        assert chunks == ["0", "1", "2"]
+
+
+def test_grpc_aio_sync_tools_do_not_block_event_loop():
+    import grpc
+
+    app = SlowApp()
+    port = run_app_in_background(
+        app, mode="grpc", grpc_runtime="aio", max_workers=1, max_queue=0
+    )
+    client = GrpcTestClient(app, port)
+
+    slow = client.channel.unary_unary(
+        "/truffle.Truffle/slow",
+        request_serializer=client.messages["slowRequest"].SerializeToString,
+        response_deserializer=client.messages["slowResponse"].FromString,
+    ).future(client.messages["slowRequest"](seconds=0.5))
+    time.sleep(0.1)
+
+    # Async tools still run while the only worker is busy...
+    start = time.perf_counter()
+    assert client.call("ping").result == "pong"
+    assert time.perf_counter() - start < 0.3
+    # ...and further synchronous calls are shed instead of queueing
+    try:
+        client.call("slow", seconds=0.0)
+        raise AssertionError("Expected RESOURCE_EXHAUSTED")
+    except grpc.RpcError as e:
+        assert e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert slow.result().result == "done"
+
+    # Streams of synchronous generators take a worker too
+    trickle = client.call("trickle", n=2, seconds=0.3)
+    assert next(trickle).result == "0"
+    try:
+        list(client.call("trickle", n=1, seconds=0.0))
+        raise AssertionError("Expected RESOURCE_EXHAUSTED")
+    except grpc.RpcError as e:
+        assert e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert [chunk.result for chunk in trickle] == ["1"]
+
+
+def test_grpc_thread_runtime_honours_the_queue():
+    import grpc
+
+    app = SlowApp()
+    port = run_app_in_background(app, mode="grpc", max_workers=1, max_queue=1)
+    client = GrpcTestClient(app, port)
+
+    slow = client.channel.unary_unary(
+        "/truffle.Truffle/slow",
+        request_serializer=client.messages["slowRequest"].SerializeToString,
+        response_deserializer=client.messages["slowResponse"].FromString,
+    )
+    running = [slow.future(client.messages["slowRequest"](seconds=0.5))]
+    time.sleep(0.1)
+    running.append(slow.future(client.messages["slowRequest"](seconds=0.0)))
+    time.sleep(0.1)
+    # One call runs and one waits; the next is shed
+    try:
+        client.call("slow", seconds=0.0)
+        raise AssertionError("Expected RESOURCE_EXHAUSTED")
+    except grpc.RpcError as e:
+        assert e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+    assert [future.result().result for future in running] == ["done", "done"]
+
+    with pytest.raises(ValueError, match="aio"):
+        Client().start(app, mode="grpc", executor="process")
+
+
+def test_grpc_server_options():
+    import grpc
+    from truffle_python_sdk.tensor import decode_tensor, encode_tensor
+
+    app = TensorApp()
+    port = run_app_in_background(
+        app,
+        mode="grpc",
+        max_receive_message_size=64 * 1024,
+        compression="gzip",
+        keepalive_time=30.0,
+    )
+    client = GrpcTestClient(app, port)
+
+    values = np.zeros(1024)
+    response = client.call("scale", values=encode_tensor(values), factor=2.0)
+    np.testing.assert_array_equal(decode_tensor(response.result), values)
+
+    try:
+        client.call("scale", values=encode_tensor(np.zeros(16 * 1024)), factor=2.0)
+        raise AssertionError("Expected RESOURCE_EXHAUSTED")
+    except grpc.RpcError as e:
+        assert e.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+
+
+def test_grpc_handlers_bind_arguments_once():
+    from truffle_python_sdk import _grpc_server, _proto
+
+    seen = []
+
+    class BindingApp(TruffleApp):
+        @tool()
+        def total(self, values: List[float], *, scale: float) -> float:
+            seen.append(values)
+            return sum(values) * scale
+
+        @tool()
+        async def scaled(self, values: np.ndarray, factor: float) -> np.ndarray:
+            return values * factor
+
+    app = BindingApp()
+    tools = type(app).__truffle_tools__
+    messages = _proto.load_proto_messages(_proto.compile_proto(tools.proto))
+    handlers = _grpc_server.build_grpc_handlers(tools, messages, app)
+
+    request = messages["totalRequest"](values=[1.0, 2.0], scale=2.0)
+    assert handlers["total"].unary_unary(request, None).result == 6.0
+    # Repeated fields are passed on without being copied into a list
+    assert type(seen[0]) is type(request.values)
+
+    from truffle_python_sdk.tensor import decode_tensor, encode_tensor
+
+    request = messages["scaledRequest"](
+        values=encode_tensor(np.arange(3.0)), factor=2.0
+    )
+    response = handlers["scaled"].unary_unary(request, None)
+    np.testing.assert_array_equal(decode_tensor(response.result), [0.0, 2.0, 4.0])
+
+
+class BatchApp(TruffleApp):
+    @tool()
+    def add(self, a: float, b: float) -> float:
+        return a + b
+
+    @tool()
+    async def nap(self, seconds: float) -> str:
+        await asyncio.sleep(seconds)
+        return "rested"
+
+    @tool()
+    def slow(self, seconds: float) -> str:
+        time.sleep(seconds)
+        return "done"
+
+    @tool()
+    def fail(self) -> str:
+        raise RuntimeError("boom")
+
+    @tool()
+    def count(self, n: int) -> Iterator[str]:
+        yield from map(str, range(n))
+
+
+def test_rest_batch():
+    port = run_app_in_background(BatchApp(), mode="rest")
+    url = f"http://127.0.0.1:{port}/_batch"
+
+    calls = [{"tool": "add", "args": {"a": i, "b": 1}} for i in range(20)]
+    results = requests.post(url, json=calls).json()["results"]
+    assert [item["result"] for item in results] == [i + 1.0 for i in range(20)]
+
+    calls = [
+        {"tool": "fail"},
+        {"tool": "add", "args": {"a": "x"}},
+        {"tool": "missing"},
+        {"tool": "count", "args": {"n": 2}},
+        {"tool": "add", "args": {"a": 1, "b": 2}},
+    ]
+    results = requests.post(url, json=calls).json()["results"]
+    assert results[0]["error"] == {"status": 500, "detail": "RuntimeError: boom"}
+    assert [item["error"]["status"] for item in results[1:4]] == [422, 404, 400]
+    assert results[4] == {"result": 3.0}
+
+    # Independent calls run concurrently
+    start = time.perf_counter()
+    calls = [{"tool": "slow", "args": {"seconds": 0.3}}] * 4
+    calls += [{"tool": "nap", "args": {"seconds": 0.3}}] * 4
+    results = requests.post(url, json=calls).json()["results"]
+    assert time.perf_counter() - start < 0.9
+    assert [item["result"] for item in results] == ["done"] * 4 + ["rested"] * 4
+
+    assert requests.post(url, json={"tool": "add"}).status_code == 400
+
+
+def test_batches_larger_than_the_worker_queue():
+    app = BatchApp()
+    limits = dict(max_workers=2, max_queue=2)
+    calls = [{"tool": "slow", "args": {"seconds": 0.01}}] * 50
+    port = run_app_in_background(app, mode="rest", **limits)
+    response = requests.post(f"http://127.0.0.1:{port}/_batch", json=calls)
+    assert [item.get("result") for item in response.json()["results"]] == ["done"] * 50
+
+    port = run_app_in_background(app, mode="grpc", grpc_runtime="aio", **limits)
+    client = GrpcTestClient(app, port)
+    slow = client.messages["BatchCall"](
+        slow=client.messages["slowRequest"](seconds=0.01)
+    )
+    results = client.call("Batch", calls=[slow] * 50).results
+    assert [result.slow.result for result in results] == ["done"] * 50
+
+
+@pytest.mark.parametrize("runtime", ["thread", "aio"])
+def test_grpc_batch(runtime):
+    app = BatchApp()
+    port = run_app_in_background(app, mode="grpc", grpc_runtime=runtime)
+    client = GrpcTestClient(app, port)
+    call = client.messages["BatchCall"]
+
+    calls = [call(add=client.messages["addRequest"](a=i, b=1)) for i in range(20)]
+    calls += [call(fail=client.messages["failRequest"]()), call()]
+    results = client.call("Batch", calls=calls).results
+    assert [result.add.result for result in results[:20]] == [
+        i + 1.0 for i in range(20)
+    ]
+    assert results[20].error.code == "INTERNAL"
+    assert results[20].error.message == "RuntimeError: boom"
+    assert results[21].error.code == "INVALID_ARGUMENT"
+
+    start = time.perf_counter()
+    calls = [call(slow=client.messages["slowRequest"](seconds=0.3))] * 4
+    calls += [call(nap=client.messages["napRequest"](seconds=0.3))] * 4
+    results = client.call("Batch", calls=calls).results
+    assert time.perf_counter() - start < 0.9
+    assert [result.WhichOneof("result") for result in results] == ["slow"] * 4 + [
+        "nap"
+    ] * 4
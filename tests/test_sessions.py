@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+import requests
+
+from truffle_python_sdk import TruffleApp, tool
+from truffle_python_sdk.sessions import SessionPool, estimate_size
+from tests.test_server import GrpcTestClient, run_app_in_background
+
+
+class NotesApp(TruffleApp):
+    notes: List[str] = []
+
+    @tool()
+    def add(self, note: str) -> int:
+        notes = list(self.notes)
+        # Widen the window for lost updates if calls were not serialised
+        time.sleep(0.001)
+        self.notes = notes + [note]
+        return len(self.notes)
+
+    @tool()
+    def replay(self) -> Iterator[str]:
+        for note in self.notes:
+            yield note
+
+
+def test_sessions_are_isolated_copies():
+    app = NotesApp()
+    pool = SessionPool(app)
+    with pool.session("alice") as alice:
+        alice.add(note="hello")
+    with pool.session("bob") as bob:
+        assert bob.notes == []
+    with pool.session("alice") as alice:
+        assert alice.notes == ["hello"]
+    assert app.notes == []
+
+
+def test_calls_within_a_session_are_serialised():
+    pool = SessionPool(NotesApp())
+
+    def add_notes():
+        for i in range(20):
+            with pool.session("shared") as app:
+                app.add(note=str(i))
+
+    threads = [threading.Thread(target=add_notes) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with pool.session("shared") as app:
+        assert len(app.notes) == 80
+
+
+def test_threads_and_coroutines_share_the_session_lock():
+    pool = SessionPool(NotesApp())
+
+    def add_notes():
+        for i in range(20):
+            with pool.session("shared") as app:
+                app.add(note=str(i))
+
+    async def aadd_notes():
+        for i in range(20):
+            async with pool.asession("shared") as app:
+                app.add(note=str(i))
+
+    async def main():
+        await asyncio.gather(
+            asyncio.to_thread(add_notes), asyncio.to_thread(add_notes), aadd_notes()
+        )
+
+    asyncio.run(main())
+    with pool.session("shared") as app:
+        assert len(app.notes) == 60
+
+
+def test_sizes_are_estimated_every_few_calls(monkeypatch):
+    from truffle_python_sdk import sessions
+
+    estimates = []
+    monkeypatch.setattr(
+        sessions, "estimate_size", lambda app: estimates.append(app) or 100
+    )
+    pool = SessionPool(NotesApp(), max_memory=10_000, measure_every=4)
+    for _ in range(9):
+        with pool.session("a"):
+            pass
+    # The first call, then every fourth
+    assert len(estimates) == 3
+    assert pool.memory == 100
+
+
+def test_lru_ttl_and_memory_eviction():
+    pool = SessionPool(NotesApp(), max_sessions=2)
+    for name in ("a", "b", "a", "c"):
+        with pool.session(name):
+            pass
+    # "b" was the least recently used
+    assert "b" not in pool
+    assert "a" in pool and "c" in pool
+
+    pool = SessionPool(NotesApp(), ttl=0.05)
+    with pool.session("a"):
+        pass
+    time.sleep(0.1)
+    pool.evict_expired()
+    assert len(pool) == 0
+
+    # Expired sessions are also swept without any further calls
+    pool = SessionPool(NotesApp(), ttl=0.05)
+    with pool.session("a"):
+        pass
+    time.sleep(0.3)
+    assert len(pool) == 0
+    pool.close()
+
+    size = estimate_size(NotesApp(notes=["x" * 1000]))
+    pool = SessionPool(NotesApp(), max_memory=int(2.5 * size))
+    for name in ("a", "b", "c", "d"):
+        with pool.session(name) as app:
+            app.notes = ["x" * 1000]
+    assert len(pool) == 2
+    assert pool.memory <= 2.5 * size
+
+
+def test_evicted_sessions_spill_to_snapshots(tmp_path):
+    pytest.importorskip("msgpack")
+    pool = SessionPool(NotesApp(), max_sessions=1, spill_dir=str(tmp_path))
+    with pool.session("alice") as app:
+        app.add(note="remember me")
+    with pool.session("bob"):
+        pass
+    assert "alice" not in pool
+
+    with pool.session("alice") as app:
+        assert app.notes == ["remember me"]
+
+
+def test_spilling_does_not_block_other_sessions(tmp_path, monkeypatch):
+    pytest.importorskip("msgpack")
+    from truffle_python_sdk.snapshot import Snapshotter
+
+    checkpoint = Snapshotter.checkpoint
+    spilling = threading.Event()
+
+    def slow_checkpoint(self, *args, **kwargs):
+        spilling.set()
+        time.sleep(0.5)
+        return checkpoint(self, *args, **kwargs)
+
+    monkeypatch.setattr(Snapshotter, "checkpoint", slow_checkpoint)
+    pool = SessionPool(NotesApp(), max_sessions=1, spill_dir=str(tmp_path))
+    with pool.session("alice") as app:
+        app.add(note="remember me")
+
+    def evict_alice():
+        with pool.session("bob"):
+            pass
+
+    thread = threading.Thread(target=evict_alice)
+    thread.start()
+    assert spilling.wait(5)
+    # "bob" is usable while "alice" is being written out
+    started = time.monotonic()
+    with pool.session("bob") as app:
+        app.add(note="hi")
+    assert time.monotonic() - started < 0.25
+    # Restoring "alice" waits for its snapshot to be complete
+    with pool.session("alice") as app:
+        assert app.notes == ["remember me"]
+    thread.join()
+
+
+def test_rest_sessions():
+    app = NotesApp()
+    port = run_app_in_background(app, mode="rest", sessions=True)
+    url = f"http://127.0.0.1:{port}"
+
+    for session in ("alice", "bob"):
+        for i in range(3):
+            response = requests.post(
+                f"{url}/add",
+                json={"note": f"{session} {i}"},
+                headers={"X-Truffle-Session": session},
+            )
+            assert response.json()["result"] == i + 1
+
+    response = requests.post(
+        f"{url}/replay", headers={"X-Truffle-Session": "bob"}, stream=True
+    )
+    events = [line for line in response.iter_lines() if line.startswith(b"data:")]
+    assert events[0] == b'data: {"result":"bob 0"}'
+    assert len(events) == 4
+
+    # Calls without a session use the app itself
+    requests.post(f"{url}/add", json={"note": "global"})
+    assert app.notes == ["global"]
+
+
+@pytest.mark.parametrize("runtime", ["thread", "aio"])
+def test_grpc_sessions(runtime):
+    app = NotesApp()
+    port = run_app_in_background(app, mode="grpc", sessions=True, grpc_runtime=runtime)
+    client = GrpcTestClient(app, port)
+
+    alice = (("x-truffle-session", "alice"),)
+    assert client.call("add", note="a", metadata=alice).result == 1
+    assert client.call("add", note="b", metadata=alice).result == 2
+    assert client.call("add", note="c").result == 1
+    assert [chunk.result for chunk in client.call("replay", metadata=alice)] == [
+        "a",
+        "b",
+    ]
+    assert app.notes == ["c"]
@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+import pytest
+from pydantic import ConfigDict, Field
+
+pytest.importorskip("msgpack")
+
+from truffle_python_sdk import TruffleApp, tool
+from truffle_python_sdk.snapshot import Snapshotter, decode, encode
+from truffle_python_sdk.vector_store import VectorStore
+
+
+class StatefulApp(TruffleApp):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    conversation: List[Dict[str, str]] = []
+    counter: int = 0
+    weights: np.ndarray = Field(default_factory=lambda: np.zeros(4, np.float32))
+    knowledge_base: VectorStore = Field(default_factory=VectorStore)
+
+    @tool()
+    def chat(self, message: str) -> int:
+        self.conversation.append({"role": "user", "message": message})
+        self.counter += 1
+        return self.counter
+
+
+def test_encode_keeps_arrays_out_of_band():
+    array = np.arange(1000, dtype=np.float64).reshape(10, 100)
+    data = encode({"array": array, "nested": [{"x": np.float32(1.5)}]})
+    # The array is stored as raw bytes rather than as msgpack numbers
+    assert array.tobytes() in data
+
+    values = decode(data)
+    assert values["nested"] == [{"x": 1.5}]
+    assert values["array"].dtype == np.float64
+    assert np.array_equal(values["array"], array)
+
+
+def test_checkpoints_are_incremental(tmp_path):
+    app = StatefulApp()
+    snapshotter = Snapshotter(app, tmp_path)
+    assert sorted(snapshotter.checkpoint()) == sorted(StatefulApp.model_fields)
+    assert snapshotter.checkpoint() == []
+
+    app.chat(message="hello")
+    assert sorted(snapshotter.checkpoint()) == ["conversation", "counter"]
+    app.knowledge_base.add([1.0, 0.0], "x axis")
+    assert snapshotter.checkpoint() == ["knowledge_base"]
+
+    restored = StatefulApp()
+    assert Snapshotter(restored, tmp_path).restore()
+    assert restored.conversation == [{"role": "user", "message": "hello"}]
+    assert restored.counter == 1
+    assert restored.knowledge_base.search([1.0, 0.1], k=1)[0].text == "x axis"
+    # Restored arrays are writable
+    restored.weights[0] = 1.0
+
+    # Only checkpoints holding the latest value of some field are kept
+    files = sorted(f for f in os.listdir(tmp_path) if f.endswith(".snapshot"))
+    assert len(files) == 3
+
+
+def test_restore_without_snapshot(tmp_path):
+    assert not Snapshotter(StatefulApp(), tmp_path).restore()
+
+
+def test_background_checkpoints(tmp_path):
+    app = StatefulApp()
+    snapshotter = Snapshotter(app, tmp_path)
+    snapshotter.start(interval=0.05)
+    app.chat(message="hello")
+
+    deadline = time.monotonic() + 5
+    while not os.path.exists(tmp_path / "MANIFEST"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    app.chat(message="bye")
+    # Stopping writes a final checkpoint
+    snapshotter.stop()
+    restored = StatefulApp()
+    Snapshotter(restored, tmp_path).restore()
+    assert restored.counter == 2
+    # No temporary files are left behind
+    assert not [f for f in os.listdir(tmp_path) if f.startswith(".tmp")]
+
+
+def test_checkpoints_read_fields_under_the_state_lock(tmp_path):
+    app = StatefulApp()
+    snapshotter = Snapshotter(app, tmp_path)
+    snapshotter.checkpoint()
+
+    written = []
+    with app.state_lock:
+        app.counter = 1
+        thread = threading.Thread(
+            target=lambda: written.extend(snapshotter.checkpoint())
+        )
+        thread.start()
+        thread.join(0.2)
+        # The checkpoint waits rather than seeing half of the update
+        assert thread.is_alive()
+        app.conversation = [{"role": "user", "message": "hi"}]
+    thread.join()
+    assert sorted(written) == ["conversation", "counter"]
+
+    # Copies get a lock of their own
+    copy = app.model_copy(deep=True)
+    assert copy.state_lock is not app.state_lock
+
+
+def test_restore_removes_crash_leftovers(tmp_path):
+    app = StatefulApp(counter=3)
+    Snapshotter(app, tmp_path).checkpoint()
+    (tmp_path / ".tmp-abc").write_bytes(b"partial")
+    (tmp_path / "00000099.snapshot").write_bytes(b"unreferenced")
+
+    restored = StatefulApp()
+    assert Snapshotter(restored, tmp_path).restore()
+    assert restored.counter == 3
+    assert sorted(os.listdir(tmp_path)) == ["00000001.snapshot", "MANIFEST"]
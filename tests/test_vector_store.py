@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from pydantic import Field
+
+from truffle_python_sdk import TruffleApp, tool
+from truffle_python_sdk.vector_store import VectorStore, top_k
+
+
+def brute_force(vectors, query, k):
+    # Reference implementation: the per-document loop the store replaces
+    scores = [
+        np.dot(query, vector) / (np.linalg.norm(query) * np.linalg.norm(vector))
+        for vector in vectors
+    ]
+    return sorted(range(len(vectors)), key=lambda i: -scores[i])[:k]
+
+
+def test_search_matches_brute_force():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16))
+    store = VectorStore(capacity=4)
+    store.add_many(vectors, [f"doc {i}" for i in range(500)])
+
+    assert len(store) == 500
+    assert store.vectors.dtype == np.float32
+    assert store.vectors.flags["C_CONTIGUOUS"]
+    # Rows are stored normalised
+    assert np.allclose(np.linalg.norm(store.vectors, axis=1), 1.0, atol=1e-5)
+
+    for query in rng.normal(size=(5, 16)):
+        results = store.search(query, k=5)
+        assert [r.index for r in results] == brute_force(vectors, query, 5)
+        assert [r.text for r in results] == [f"doc {r.index}" for r in results]
+        scores = [r.score for r in results]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_add_grows_and_search_many():
+    store = VectorStore(dim=2, capacity=1)
+    for i in range(10):
+        assert store.add([1.0, float(i)], f"doc {i}", {"i": i}) == i
+    assert store._matrix.shape[0] >= 10
+
+    [first], [second] = store.search_many([[0.0, 1.0], [1.0, 0.0]], k=1)
+    assert first.text == "doc 9"
+    assert second.text == "doc 0"
+    assert second.metadata == {"i": 0}
+
+    # k larger than the store returns everything
+    assert len(store.search([1.0, 1.0], k=50)) == 10
+    assert VectorStore().search([1.0, 0.0]) == []
+
+    with pytest.raises(ValueError):
+        store.add([1.0, 2.0, 3.0], "wrong dimension")
+
+
+def test_top_k():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7], [0.4, 0.3, 0.2, 0.1]])
+    assert top_k(scores, 2).tolist() == [[1, 3], [0, 1]]
+    assert top_k(scores, 10).tolist() == [[1, 3, 2, 0], [0, 1, 2, 3]]
+
+
+class KnowledgeApp(TruffleApp):
+    knowledge_base: VectorStore = Field(default_factory=VectorStore)
+
+    @tool()
+    def add(self, vector: list, text: str) -> int:
+        return self.knowledge_base.add(vector, text)
+
+
+def test_vector_store_as_app_field():
+    app = KnowledgeApp()
+    app.add(vector=[1.0, 0.0], text="x axis")
+    app.add(vector=[0.0, 2.0], text="y axis")
+    # Each instance gets its own store
+    assert len(KnowledgeApp().knowledge_base) == 0
+
+    data = app.model_dump(mode="json")
+    assert data["knowledge_base"]["texts"] == ["x axis", "y axis"]
+    assert data["knowledge_base"]["vectors"] == [[1.0, 0.0], [0.0, 1.0]]
+
+    restored = KnowledgeApp.model_validate_json(app.model_dump_json())
+    assert restored.knowledge_base.search([0.1, 1.0], k=1)[0].text == "y axis"
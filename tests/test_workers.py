@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+from typing import Iterator
+
+import requests
+
+from truffle_python_sdk import Client, TruffleApp, tool
+from truffle_python_sdk._workers import shard_for
+from tests.test_server import GrpcTestClient, free_port, wait_for_port
+
+
+class PidApp(TruffleApp):
+    calls: int = 0
+
+    @tool()
+    def pid(self) -> int:
+        self.calls += 1
+        return os.getpid()
+
+    @tool()
+    def count(self) -> int:
+        # Per-worker state: only consistent when calls stick to one worker
+        self.calls += 1
+        return self.calls
+
+    @tool()
+    def pids(self, n: int) -> Iterator[int]:
+        for _ in range(n):
+            yield os.getpid()
+
+
+def _serve(mode, port, workers, state_policy):
+    Client().start(
+        PidApp(),
+        mode=mode,
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+        workers=workers,
+        state_policy=state_policy,
+    )
+
+
+def start_workers(mode, workers=2, state_policy="replicated"):
+    port = free_port()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(mode, port, workers, state_policy)
+    )
+    process.start()
+    wait_for_port(port)
+    return process, port
+
+
+def stop_workers(process):
+    process.terminate()
+    process.join(timeout=10)
+    assert process.exitcode is not None
+
+
+def test_shard_for_is_stable():
+    assert shard_for("session-1", 4) == shard_for("session-1", 4)
+    assert {shard_for(f"session-{i}", 4) for i in range(100)} == {0, 1, 2, 3}
+
+
+def test_rest_workers_share_the_port():
+    process, port = start_workers("rest", workers=2)
+    try:
+        pids = set()
+        for _ in range(40):
+            # A new connection per request lets the kernel pick a worker
+            response = requests.post(
+                f"http://127.0.0.1:{port}/pid", headers={"Connection": "close"}
+            )
+            assert response.status_code == 200
+            pids.add(response.json()["result"])
+        assert len(pids) == 2
+        assert process.pid not in pids
+    finally:
+        stop_workers(process)
+
+
+def test_rest_sharded_sessions_stick_to_one_worker():
+    process, port = start_workers("rest", workers=2, state_policy="sharded")
+    try:
+        for session in ("alice", "bob", "carol"):
+            counts = []
+            for _ in range(6):
+                response = requests.post(
+                    f"http://127.0.0.1:{port}/count",
+                    headers={"X-Truffle-Session": session, "Connection": "close"},
+                )
+                assert response.status_code == 200
+                counts.append(response.json()["result"])
+            # Every call of the session reached the same copy of the app
+            assert counts == sorted(counts)
+            assert len(set(counts)) == 6
+
+        # Streaming responses are relayed from the owning worker
+        response = requests.post(
+            f"http://127.0.0.1:{port}/pids",
+            json={"n": 3},
+            headers={"X-Truffle-Session": "alice"},
+        )
+        events = [
+            line for line in response.text.splitlines() if line.startswith("data:")
+        ]
+        assert events[-1] == "data: [DONE]"
+        assert len(events) == 4
+    finally:
+        stop_workers(process)
+
+
+def test_grpc_sharded_sessions_stick_to_one_worker():
+    process, port = start_workers("grpc", workers=2, state_policy="sharded")
+    try:
+        client = GrpcTestClient(PidApp(), port)
+        for session in ("alice", "bob"):
+            metadata = (("x-truffle-session", session),)
+            pids = set()
+            for _ in range(5):
+                response = client.call("pid", metadata=metadata)
+                pids.add(response.result)
+            assert len(pids) == 1
+            streamed = {
+                chunk.result for chunk in client.call("pids", n=3, metadata=metadata)
+            }
+            assert streamed == pids
+    finally:
+        stop_workers(process)
@@ -1,5 +1,20 @@
 from truffle_python_sdk.app import TruffleApp
 from truffle_python_sdk.utils import tool
-from truffle_python_sdk.client import Client
 
-__all__ = ["TruffleApp", "tool", "Client"]
+__all__ = ["TruffleApp", "tool", "Client", "AsyncClient"]
+
+# Imported on first use, so that importing an app does not import the clients
+_LAZY = {
+    "Client": "truffle_python_sdk.client",
+    "AsyncClient": "truffle_python_sdk.async_client",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(_LAZY[name]), name)
+    globals()[name] = value
+    return value
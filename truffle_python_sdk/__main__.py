@@ -6,6 +6,19 @@ from truffle_python_sdk.client import Client
 from truffle_python_sdk.app import TruffleApp
 
 
+def load_app(module_name: str) -> TruffleApp:
+    """
+    Import ``module_name`` (a module name or a path to a ``.py`` file) and
+    return the first ``TruffleApp`` instance defined in it.
+    """
+    module_name = module_name.replace(".py", "").replace("/", ".").replace("\\", ".")
+    app_module = importlib.import_module(module_name)
+    for name, obj in inspect.getmembers(app_module):
+        if isinstance(obj, TruffleApp):
+            return obj
+    raise LookupError(f"No instance of TruffleApp found in module '{module_name}'.")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Truffle CLI - Run your Truffle applications."
@@ -25,6 +38,21 @@ def main():
     parser_run_rest.add_argument(
         "--reload", action="store_true", help="Enable auto-reload"
     )
+    parser_run_rest.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Worker pool used for synchronous tools",
+    )
+    parser_run_rest.add_argument(
+        "--max-workers", type=int, default=None, help="Size of the worker pool"
+    )
+    parser_run_rest.add_argument(
+        "--max-queue",
+        type=int,
+        default=100,
+        help="Calls allowed to wait for a worker before responding 503",
+    )
 
     # Sub-command for running the app in gRPC mode
     parser_run_grpc = subparsers.add_parser("run:grpc", help="Run the app in gRPC mode")
@@ -36,6 +64,145 @@ def main():
     parser_run_grpc.add_argument(
         "--log-level", type=str, default="info", help="Logging level"
     )
+    parser_run_grpc.add_argument(
+        "--runtime",
+        choices=["thread", "aio"],
+        default="thread",
+        help="Serve from a thread pool, or from an asyncio event loop",
+    )
+    parser_run_grpc.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Worker pool used for synchronous tools (process needs --runtime aio)",
+    )
+    parser_run_grpc.add_argument(
+        "--max-workers",
+        type=int,
+        default=None,
+        help="Size of the thread pool (default 10) or worker pool",
+    )
+    parser_run_grpc.add_argument(
+        "--max-queue",
+        type=int,
+        default=100,
+        help="Calls allowed to wait for a worker before RESOURCE_EXHAUSTED",
+    )
+    parser_run_grpc.add_argument(
+        "--max-concurrent-rpcs",
+        type=int,
+        default=None,
+        help="Calls handled at once before rejecting with RESOURCE_EXHAUSTED",
+    )
+    parser_run_grpc.add_argument(
+        "--max-send-message-size",
+        type=int,
+        default=None,
+        help="Largest response in bytes (-1 for no limit)",
+    )
+    parser_run_grpc.add_argument(
+        "--max-receive-message-size",
+        type=int,
+        default=None,
+        help="Largest request in bytes (default 4 MB, -1 for no limit)",
+    )
+    parser_run_grpc.add_argument(
+        "--compression",
+        choices=["gzip", "deflate"],
+        default=None,
+        help="Compress responses",
+    )
+    parser_run_grpc.add_argument(
+        "--keepalive-time",
+        type=float,
+        default=None,
+        help="Seconds between keepalive pings on idle connections",
+    )
+    parser_run_grpc.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=None,
+        help="Seconds to wait for a keepalive ping to be answered",
+    )
+
+    for run_parser in (parser_run_rest, parser_run_grpc):
+        run_parser.add_argument(
+            "--snapshot-dir",
+            type=str,
+            default=None,
+            help="Directory to restore and checkpoint the app state in",
+        )
+        run_parser.add_argument(
+            "--snapshot-interval",
+            type=float,
+            default=30.0,
+            help="Seconds between background checkpoints",
+        )
+
+        run_parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes sharing the port",
+        )
+        run_parser.add_argument(
+            "--state-policy",
+            choices=["replicated", "sharded"],
+            default="replicated",
+            help="How app state is split between workers",
+        )
+        run_parser.add_argument(
+            "--sessions",
+            action="store_true",
+            help="Give each X-Truffle-Session its own copy of the app",
+        )
+        run_parser.add_argument(
+            "--max-sessions",
+            type=int,
+            default=1024,
+            help="Sessions kept in memory before the least recent is evicted",
+        )
+        run_parser.add_argument(
+            "--session-ttl",
+            type=float,
+            default=3600.0,
+            help="Seconds after which an unused session is evicted",
+        )
+        run_parser.add_argument(
+            "--session-max-memory",
+            type=int,
+            default=None,
+            help="Estimated bytes of session state kept in memory",
+        )
+        run_parser.add_argument(
+            "--session-spill-dir",
+            type=str,
+            default=None,
+            help="Directory where evicted sessions are snapshotted",
+        )
+        run_parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Profile calls sent with an X-Truffle-Profile header",
+        )
+        run_parser.add_argument(
+            "--profile-rate",
+            type=float,
+            default=0.0,
+            help="Fraction of calls to profile (implies --profile)",
+        )
+        run_parser.add_argument(
+            "--profile-kind",
+            choices=["cpu", "memory"],
+            default="cpu",
+            help="Profiler used for sampled calls",
+        )
+        run_parser.add_argument(
+            "--profile-capacity",
+            type=int,
+            default=100,
+            help="Number of recent profiles kept",
+        )
 
     # Sub-command for generating the .proto files
     parser_proto = subparsers.add_parser(
@@ -44,6 +211,73 @@ def main():
     parser_proto.add_argument(
         "module", help="The application module to generate .proto files from"
     )
+    parser_proto.add_argument(
+        "--output", type=str, default="truffle.proto", help="Path of the .proto file"
+    )
+    parser_proto.add_argument(
+        "--python-out",
+        type=str,
+        default=None,
+        help="Also compile Python client stubs into this directory",
+    )
+
+    # Sub-command for fetching profiles from a running server
+    parser_profiles = subparsers.add_parser(
+        "profiles", help="List or fetch the profiles kept by a running server"
+    )
+    parser_profiles.add_argument(
+        "server", help="REST base URL, or grpc://host:port for a gRPC server"
+    )
+    parser_profiles.add_argument(
+        "--id", type=int, default=None, help="Fetch this profile instead of listing"
+    )
+    parser_profiles.add_argument(
+        "--format",
+        choices=["text", "collapsed", "pstats"],
+        default="text",
+        help="Report, collapsed stacks for flame graphs, or binary pstats",
+    )
+    parser_profiles.add_argument(
+        "--output", type=str, default=None, help="Write the profile to this file"
+    )
+
+    # Sub-command for benchmarking the app's tools
+    parser_bench = subparsers.add_parser(
+        "bench", help="Measure tool latency and throughput against a local backend"
+    )
+    parser_bench.add_argument("module", help="The application module to benchmark")
+    parser_bench.add_argument(
+        "--paths",
+        nargs="+",
+        choices=["python", "rest", "grpc"],
+        default=["python", "rest", "grpc"],
+        help="Ways of calling the tools to measure",
+    )
+    parser_bench.add_argument(
+        "--tools", nargs="+", default=None, help="Tools to benchmark"
+    )
+    parser_bench.add_argument(
+        "--args",
+        action="append",
+        default=[],
+        metavar="TOOL=JSON",
+        help="Arguments of a tool, instead of sample values",
+    )
+    parser_bench.add_argument(
+        "--requests", type=int, default=1000, help="Timed calls per tool and path"
+    )
+    parser_bench.add_argument(
+        "--concurrency", type=int, default=8, help="Concurrent callers"
+    )
+    parser_bench.add_argument(
+        "--output", type=str, default=None, help="Save the results to this JSON file"
+    )
+    parser_bench.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="JSON results of an earlier run; exit with 1 on regressions",
+    )
 
     args = parser.parse_args()
 
@@ -51,28 +285,46 @@ def main():
         parser.print_help()
         sys.exit(1)
 
-    # Import the specified module
-    module_name = args.module.replace(".py", "").replace("/", ".").replace("\\", ".")
+    if args.command == "bench":
+        sys.exit(bench(args))
+    if args.command == "profiles":
+        sys.exit(profiles(args))
+
+    # Import the specified module and find its app
     try:
-        app_module = importlib.import_module(module_name)
+        app = load_app(args.module)
     except ImportError as e:
-        print(f"Cannot import module '{module_name}': {e}")
+        print(f"Cannot import module '{args.module}': {e}")
         sys.exit(1)
-
-    # Find the first TruffleApp instance in the module
-    app = None
-    for name, obj in inspect.getmembers(app_module):
-        if isinstance(obj, TruffleApp):
-            app = obj
-            break
-
-    if app is None:
-        print(f"No instance of TruffleApp found in module '{module_name}'.")
+    except LookupError as e:
+        print(e)
         sys.exit(1)
 
     # Create a Client instance
     client = Client()
 
+    sessions = None
+    if getattr(args, "sessions", False):
+        from truffle_python_sdk.sessions import SessionPool
+
+        sessions = SessionPool(
+            app,
+            max_sessions=args.max_sessions,
+            ttl=args.session_ttl,
+            max_memory=args.session_max_memory,
+            spill_dir=args.session_spill_dir,
+        )
+
+    profiler = None
+    if getattr(args, "profile", False) or getattr(args, "profile_rate", 0.0):
+        from truffle_python_sdk.profiling import Profiler
+
+        profiler = Profiler(
+            sample_rate=args.profile_rate,
+            kind=args.profile_kind,
+            capacity=args.profile_capacity,
+        )
+
     # Handle the sub-commands
     if args.command == "run:rest":
         client.start(
@@ -82,6 +334,15 @@ def main():
             port=args.port,
             log_level=args.log_level,
             reload=args.reload,
+            executor=args.executor,
+            max_workers=args.max_workers,
+            max_queue=args.max_queue,
+            snapshot_dir=args.snapshot_dir,
+            snapshot_interval=args.snapshot_interval,
+            workers=args.workers,
+            state_policy=args.state_policy,
+            sessions=sessions,
+            profiler=profiler,
         )
     elif args.command == "run:grpc":
         client.start(
@@ -90,13 +351,84 @@ def main():
             host=args.host,
             port=args.port,
             log_level=args.log_level,
+            executor=args.executor,
+            max_workers=args.max_workers,
+            max_queue=args.max_queue,
+            snapshot_dir=args.snapshot_dir,
+            snapshot_interval=args.snapshot_interval,
+            workers=args.workers,
+            state_policy=args.state_policy,
+            sessions=sessions,
+            profiler=profiler,
+            grpc_runtime=args.runtime,
+            max_concurrent_rpcs=args.max_concurrent_rpcs,
+            max_send_message_size=args.max_send_message_size,
+            max_receive_message_size=args.max_receive_message_size,
+            compression=args.compression,
+            keepalive_time=args.keepalive_time,
+            keepalive_timeout=args.keepalive_timeout,
         )
     elif args.command == "proto":
-        client.generate_proto_files(app)
+        client.generate_proto_files(
+            app, proto_file_path=args.output, python_out=args.python_out
+        )
     else:
         parser.print_help()
         sys.exit(1)
 
 
+def profiles(args) -> int:
+    from truffle_python_sdk.profiling import fetch
+
+    if args.id is None:
+        for profile in fetch(args.server):
+            error = f"  {profile['error']}" if profile["error"] else ""
+            print(
+                f"{profile['id']:>6}  {profile['tool']:<24}{profile['kind']:<8}"
+                f"{profile['duration'] * 1e3:>10.2f} ms{error}"
+            )
+        return 0
+
+    content = fetch(args.server, args.id, args.format)
+    if args.output is not None:
+        mode = "wb" if isinstance(content, bytes) else "w"
+        with open(args.output, mode) as f:
+            f.write(content)
+    elif isinstance(content, bytes):
+        sys.stdout.buffer.write(content)
+    else:
+        sys.stdout.write(content)
+    return 0
+
+
+def bench(args) -> int:
+    import json
+    from truffle_python_sdk import bench
+
+    kwargs = {}
+    for value in args.args:
+        name, _, arguments = value.partition("=")
+        kwargs[name] = json.loads(arguments)
+
+    report = bench.run_benchmark(
+        args.module,
+        paths=args.paths,
+        tools=args.tools,
+        kwargs=kwargs,
+        requests=args.requests,
+        concurrency=args.concurrency,
+    )
+    if args.output is not None:
+        bench.save_report(report, args.output)
+
+    if args.compare is not None:
+        regressions = bench.compare(bench.load_report(args.compare), report)
+        for tool, path, metric, before, after in regressions:
+            print(f"REGRESSION {tool} {path} {metric}: {before:.2f} -> {after:.2f}")
+        if regressions:
+            return 1
+    return 0
+
+
 if __name__ == "__main__":
     main()
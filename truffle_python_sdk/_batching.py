@@ -0,0 +1,70 @@
+import threading
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merge concurrent single-item requests into one upstream batch request.
+
+    The first caller to submit an item for a given key becomes the batch
+    leader: it waits up to ``max_wait`` seconds (or until ``max_batch_size``
+    items have been collected), sends the whole batch with ``send`` and hands
+    each caller its own result. Callers with different keys are never merged.
+    """
+
+    def __init__(self, send, max_batch_size: int = 64, max_wait: float = 0.005):
+        """
+        Args:
+            send: Callable ``send(key, items) -> results`` returning one result
+                per item, in order.
+            max_batch_size: Maximum number of items merged into one request.
+            max_wait: Maximum seconds a leader waits for more items.
+        """
+        self.send = send
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def submit(self, key, item):
+        """
+        Add ``item`` to the open batch for ``key`` and return its result.
+        """
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                self._open[key] = batch
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch_size:
+                del self._open[key]
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+            try:
+                batch.results = self.send(key, batch.items)
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
@@ -0,0 +1,287 @@
+import asyncio
+import functools
+import inspect
+import multiprocessing
+import time
+from concurrent import futures
+from typing import Literal
+
+
+class ServerOverloaded(Exception):
+    """
+    Raised when a tool call is rejected because the worker queue is full.
+    """
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# The app instance used by tool calls inside process pool workers
+_worker_app = None
+
+
+def _init_worker(app):
+    global _worker_app
+    _worker_app = app
+
+
+def _call_in_worker(attr_name: str, kwargs: dict):
+    func = getattr(type(_worker_app), attr_name)
+    return func(_worker_app, **kwargs)
+
+
+def _timed(task, submitted: float):
+    # time.monotonic() is system-wide, so this also works in worker processes
+    wait = time.monotonic() - submitted
+    try:
+        return wait, task(), None
+    except Exception as e:
+        return wait, None, e
+
+
+class ToolDispatcher:
+    """
+    Run tool calls without blocking the event loop.
+
+    ``async def`` tools are awaited directly on the loop. Synchronous tools
+    are sent to a bounded thread or process pool; once ``max_workers`` calls
+    are running and ``max_queue`` more are waiting, further calls are rejected
+    with ``ServerOverloaded`` so that load is shed instead of queueing up.
+    Streams of synchronous generator tools count as one such call for as
+    long as they run, and their chunks are pulled in the pool's threads.
+
+    In ``process`` mode each worker gets its own copy of the app when the
+    pool starts, so state changes made by a tool stay in that worker. Use it
+    for CPU-bound tools that do not rely on shared mutable state.
+
+    With a ``MetricsRegistry`` as ``metrics``, the number of pending calls
+    and the time calls wait for a free worker are recorded. With a
+    ``Profiler`` as ``profiler``, the calls it picks are profiled where they
+    run (in the worker thread or process, or on the event loop).
+    """
+
+    def __init__(
+        self,
+        app,
+        executor: Literal["thread", "process"] = "thread",
+        max_workers: int = None,
+        max_queue: int = 100,
+        retry_after: int = 1,
+        metrics=None,
+        profiler=None,
+    ):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Invalid executor: {executor}")
+
+        self.app = app
+        self.executor_type = executor
+        self.max_workers = max_workers or min(
+            32, (multiprocessing.cpu_count() or 1) + 4
+        )
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.profiler = profiler
+
+        self._executor = None
+        self._pending = 0
+
+        self._pending_gauge = None
+        self._queue_wait = None
+        if metrics is not None:
+            self._pending_gauge = metrics.gauge(
+                "truffle_executor_pending",
+                "Synchronous tool calls running or waiting for a worker",
+            )
+            self._queue_wait = metrics.histogram(
+                "truffle_executor_queue_wait_seconds",
+                "Time synchronous tool calls waited for a worker",
+            )
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            if self.executor_type == "process":
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    "fork" if "fork" in methods else None
+                )
+                self._executor = futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.app,),
+                )
+            else:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="truffle-tool"
+                )
+        return self._executor
+
+    @property
+    def pending(self):
+        """Number of synchronous calls running or waiting for a worker."""
+        return self._pending
+
+    async def call(self, tool, kwargs: dict, app=None, profile: str = None):
+        """
+        Call ``tool`` (a ``ToolSpec``) with ``kwargs`` and return its result.
+        The tool runs on ``app`` if given, otherwise on the dispatcher's app.
+        ``profile`` is the profile header value of the call, if any.
+        """
+        func = tool.function
+        if app is None:
+            app = self.app
+        kind = None
+        if self.profiler is not None:
+            kind = self.profiler.choose(profile)
+        if tool.is_async:
+            if kind is None:
+                return await func(app, **kwargs)
+            return await self.profiler.arun(
+                tool.name, kind, lambda: func(app, **kwargs)
+            )
+
+        self.check_capacity()
+        if self.executor_type == "process":
+            task = functools.partial(_call_in_worker, tool.attr_name, kwargs)
+        else:
+            task = functools.partial(func, app, **kwargs)
+        if kind is None:
+            return await self._submit(task)
+
+        from truffle_python_sdk.profiling import capture
+
+        try:
+            profile, result = await self._submit(
+                functools.partial(capture, task, tool.name, kind)
+            )
+        except Exception as e:
+            if hasattr(e, "__truffle_profile__"):
+                self.profiler.add(e.__truffle_profile__)
+            raise
+        self.profiler.add(profile)
+        return result
+
+    def check_capacity(self):
+        """
+        Raise ``ServerOverloaded`` if no more synchronous calls can be taken.
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            raise ServerOverloaded(self.retry_after)
+
+    def stream(self, tool, kwargs: dict, app=None, profile: str = None):
+        """
+        Call the streaming ``tool`` with ``kwargs`` and return an async
+        iterator over its chunks. For a synchronous generator, raises
+        ``ServerOverloaded`` right away (before any response is started) if
+        the pool is full.
+        """
+        if app is None:
+            app = self.app
+        is_async = inspect.isasyncgenfunction(inspect.unwrap(tool.function))
+        if not is_async:
+            self.check_capacity()
+        kind = None
+        if self.profiler is not None:
+            kind = self.profiler.choose(profile)
+        if is_async:
+            return self._stream_async(tool, kwargs, app, kind)
+        return self._stream_sync(tool, kwargs, app, kind)
+
+    def _capture(self, tool, kind):
+        if kind is None:
+            return None
+        from truffle_python_sdk.profiling import StreamCapture
+
+        return StreamCapture(self.profiler, tool.name, kind)
+
+    async def _stream_async(self, tool, kwargs, app, kind):
+        chunks = tool.function(app, **kwargs)
+        capture = self._capture(tool, kind)
+        error = None
+        try:
+            while True:
+                try:
+                    if capture is None:
+                        chunk = await chunks.__anext__()
+                    else:
+                        chunk = await capture.astep(chunks.__anext__)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            if capture is not None:
+                capture.close(error)
+
+    async def _stream_sync(self, tool, kwargs, app, kind):
+        loop = asyncio.get_running_loop()
+        # Generators cannot be sent to worker processes, so in process mode
+        # their chunks are pulled in the loop's default thread pool
+        executor = None if self.executor_type == "process" else self.executor
+        chunks = iter(tool.function(app, **kwargs))
+        done = object()
+        step = functools.partial(next, chunks, done)
+        capture = self._capture(tool, kind)
+        if capture is not None:
+            step = functools.partial(capture.step, step)
+        self._pending += 1
+        if self._pending_gauge is not None:
+            self._pending_gauge.set(self._pending)
+        error = None
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, step)
+                if chunk is done:
+                    return
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._pending -= 1
+            if self._pending_gauge is not None:
+                self._pending_gauge.set(self._pending)
+            if capture is not None:
+                capture.close(error)
+
+    async def gather(self, calls):
+        """
+        Await ``calls`` (coroutines dispatching tool calls) concurrently and
+        return their results in order. At most ``max_workers`` of them run at
+        a time, so a large batch waits for workers instead of filling the
+        queue and having its own calls rejected.
+        """
+        limit = asyncio.Semaphore(self.max_workers)
+
+        async def bounded(call):
+            async with limit:
+                return await call
+
+        return await asyncio.gather(*(bounded(call) for call in calls))
+
+    async def _submit(self, task):
+        loop = asyncio.get_running_loop()
+        self._pending += 1
+        try:
+            if self._queue_wait is None:
+                return await loop.run_in_executor(self.executor, task)
+            self._pending_gauge.set(self._pending)
+            task = functools.partial(_timed, task, time.monotonic())
+            wait, result, error = await loop.run_in_executor(self.executor, task)
+            self._queue_wait.record(wait)
+            if error is not None:
+                raise error
+            return result
+        finally:
+            self._pending -= 1
+            if self._pending_gauge is not None:
+                self._pending_gauge.set(self._pending)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,228 @@
+"""
+Serving tools with ``grpc.aio``: async tools are awaited on the server's
+event loop, and synchronous tools are sent to a ``ToolDispatcher`` pool, as
+in REST mode.
+"""
+
+import asyncio
+
+import grpc
+
+from truffle_python_sdk._dispatch import ServerOverloaded, ToolDispatcher
+from truffle_python_sdk._grpc_server import (
+    _admin_handler,
+    _metadata,
+    batch_call_tools,
+    batch_error,
+)
+from truffle_python_sdk._workers import SESSION_METADATA
+
+
+async def serve_aio(
+    tools,
+    messages: dict,
+    app_instance,
+    addresses: list,
+    options: list = (),
+    compression=None,
+    max_concurrent_rpcs: int = None,
+    executor: str = "thread",
+    max_workers: int = None,
+    max_queue: int = 100,
+    sessions=None,
+    metrics=None,
+    profiler=None,
+):
+    """
+    Serve ``tools`` on ``addresses`` until the server is stopped. See
+    ``start_grpc_server`` for the arguments.
+    """
+    from truffle_python_sdk.metrics import ToolMetrics
+
+    dispatcher = ToolDispatcher(
+        app_instance,
+        executor=executor,
+        max_workers=max_workers,
+        max_queue=max_queue,
+        metrics=metrics,
+        profiler=profiler,
+    )
+
+    handlers = {}
+    methods = {}
+    for tool_name, tool in tools.items():
+        request_class = messages[f"{tool_name}Request"]
+        response_class = messages[f"{tool_name}Response"]
+        codec = tools.schema.codecs[tool_name]
+        tool_metrics = ToolMetrics(metrics, tool_name) if metrics else None
+        if tool.stream:
+            method = _stream_rpc_method(
+                tool, codec, response_class, dispatcher, sessions, tool_metrics
+            )
+            handler = grpc.unary_stream_rpc_method_handler
+        else:
+            method = methods[tool_name] = _rpc_method(
+                tool, codec, response_class, dispatcher, sessions, tool_metrics
+            )
+            method = _aborting(method)
+            handler = grpc.unary_unary_rpc_method_handler
+        handlers[tool_name] = handler(
+            method,
+            request_deserializer=request_class.FromString,
+            response_serializer=response_class.SerializeToString,
+        )
+
+    if "BatchCall" in messages:
+        handlers["Batch"] = _batch_handler(methods, messages, dispatcher, sessions)
+
+    server = grpc.aio.server(
+        options=options,
+        maximum_concurrent_rpcs=max_concurrent_rpcs,
+        compression=compression,
+    )
+    server.add_generic_rpc_handlers(
+        (grpc.method_handlers_generic_handler("truffle.Truffle", handlers),)
+    )
+    if profiler is not None:
+        server.add_generic_rpc_handlers((_admin_handler(profiler, aio=True),))
+    for address in addresses:
+        server.add_insecure_port(address)
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        dispatcher.shutdown()
+
+
+def _rpc_method(tool, codec, response_class, dispatcher, sessions, tool_metrics):
+    from truffle_python_sdk.profiling import PROFILE_METADATA
+
+    arguments = codec.arguments
+    respond = codec.responder(response_class)
+    names = tuple(param.name for param in tool.parameters)
+
+    async def rpc_method(request, context):
+        # The dispatcher passes arguments by name, e.g. to process workers
+        kwargs = dict(zip(names, arguments(request)))
+        profile = _metadata(context, PROFILE_METADATA)
+        session_id = None
+        if sessions is not None:
+            session_id = _metadata(context, SESSION_METADATA)
+        if session_id is None:
+            result = await dispatcher.call(tool, kwargs, profile=profile)
+        else:
+            async with sessions.asession(session_id) as app:
+                result = await dispatcher.call(tool, kwargs, app=app, profile=profile)
+        return respond(result)
+
+    async def measured_rpc_method(request, context):
+        start = tool_metrics.start(request.ByteSize())
+        try:
+            response = await rpc_method(request, context)
+        except BaseException:
+            tool_metrics.finish(start, error=True)
+            raise
+        tool_metrics.finish(start, response_bytes=response.ByteSize())
+        return response
+
+    return rpc_method if tool_metrics is None else measured_rpc_method
+
+
+def _aborting(method):
+    # Tell callers to back off when the worker queue is full
+    async def rpc_method(request, context):
+        try:
+            return await method(request, context)
+        except ServerOverloaded as e:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+
+    return rpc_method
+
+
+def _batch_handler(methods, messages, dispatcher, sessions):
+    """
+    The ``Batch`` RPC: runs the calls concurrently on the event loop, as
+    many at a time as the dispatcher has workers (in order, within a
+    session), and returns their results in order, with an error result for
+    each call that failed.
+    """
+    result_class = messages["BatchResult"]
+    response_class = messages["BatchResponse"]
+    methods = {name: methods[name] for name in batch_call_tools(messages)}
+
+    async def run_call(call, context):
+        name = call.WhichOneof("call")
+        if name is None:
+            return batch_error(messages, "INVALID_ARGUMENT", "Empty batch call")
+        try:
+            response = await methods[name](getattr(call, name), context)
+        except ServerOverloaded as e:
+            return batch_error(messages, "RESOURCE_EXHAUSTED", str(e))
+        except Exception as e:
+            return batch_error(messages, "INTERNAL", f"{type(e).__name__}: {e}")
+        return result_class(**{name: response})
+
+    async def batch(request, context):
+        if sessions is not None and _metadata(context, SESSION_METADATA) is not None:
+            # Calls within a session are serialised, so run them in order
+            results = [await run_call(call, context) for call in request.calls]
+        else:
+            results = await dispatcher.gather(
+                run_call(call, context) for call in request.calls
+            )
+        return response_class(results=results)
+
+    return grpc.unary_unary_rpc_method_handler(
+        batch,
+        request_deserializer=messages["BatchRequest"].FromString,
+        response_serializer=response_class.SerializeToString,
+    )
+
+
+def _stream_rpc_method(tool, codec, response_class, dispatcher, sessions, tool_metrics):
+    from truffle_python_sdk.profiling import PROFILE_METADATA
+
+    arguments = codec.arguments
+    respond = codec.responder(response_class)
+    names = tuple(param.name for param in tool.parameters)
+
+    async def stream(app, kwargs, profile, context):
+        try:
+            chunks = dispatcher.stream(tool, kwargs, app=app, profile=profile)
+        except ServerOverloaded as e:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, str(e))
+        async for chunk in chunks:
+            yield respond(chunk)
+
+    async def rpc_method(request, context):
+        kwargs = dict(zip(names, arguments(request)))
+        profile = _metadata(context, PROFILE_METADATA)
+        session_id = None
+        if sessions is not None:
+            session_id = _metadata(context, SESSION_METADATA)
+        if session_id is None:
+            async for response in stream(None, kwargs, profile, context):
+                yield response
+            return
+        # Hold the session for as long as the stream runs
+        async with sessions.asession(session_id) as app:
+            async for response in stream(app, kwargs, profile, context):
+                yield response
+
+    async def measured_rpc_method(request, context):
+        start = tool_metrics.start(request.ByteSize())
+        size = 0
+        error = True
+        try:
+            async for response in rpc_method(request, context):
+                size += response.ByteSize()
+                yield response
+            error = False
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client cancelled the call; the tool did not fail
+            error = False
+            raise
+        finally:
+            tool_metrics.finish(start, error=error, response_bytes=size)
+
+    return rpc_method if tool_metrics is None else measured_rpc_method
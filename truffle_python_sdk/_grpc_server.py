@@ -0,0 +1,447 @@
+"""
+The thread-pool ``grpc.server`` runtime: RPC method handlers for each tool,
+the ``Batch`` and admin services, and server startup.
+"""
+
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+from concurrent import futures
+
+import grpc
+
+from truffle_python_sdk._proto import compile_proto, load_proto_messages
+from truffle_python_sdk._utils import iterate_async, run_coroutine
+
+
+def start_grpc_server(
+    tools,
+    app_instance,
+    host="0.0.0.0",
+    port=50051,
+    log_level="info",
+    worker=None,
+    sessions=None,
+    metrics=None,
+    profiler=None,
+    runtime="thread",
+    max_workers=None,
+    max_concurrent_rpcs=None,
+    max_send_message_size=None,
+    max_receive_message_size=None,
+    compression=None,
+    keepalive_time=None,
+    keepalive_timeout=None,
+    executor="thread",
+    max_queue=100,
+):
+    """
+    Start the gRPC server using the provided tools (a ``ToolRegistry``).
+
+    ``worker`` is the ``WorkerContext`` of this process when serving with
+    several worker processes. With a ``SessionPool`` as ``sessions``, calls
+    carrying ``x-truffle-session`` metadata run on that session's app. With a
+    ``MetricsRegistry`` as ``metrics``, every call is recorded in it. With a
+    ``Profiler``, the unary calls it picks are profiled, and profiles are
+    served by the ``truffle.Admin`` service.
+
+    With the ``thread`` runtime, calls run in a pool of ``max_workers``
+    threads (10 by default), and at most ``max_queue`` more wait for one
+    unless ``max_concurrent_rpcs`` is given; ``executor`` must be
+    ``"thread"``. With ``aio``, the server runs on an asyncio
+    event loop that awaits async tools directly, and synchronous tools are
+    sent to a ``ToolDispatcher`` pool configured by ``executor``,
+    ``max_workers`` and ``max_queue``. Calls beyond ``max_concurrent_rpcs``
+    are rejected with ``RESOURCE_EXHAUSTED``. See ``server_options`` for the
+    message size and keepalive settings; ``compression`` is ``"gzip"``,
+    ``"deflate"`` or ``None``.
+    """
+    if runtime not in ("thread", "aio"):
+        raise ValueError(f"Invalid gRPC runtime: {runtime}")
+    if runtime == "thread":
+        if executor != "thread":
+            raise ValueError(
+                f"The thread gRPC runtime cannot use executor={executor!r}; "
+                "use the aio runtime"
+            )
+        if max_concurrent_rpcs is None:
+            # Shed calls beyond the queue, as the aio runtime's dispatcher does
+            max_concurrent_rpcs = (max_workers or 10) + max_queue
+    if compression is not None:
+        compression = _COMPRESSION[compression]
+    options = server_options(
+        max_send_message_size,
+        max_receive_message_size,
+        keepalive_time,
+        keepalive_timeout,
+    )
+    addresses = [f"{host}:{port}"]
+    interceptors = []
+    if worker is not None:
+        options += worker.grpc_options()
+        interceptors = worker.grpc_interceptors()
+        addresses = worker.grpc_addresses(host, port)
+
+    # Step 1: Build message classes for the tool schema
+    messages = load_proto_messages(compile_proto(tools.proto))
+
+    if runtime == "aio":
+        if interceptors:
+            raise ValueError("The aio gRPC runtime does not support sharded workers")
+        from truffle_python_sdk._grpc_aio import serve_aio
+
+        print(f"gRPC server is running on {host}:{port}...")
+        asyncio.run(
+            serve_aio(
+                tools,
+                messages,
+                app_instance,
+                addresses,
+                options=options,
+                compression=compression,
+                max_concurrent_rpcs=max_concurrent_rpcs,
+                executor=executor,
+                max_workers=max_workers,
+                max_queue=max_queue,
+                sessions=sessions,
+                metrics=metrics,
+                profiler=profiler,
+            )
+        )
+        return
+
+    # Step 2: Create an RPC handler for each tool
+    handlers = build_grpc_handlers(
+        tools,
+        messages,
+        app_instance,
+        sessions,
+        metrics,
+        profiler,
+        batch_workers=max_workers or 10,
+    )
+
+    # Step 3: Create a gRPC server
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=max_workers or 10),
+        interceptors=interceptors,
+        options=options,
+        maximum_concurrent_rpcs=max_concurrent_rpcs,
+        compression=compression,
+    )
+    server.add_generic_rpc_handlers(
+        (grpc.method_handlers_generic_handler("truffle.Truffle", handlers),)
+    )
+    if profiler is not None:
+        server.add_generic_rpc_handlers((_admin_handler(profiler),))
+    for address in addresses:
+        server.add_insecure_port(address)
+    server.start()
+    print(f"gRPC server is running on {host}:{port}...")
+    server.wait_for_termination()
+
+
+def build_grpc_handlers(
+    tools,
+    messages,
+    app_instance,
+    sessions=None,
+    metrics=None,
+    profiler=None,
+    batch_workers=10,
+):
+    """
+    The RPC method handlers of the ``truffle.Truffle`` service, by tool name,
+    for a thread-pool ``grpc.server``. The calls of a ``Batch`` run in a pool
+    of ``batch_workers`` threads of their own.
+
+    Everything that does not depend on the request (how to read the
+    arguments, call the tool and build the response) is worked out here, so
+    that a call without sessions or profiling costs little more than calling
+    the tool itself, plus recording its metrics if enabled.
+    """
+    from truffle_python_sdk._workers import SESSION_METADATA
+    from truffle_python_sdk.metrics import ToolMetrics
+    from truffle_python_sdk.profiling import PROFILE_METADATA
+
+    handlers = {}
+    for tool_name, tool in tools.items():
+        request_class = messages[f"{tool_name}Request"]
+        response_class = messages[f"{tool_name}Response"]
+        codec = tools.schema.codecs[tool_name]
+        arguments = codec.arguments
+        call = positional_call(tool)
+        respond = codec.responder(response_class)
+        tool_metrics = ToolMetrics(metrics, tool_name) if metrics else None
+
+        def create_stream_rpc_method(tool, arguments, call, respond, tool_metrics):
+            def stream(app, args):
+                result = call(app, *args)
+                if hasattr(result, "__aiter__"):
+                    result = iterate_async(result)
+                for chunk in result:
+                    yield respond(chunk)
+
+            def measured_rpc_method(request, context):
+                start = tool_metrics.start(request.ByteSize())
+                size = 0
+                error = True
+                try:
+                    for response in rpc_method(request, context):
+                        size += response.ByteSize()
+                        yield response
+                    error = False
+                except GeneratorExit:
+                    # The client cancelled the call; the tool did not fail
+                    error = False
+                    raise
+                finally:
+                    tool_metrics.finish(start, error=error, response_bytes=size)
+
+            # Define a server-streaming RPC method
+            def rpc_method(request, context):
+                args = arguments(request)
+                if sessions is None:
+                    yield from stream(app_instance, args)
+                    return
+                session_id = _metadata(context, SESSION_METADATA)
+                if session_id is None:
+                    yield from stream(app_instance, args)
+                    return
+                # Hold the session for as long as the stream runs
+                with sessions.session(session_id) as app:
+                    yield from stream(app, args)
+
+            return rpc_method if tool_metrics is None else measured_rpc_method
+
+        def create_rpc_method(tool, arguments, call, respond, tool_metrics):
+            def measured_rpc_method(request, context):
+                start = tool_metrics.start(request.ByteSize())
+                try:
+                    response = rpc_method(request, context)
+                except BaseException:
+                    tool_metrics.finish(start, error=True)
+                    raise
+                tool_metrics.finish(start, response_bytes=response.ByteSize())
+                return response
+
+            # The common case: call the tool and convert its result, nothing else
+            def direct_rpc_method(request, context):
+                return respond(call(app_instance, *arguments(request)))
+
+            # The same, recorded in the metrics (the default configuration)
+            def measured_direct_rpc_method(request, context):
+                start = tool_metrics.start(request.ByteSize())
+                try:
+                    response = respond(call(app_instance, *arguments(request)))
+                except BaseException:
+                    tool_metrics.finish(start, error=True)
+                    raise
+                tool_metrics.finish(start, response_bytes=response.ByteSize())
+                return response
+
+            # Define the RPC method
+            def rpc_method(request, context):
+                args = arguments(request)
+                # Call the tool function, on the caller's session if any
+                session_id = None
+                if sessions is not None:
+                    session_id = _metadata(context, SESSION_METADATA)
+                kind = None
+                if profiler is not None:
+                    kind = profiler.choose(_metadata(context, PROFILE_METADATA))
+                if session_id is None:
+                    result = _call_tool(tool, call, app_instance, args, profiler, kind)
+                else:
+                    with sessions.session(session_id) as app:
+                        result = _call_tool(tool, call, app, args, profiler, kind)
+                # Convert the result to primitive types and build the response
+                return respond(result)
+
+            if sessions is None and profiler is None:
+                if tool_metrics is None:
+                    return direct_rpc_method
+                return measured_direct_rpc_method
+            return rpc_method if tool_metrics is None else measured_rpc_method
+
+        if tool.stream:
+            create_method = create_stream_rpc_method
+            method_handler = grpc.unary_stream_rpc_method_handler
+        else:
+            create_method = create_rpc_method
+            method_handler = grpc.unary_unary_rpc_method_handler
+        handlers[tool_name] = method_handler(
+            create_method(tool, arguments, call, respond, tool_metrics),
+            request_deserializer=request_class.FromString,
+            response_serializer=response_class.SerializeToString,
+        )
+
+    if "BatchCall" in messages:
+        handlers["Batch"] = _batch_handler(
+            handlers, messages, sessions, futures.ThreadPoolExecutor(batch_workers)
+        )
+    return handlers
+
+
+_COMPRESSION = {
+    "gzip": grpc.Compression.Gzip,
+    "deflate": grpc.Compression.Deflate,
+}
+
+
+def server_options(
+    max_send_message_size=None,
+    max_receive_message_size=None,
+    keepalive_time=None,
+    keepalive_timeout=None,
+):
+    """
+    gRPC channel options for a server. Message sizes are in bytes (``-1``
+    for no limit; gRPC receives at most 4 MB by default). With
+    ``keepalive_time``, the server pings idle connections every that many
+    seconds and closes those that do not answer within ``keepalive_timeout``
+    seconds.
+    """
+    options = []
+    if max_send_message_size is not None:
+        options.append(("grpc.max_send_message_length", max_send_message_size))
+    if max_receive_message_size is not None:
+        options.append(("grpc.max_receive_message_length", max_receive_message_size))
+    if keepalive_time is not None:
+        options.append(("grpc.keepalive_time_ms", int(keepalive_time * 1000)))
+        options.append(("grpc.keepalive_permit_without_calls", 1))
+    if keepalive_timeout is not None:
+        options.append(("grpc.keepalive_timeout_ms", int(keepalive_timeout * 1000)))
+    return options
+
+
+def positional_call(tool):
+    """
+    A function calling ``tool`` as ``call(app, *args)`` with the arguments
+    read by its ``ToolCodec`` and returning its result, awaited if needed.
+    """
+    func = tool.function
+    kinds = {param.kind for param in tool.signature.parameters.values()}
+    if inspect.Parameter.KEYWORD_ONLY in kinds:
+        names = tuple(param.name for param in tool.parameters)
+        func = functools.partial(_call_with_keywords, tool.function, names)
+    if tool.is_async:
+        return lambda app, *args: run_coroutine(func(app, *args))
+    return func
+
+
+def _call_with_keywords(func, names, app, *args):
+    return func(app, **dict(zip(names, args)))
+
+
+def _metadata(context, name):
+    for key, value in context.invocation_metadata():
+        if key == name:
+            return value
+    return None
+
+
+def _call_tool(tool, call, app, args, profiler=None, kind=None):
+    if kind is None:
+        return call(app, *args)
+    return profiler.run(tool.name, kind, lambda: call(app, *args))
+
+
+def batch_call_tools(messages):
+    """
+    Names of the tools a ``BatchCall`` can hold.
+    """
+    return [field.name for field in messages["BatchCall"].DESCRIPTOR.fields]
+
+
+def batch_error(messages, code, message):
+    """
+    A ``BatchResult`` holding an error with a gRPC status code name.
+    """
+    error = messages["BatchError"](code=code, message=message)
+    return messages["BatchResult"](error=error)
+
+
+def _batch_handler(handlers, messages, sessions, executor):
+    """
+    The ``Batch`` RPC: runs each call through its tool's own RPC method,
+    concurrently unless the batch belongs to a session, and returns the
+    results in order. A failed call gets an error result instead of failing
+    the whole batch.
+    """
+    from truffle_python_sdk._workers import SESSION_METADATA
+
+    result_class = messages["BatchResult"]
+    response_class = messages["BatchResponse"]
+    methods = {name: handlers[name].unary_unary for name in batch_call_tools(messages)}
+
+    def run_call(call, context):
+        name = call.WhichOneof("call")
+        if name is None:
+            return batch_error(messages, "INVALID_ARGUMENT", "Empty batch call")
+        try:
+            response = methods[name](getattr(call, name), context)
+        except Exception as e:
+            return batch_error(messages, "INTERNAL", f"{type(e).__name__}: {e}")
+        return result_class(**{name: response})
+
+    def batch(request, context):
+        calls = request.calls
+        if len(calls) <= 1 or (
+            sessions is not None and _metadata(context, SESSION_METADATA) is not None
+        ):
+            # Calls within a session are serialised, so run them in order
+            results = [run_call(call, context) for call in calls]
+        else:
+            results = list(executor.map(run_call, calls, itertools.repeat(context)))
+        return response_class(results=results)
+
+    return grpc.unary_unary_rpc_method_handler(
+        batch,
+        request_deserializer=messages["BatchRequest"].FromString,
+        response_serializer=response_class.SerializeToString,
+    )
+
+
+def _admin_handler(profiler, aio=False):
+    """
+    The ``truffle.Admin`` service. Its methods take and return raw bytes
+    (JSON requests), so clients need no generated stubs: ``Profiles`` lists
+    the kept profiles and ``Profile`` returns the one named by
+    ``{"id", "format"}``. With ``aio``, the handlers are coroutines for a
+    ``grpc.aio`` server.
+    """
+
+    def profiles(request):
+        return json.dumps(profiler.profiles()).encode("utf-8")
+
+    def profile(request):
+        query = json.loads(request or b"{}")
+        content = profiler.render(int(query["id"]), query.get("format", "text"))
+        return content if isinstance(content, bytes) else content.encode("utf-8")
+
+    def abort_status(e):
+        if isinstance(e, KeyError):
+            return grpc.StatusCode.NOT_FOUND, f"No profile {e}"
+        return grpc.StatusCode.INVALID_ARGUMENT, str(e)
+
+    def method(reply):
+        def handler(request, context):
+            try:
+                return reply(request)
+            except (KeyError, ValueError) as e:
+                context.abort(*abort_status(e))
+
+        async def aio_handler(request, context):
+            try:
+                return reply(request)
+            except (KeyError, ValueError) as e:
+                await context.abort(*abort_status(e))
+
+        return grpc.unary_unary_rpc_method_handler(aio_handler if aio else handler)
+
+    return grpc.method_handlers_generic_handler(
+        "truffle.Admin", {"Profiles": method(profiles), "Profile": method(profile)}
+    )
@@ -0,0 +1,180 @@
+"""
+Building and compiling the protobuf schema of an app's tools. Nothing here
+imports ``grpc``: generating a ``.proto`` file or its descriptors only needs
+``grpc_tools`` (for ``protoc``) and ``protobuf``.
+"""
+
+import os
+
+
+def build_proto(tools):
+    """
+    Generate the .proto file content based on the tools provided.
+    """
+    from truffle_python_sdk._schema import ProtoSchema
+
+    return ProtoSchema(tools, app_class=getattr(tools, "app_class", None)).text
+
+
+def generate_proto_file(tools, proto_file_path="truffle.proto", python_out=None):
+    """
+    Write the .proto file for the tools (a ``ToolRegistry``), and optionally
+    compile Python client stubs (``truffle_pb2.py``/``truffle_pb2_grpc.py``)
+    into ``python_out``.
+    """
+    proto_content = tools.proto
+    with open(proto_file_path, "w") as f:
+        f.write(proto_content)
+    print(f"Generated {proto_file_path}")
+
+    if python_out is not None:
+        proto_dir = os.path.dirname(os.path.abspath(proto_file_path))
+        _run_protoc(
+            f"-I{proto_dir}",
+            f"--python_out={python_out}",
+            f"--grpc_python_out={python_out}",
+            os.path.abspath(proto_file_path),
+        )
+        print(f"Generated Python stubs in {python_out}")
+
+
+def _run_protoc(*args):
+    import grpc_tools
+    from grpc_tools import protoc
+
+    # The well-known types (google/protobuf/*.proto) ship with grpc_tools
+    well_known = os.path.join(os.path.dirname(grpc_tools.__file__), "_proto")
+    if protoc.main(("", *args, f"-I{well_known}")) != 0:
+        raise RuntimeError(f"protoc failed: {' '.join(args)}")
+
+
+def _cache_dir():
+    """
+    Per-user cache directory for compiled proto descriptors.
+    """
+    if "TRUFFLE_CACHE_DIR" in os.environ:
+        return os.environ["TRUFFLE_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "truffle", "protos")
+
+
+# Compiled descriptor sets by proto content hash, for repeated starts in-process
+_descriptor_sets = {}
+
+
+def compile_proto(proto_content):
+    """
+    Compile .proto source into a serialized ``FileDescriptorSet``.
+
+    Results are cached in memory and on disk, keyed by a hash of the source,
+    so protoc only runs the first time a given tool schema is seen. If the
+    cache directory is not writable the descriptors are still returned, just
+    not persisted. A cached file that does not parse is replaced.
+    """
+    import hashlib
+
+    digest = hashlib.sha256(proto_content.encode()).hexdigest()
+    if digest in _descriptor_sets:
+        return _descriptor_sets[digest]
+
+    cache_path = os.path.join(_cache_dir(), f"{digest}.pb")
+    descriptor_set = _read_cached(cache_path)
+    if descriptor_set is None:
+        descriptor_set = _run_protoc_descriptor_set(proto_content)
+        _write_cached(cache_path, descriptor_set)
+
+    _descriptor_sets[digest] = descriptor_set
+    return descriptor_set
+
+
+def _read_cached(cache_path):
+    from google.protobuf import descriptor_pb2
+    from google.protobuf.message import DecodeError
+
+    try:
+        with open(cache_path, "rb") as f:
+            descriptor_set = f.read()
+    except OSError:
+        return None
+    try:
+        descriptor_pb2.FileDescriptorSet.FromString(descriptor_set)
+    except DecodeError:
+        # Truncated or corrupted: drop it so that it is compiled again
+        try:
+            os.remove(cache_path)
+        except OSError:
+            pass
+        return None
+    return descriptor_set
+
+
+def _run_protoc_descriptor_set(proto_content):
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        proto_path = os.path.join(tmp_dir, "truffle.proto")
+        out_path = os.path.join(tmp_dir, "truffle.pb")
+        with open(proto_path, "w") as f:
+            f.write(proto_content)
+        _run_protoc(
+            f"-I{tmp_dir}",
+            f"--descriptor_set_out={out_path}",
+            "--include_imports",
+            proto_path,
+        )
+        with open(out_path, "rb") as f:
+            return f.read()
+
+
+def _write_cached(cache_path, descriptor_set):
+    import tempfile
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # Write then rename so concurrent starts never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(descriptor_set)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    finally:
+        # Left behind only if the write or the rename failed
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def load_proto_messages(descriptor_set):
+    """
+    Build message classes from a serialized ``FileDescriptorSet``.
+
+    The descriptors are loaded into a private pool, so several apps can be
+    served from the same process without their ``truffle`` packages clashing.
+
+    Returns:
+        A dict mapping message names to generated message classes.
+    """
+    from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+    file_set = descriptor_pb2.FileDescriptorSet.FromString(descriptor_set)
+    pool = descriptor_pool.DescriptorPool()
+    for file_proto in file_set.file:
+        pool.Add(file_proto)
+
+    messages = {}
+    for file_proto in file_set.file:
+        if file_proto.package != "truffle":
+            # Imported well-known types
+            continue
+        file_descriptor = pool.FindFileByName(file_proto.name)
+        for name, descriptor in file_descriptor.message_types_by_name.items():
+            messages[name] = message_factory.GetMessageClass(descriptor)
+    return messages
@@ -0,0 +1,173 @@
+import inspect
+from collections.abc import Mapping
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import Any, Callable, NamedTuple, Optional
+
+
+class ToolParameter(NamedTuple):
+    name: str
+    annotation: Any
+
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """
+    Everything the servers need to know about one tool, computed once when
+    the app class is created.
+
+    ``tensor_params`` names the ``np.ndarray`` parameters, which travel as
+    binary tensors.
+    """
+
+    name: str
+    attr_name: str
+    function: Callable
+    signature: inspect.Signature
+    parameters: tuple
+    return_type: Any
+    tensor_params: tuple
+    stream: bool
+    is_async: bool
+
+    @cached_property
+    def request_model(self) -> Optional[type]:
+        """
+        Pydantic model validating REST request bodies, or ``None`` for tools
+        without parameters. Built on first use, as only the REST server
+        needs it.
+        """
+        import stringcase
+        from pydantic import create_model
+
+        if not self.parameters:
+            return None
+        fields = {}
+        for param in self.parameters:
+            annotation = param.annotation
+            if param.name in self.tensor_params:
+                from truffle_python_sdk.tensor import NDArray
+
+                annotation = NDArray
+            fields[param.name] = (annotation, ...)
+        return create_model(f"{stringcase.capitalcase(self.name)}Request", **fields)
+
+    @cached_property
+    def serializer(self) -> Callable:
+        """
+        Function converting this tool's results (or streamed chunks) into
+        JSON-ready values. Built on first use.
+        """
+        from truffle_python_sdk._serializers import compile_serializer
+
+        return compile_serializer(self.return_type)
+
+    @cached_property
+    def native_serializer(self) -> Callable:
+        """
+        Like ``serializer``, but leaves numpy arrays for an encoder that
+        writes them directly.
+        """
+        from truffle_python_sdk._serializers import compile_serializer
+
+        return compile_serializer(self.return_type, numpy_native=True)
+
+
+class ToolRegistry(Mapping):
+    """
+    Immutable mapping of tool name to ``ToolSpec`` for one app class.
+    """
+
+    def __init__(self, tools: dict, app_class: type = None):
+        self._tools = MappingProxyType(dict(tools))
+        self.app_class = app_class
+
+    def __getitem__(self, name):
+        return self._tools[name]
+
+    def __iter__(self):
+        return iter(self._tools)
+
+    def __len__(self):
+        return len(self._tools)
+
+    def __repr__(self):
+        return f"ToolRegistry({list(self._tools)})"
+
+    @cached_property
+    def schema(self):
+        """
+        The compiled ``ProtoSchema`` for these tools: the .proto source and
+        the converters between Python values and its messages.
+        """
+        from truffle_python_sdk._schema import ProtoSchema
+
+        return ProtoSchema(self.values(), app_class=self.app_class)
+
+    @property
+    def proto(self):
+        """The .proto schema for these tools."""
+        return self.schema.text
+
+
+def build_tool_spec(attr_name: str, func: Callable) -> ToolSpec:
+    from truffle_python_sdk.utils import is_ndarray, stream_item_type
+
+    tool_name = func.__truffle_tool__["name"]
+    stream = func.__truffle_tool__.get("stream", False)
+    try:
+        sig = inspect.signature(func, eval_str=True)
+    except NameError:
+        sig = inspect.signature(func)
+    parameters = list(sig.parameters.values())[1:]  # Exclude 'self'
+    return_type = sig.return_annotation
+    if stream:
+        # Streaming tools are described by the type of each chunk
+        return_type = stream_item_type(return_type)
+
+    # Collect parameter info
+    param_list = []
+    tensor_params = []
+    for param in parameters:
+        param_annotation = (
+            param.annotation if param.annotation != inspect.Parameter.empty else str
+        )
+        param_list.append(ToolParameter(param.name, param_annotation))
+        if is_ndarray(param_annotation):
+            tensor_params.append(param.name)
+
+    return ToolSpec(
+        name=tool_name,
+        attr_name=attr_name,
+        function=func,
+        signature=sig,
+        parameters=tuple(param_list),
+        return_type=return_type,
+        tensor_params=tuple(tensor_params),
+        stream=stream,
+        is_async=inspect.iscoroutinefunction(func),
+    )
+
+
+def build_tool_registry(cls) -> ToolRegistry:
+    """
+    Collect the ``@tool`` methods defined on ``cls`` and its bases.
+
+    Only class namespaces are inspected, so nothing is looked up on instances
+    and pydantic internals are never touched. Methods overridden in a
+    subclass replace the base class tool.
+    """
+    by_attr = {}
+    for klass in reversed(cls.__mro__):
+        for attr_name, attr in vars(klass).items():
+            if callable(attr) and hasattr(attr, "__truffle_tool__"):
+                by_attr[attr_name] = attr
+            else:
+                by_attr.pop(attr_name, None)
+
+    tools = {}
+    for attr_name, func in by_attr.items():
+        spec = build_tool_spec(attr_name, func)
+        tools[spec.name] = spec
+    return ToolRegistry(tools, app_class=cls)
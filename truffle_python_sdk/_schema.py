@@ -0,0 +1,914 @@
+"""
+Compiles tool signatures into a protobuf schema, together with the
+converters that move values between Python and the generated messages.
+
+Every annotation gets a precise wire type: ``int`` is ``int64``, ``float`` is
+``double``, pydantic models and dataclasses are messages, enums are enums,
+``Optional`` is a proto3 ``optional`` field, ``Union`` is a ``oneof``,
+``datetime``/``timedelta`` are ``Timestamp``/``Duration``, fixed-length tuples
+are messages and ``np.ndarray`` is a ``Tensor``. Only values without a
+precise type (``Any``, unannotated values, unknown classes) travel as a
+``google.protobuf.Value``. Shapes protobuf cannot express directly, such as
+lists of lists or lists of optional values, are wrapped in generated
+messages.
+"""
+
+import collections.abc
+import dataclasses
+import datetime
+import enum
+import inspect
+import operator
+import re
+import types
+import typing
+from typing import Annotated, Any, Literal, Union, get_args, get_origin
+
+from truffle_python_sdk.utils import is_model, is_ndarray
+
+_SCALARS = {
+    bool: ("bool", "Bool"),
+    int: ("int64", "Int64"),
+    float: ("double", "Double"),
+    str: ("string", "String"),
+    bytes: ("bytes", "Bytes"),
+}
+
+# Scalar types protobuf accepts as map keys
+_MAP_KEYS = ("bool", "int64", "string")
+
+_SEQUENCES = (
+    list,
+    set,
+    frozenset,
+    collections.abc.Sequence,
+    collections.abc.MutableSequence,
+    collections.abc.Set,
+    collections.abc.MutableSet,
+    collections.abc.Collection,
+    collections.abc.Iterable,
+)
+_MAPPINGS = (dict, collections.abc.Mapping, collections.abc.MutableMapping)
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+_IMPORTS = {
+    "google.protobuf.Timestamp": "google/protobuf/timestamp.proto",
+    "google.protobuf.Duration": "google/protobuf/duration.proto",
+    "google.protobuf.Value": "google/protobuf/struct.proto",
+}
+
+
+class _Type:
+    """
+    How values of one annotation travel.
+
+    ``proto`` is the protobuf type of a field holding them and ``label`` a
+    name for it in generated message and field names. ``shape`` says what a
+    field of this type looks like: ``single``, or one of ``repeated``,
+    ``map``, ``optional`` and ``oneof``, which only fit directly in a message
+    and are wrapped when nested. ``encode`` converts a Python value into what
+    the message constructor accepts for the field and ``decode`` converts the
+    field back; ``None`` means values are passed on as they are.
+    """
+
+    __slots__ = ("proto", "label", "shape", "encode", "decode", "arms")
+
+    def __init__(self, proto, label, shape="single", encode=None, decode=None):
+        self.proto = proto
+        self.label = label
+        self.shape = shape
+        self.encode = encode
+        self.decode = decode
+        # The ``_Arm`` of each member of a oneof
+        self.arms = None
+
+
+class _Field:
+    """
+    One field (or ``oneof``) of a generated message, numbered from
+    ``number``. ``read`` returns its value from a message and ``write`` adds
+    a value to the keyword arguments of a message constructor.
+    """
+
+    def __init__(self, name: str, number: int, compiled: _Type):
+        self.name = name
+        self.type = compiled
+        self.plain = False
+        shape = compiled.shape
+
+        if shape == "oneof":
+            self.members = []
+            exact = {}
+            matchers = []
+            for arm_number, arm in enumerate(compiled.arms, start=number):
+                member = f"{name}_{_snake(arm.type.label)}"
+                self.members.append((member, arm.type, arm_number))
+                entry = (member, arm.type.encode)
+                for exact_type in arm.exact:
+                    exact.setdefault(exact_type, entry)
+                matchers.append((arm.matches, entry))
+            self.size = len(self.members)
+            decoders = {member: arm_type.decode for member, arm_type, _ in self.members}
+
+            def read(message):
+                member = message.WhichOneof(name)
+                if member is None:
+                    return None
+                decode = decoders[member]
+                value = getattr(message, member)
+                return value if decode is None else decode(value)
+
+            def write(value, fields):
+                if value is None:
+                    return
+                entry = exact.get(type(value))
+                if entry is None:
+                    for matches, candidate in matchers:
+                        if matches(value):
+                            entry = candidate
+                            break
+                    else:
+                        raise TypeError(
+                            f"{name}: {type(value).__name__} is not one of "
+                            + ", ".join(arm.type.label for arm in compiled.arms)
+                        )
+                member, encode = entry
+                fields[member] = value if encode is None else encode(value)
+
+            self.read = read
+            self.write = write
+            return
+
+        self.size = 1
+        self.number = number
+        decode = compiled.decode
+        encode = compiled.encode
+
+        if shape == "optional":
+
+            def read(message):
+                if not message.HasField(name):
+                    return None
+                value = getattr(message, name)
+                return value if decode is None else decode(value)
+
+        elif decode is None:
+            self.plain = True
+            read = operator.attrgetter(name)
+        else:
+
+            def read(message):
+                return decode(getattr(message, name))
+
+        if encode is None:
+
+            def write(value, fields):
+                if value is not None:
+                    fields[name] = value
+
+        else:
+
+            def write(value, fields):
+                if value is not None:
+                    fields[name] = encode(value)
+
+        self.read = read
+        self.write = write
+
+    def lines(self) -> list:
+        if self.type.shape == "oneof":
+            lines = [f"  oneof {self.name} {{"]
+            for member, arm_type, number in self.members:
+                lines.append(f"    {arm_type.proto} {member} = {number};")
+            return lines + ["  }"]
+        prefix = {"repeated": "repeated ", "optional": "optional "}.get(
+            self.type.shape, ""
+        )
+        return [f"  {prefix}{self.type.proto} {self.name} = {self.number};"]
+
+
+class _Arm:
+    """A member of a ``Union``: its type and how to recognise its values."""
+
+    def __init__(self, compiled: _Type, exact: tuple, matches):
+        self.type = compiled
+        self.exact = exact
+        self.matches = matches
+
+
+class ToolCodec:
+    """
+    Converters for one tool's request and response messages.
+
+    ``arguments(request)`` returns the tool's arguments from a request as a
+    tuple in parameter order; ``responder(response_class)`` builds a function
+    turning a result (or a streamed chunk) into a response message. The
+    client side is ``request_fields(kwargs)``, the keyword arguments of the
+    request message for a call, and ``result(response)``.
+    """
+
+    def __init__(self, params: list, result: _Field):
+        self.params = params
+        self.result_field = result
+
+        if not params:
+            self.arguments = lambda request: ()
+        elif all(field.plain for field in params):
+            # Fields are read as they are; repeated ones are not copied
+            getter = operator.attrgetter(*(field.name for field in params))
+            if len(params) == 1:
+                self.arguments = lambda request: (getter(request),)
+            else:
+                self.arguments = getter
+        else:
+            readers = tuple(field.read for field in params)
+            self.arguments = lambda request: tuple(read(request) for read in readers)
+
+    def responder(self, response_class):
+        field = self.result_field
+        if field.type.shape in ("single", "repeated", "map"):
+            encode = field.type.encode
+            if encode is None:
+                return lambda value: response_class(result=value)
+            return lambda value: response_class(
+                result=None if value is None else encode(value)
+            )
+        write = field.write
+
+        def respond(value):
+            fields = {}
+            write(value, fields)
+            return response_class(**fields)
+
+        return respond
+
+    def request_fields(self, kwargs: dict) -> dict:
+        fields = {}
+        for field in self.params:
+            field.write(kwargs.get(field.name), fields)
+        return fields
+
+    def result(self, response):
+        return self.result_field.read(response)
+
+
+class ProtoSchema:
+    """
+    The protobuf schema of a list of tools: the ``.proto`` source as
+    ``text``, and a ``ToolCodec`` per tool in ``codecs``.
+
+    A bare ``BaseModel`` annotation, as on ``TruffleApp.save``/``load``,
+    stands for the app itself: it is compiled as ``app_class``.
+    """
+
+    def __init__(self, tools, app_class: type = None):
+        tools = list(tools)
+        self.app_class = app_class
+        self._definitions = {}
+        self._types = {}
+        self._model_names = {}
+        self._imports = set()
+        self.codecs = {}
+        # Names of the messages generated for the service itself, which user
+        # models and enums must not take
+        self._reserved = {"Tensor", *_BATCH_MESSAGES}
+        for tool in tools:
+            self._reserved.update((f"{tool.name}Request", f"{tool.name}Response"))
+
+        service = []
+        messages = {}
+        for tool in tools:
+            name = tool.name
+            # Generator tools become server-streaming RPCs
+            stream = "stream " if tool.stream else ""
+            service.append(
+                f"  rpc {name}({name}Request) returns ({stream}{name}Response);"
+            )
+
+            params = self._fields(
+                (param.name, param.annotation) for param in tool.parameters
+            )
+            result = self._fields([("result", tool.return_type)])[0]
+            messages[f"{name}Request"] = _message(f"{name}Request", params)
+            messages[f"{name}Response"] = _message(f"{name}Response", [result])
+            self.codecs[name] = ToolCodec(params, result)
+
+        # Unary tools can also be called several at a time
+        batch_tools = _batch_tools(tools)
+        if batch_tools:
+            service.append("  rpc Batch(BatchRequest) returns (BatchResponse);")
+            messages.update(_batch_messages(batch_tools))
+
+        lines = ['syntax = "proto3";', "", "package truffle;", ""]
+        for path in sorted(self._imports):
+            lines.append(f'import "{path}";')
+        if self._imports:
+            lines.append("")
+        lines += ["service Truffle {"] + service + ["}"]
+        for definition in list(messages.values()) + list(self._definitions.values()):
+            lines.append("")
+            lines.append(definition)
+        self.text = "\n".join(lines)
+
+    def _fields(self, annotations) -> list:
+        fields = []
+        number = 1
+        for name, annotation in annotations:
+            field = _Field(name, number, self.compile(annotation))
+            fields.append(field)
+            number += field.size
+        return fields
+
+    def compile(self, annotation) -> _Type:
+        """
+        The ``_Type`` of an annotation, generating the messages and enums it
+        needs.
+        """
+        try:
+            compiled = self._types.get(annotation)
+        except TypeError:
+            # Unhashable annotation metadata
+            return self._compile(annotation)
+        if compiled is None:
+            compiled = self._types[annotation] = self._compile(annotation)
+        return compiled
+
+    def _compile(self, annotation) -> _Type:
+
+        if annotation in (inspect.Signature.empty, Any, object, None, type(None)):
+            return self._value()
+        origin = get_origin(annotation)
+        args = get_args(annotation)
+
+        if origin is Annotated:
+            return self.compile(args[0])
+        if origin is Literal:
+            return self._literal(args)
+        if origin in (Union, types.UnionType):
+            return self._union(args)
+        if annotation in _SCALARS:
+            return _scalar(annotation)
+        if is_ndarray(annotation):
+            return self._tensor()
+        if annotation is datetime.datetime:
+            return self._timestamp()
+        if annotation is datetime.timedelta:
+            return self._duration()
+        if annotation in (datetime.date, datetime.time):
+            return _TYPE_ISO[annotation]
+        if inspect.isclass(annotation) and issubclass(annotation, enum.Enum):
+            return self._enum(annotation)
+        if is_model(annotation) or (
+            inspect.isclass(annotation) and dataclasses.is_dataclass(annotation)
+        ):
+            from pydantic import BaseModel
+
+            if annotation is BaseModel and self.app_class is not None:
+                return self.compile(self.app_class)
+            return self._model(annotation)
+
+        if annotation is tuple or origin is tuple:
+            if not args or (len(args) == 2 and args[1] is Ellipsis):
+                item = args[0] if args else Any
+                return self._repeated(self.compile(item), tuple)
+            if args == ((),):
+                # tuple[()]
+                return self._tuple(())
+            return self._tuple(args)
+        if annotation in _SEQUENCES or origin in _SEQUENCES:
+            item = self.compile(args[0] if args else Any)
+            container = origin if origin in (set, frozenset) else None
+            if annotation in (set, frozenset):
+                container = annotation
+            elif origin in (collections.abc.Set, collections.abc.MutableSet):
+                container = set
+            return self._repeated(item, container)
+        if annotation in _MAPPINGS or origin in _MAPPINGS:
+            key, value = args if args else (str, Any)
+            return self._map(self.compile(key), self.compile(value))
+
+        # Anything else travels as a JSON-like value
+        return self._value()
+
+    # Message and enum definitions
+
+    def _define(self, name: str, definition: str):
+        existing = self._definitions.setdefault(name, definition)
+        if existing != definition:
+            raise TypeError(f"Two different protobuf types are named {name!r}")
+
+    def _unique_name(self, cls) -> str:
+        name = self._model_names.get(cls)
+        if name is None:
+            base = re.sub(r"\W", "_", cls.__name__)
+            name = base
+            taken = {*self._model_names.values(), *self._reserved, *self._definitions}
+            number = 2
+            while name in taken:
+                name = f"{base}{number}"
+                number += 1
+            self._model_names[cls] = name
+        return name
+
+    def _single(self, compiled: _Type) -> _Type:
+        """
+        ``compiled`` itself if it can be nested in lists, maps and unions;
+        otherwise a message wrapping it in a ``value`` field.
+        """
+        if compiled.shape == "single":
+            return compiled
+        name = compiled.label
+        field = _Field("value", 1, compiled)
+        self._define(name, _message(name, [field]))
+        read = field.read
+        write = field.write
+
+        def encode(value):
+            fields = {}
+            write(value, fields)
+            return fields
+
+        return _Type(name, name, encode=encode, decode=read)
+
+    def _literal(self, args) -> _Type:
+        kinds = {type(arg) for arg in args}
+        if len(kinds) == 1 and next(iter(kinds)) in _SCALARS:
+            return _scalar(next(iter(kinds)))
+        return self._value()
+
+    def _union(self, args) -> _Type:
+        arms = [arg for arg in args if arg is not type(None)]
+        nullable = len(arms) < len(args)
+        if len(arms) == 1:
+            inner = self.compile(arms[0])
+            if not nullable:
+                return inner
+            if inner.shape != "single":
+                # Lists, maps and unions already read back empty
+                return inner
+            optional = _Type(inner.proto, "Optional" + inner.label, "optional")
+            optional.encode = inner.encode
+            optional.decode = inner.decode
+            return optional
+        if not arms:
+            return self._value()
+
+        compiled = _Type(None, "Or".join(self.compile(arm).label for arm in arms))
+        compiled.shape = "oneof"
+        compiled.arms = [
+            _Arm(self._single(self.compile(arm)), *_matcher(arm)) for arm in arms
+        ]
+        return compiled
+
+    def _repeated(self, item: _Type, container=None) -> _Type:
+        item = self._single(item)
+        compiled = _Type(item.proto, item.label + "List", "repeated")
+        encode = item.encode
+        decode = item.decode
+
+        if item.proto in _SCALAR_PROTOS:
+
+            def encode_list(value):
+                if type(value) is list:
+                    return value
+                if hasattr(value, "tolist"):
+                    # numpy arrays convert to Python scalars in C
+                    return value.tolist()
+                return [encode(item) for item in value]
+
+        elif encode is None:
+            encode_list = list
+        else:
+
+            def encode_list(value):
+                return [encode(item) for item in value]
+
+        compiled.encode = encode_list
+        if decode is None:
+            # Repeated scalars are passed on as they are, without copying
+            compiled.decode = container
+        elif container is None:
+            compiled.decode = lambda value: [decode(item) for item in value]
+        else:
+            compiled.decode = lambda value: container(decode(item) for item in value)
+        return compiled
+
+    def _map(self, key: _Type, value: _Type) -> _Type:
+        label = f"{key.label}{value.label}Map"
+        if key.shape == "single" and key.proto in _MAP_KEYS:
+            value = self._single(value)
+            compiled = _Type(f"map<{key.proto}, {value.proto}>", label, "map")
+            encode_key = key.encode
+            encode = value.encode
+            decode = value.decode
+            compiled.encode = lambda mapping: {
+                encode_key(k): v if encode is None else encode(v)
+                for k, v in mapping.items()
+            }
+            if decode is None:
+                compiled.decode = dict
+            else:
+                compiled.decode = lambda mapping: {
+                    k: decode(v) for k, v in mapping.items()
+                }
+            return compiled
+
+        # Other keys travel as a list of key/value entries
+        name = f"{key.label}{value.label}Entry"
+        key_field = _Field("key", 1, key)
+        value_field = _Field("value", 1 + key_field.size, value)
+        self._define(name, _message(name, [key_field, value_field]))
+
+        def encode_entry(item):
+            fields = {}
+            key_field.write(item[0], fields)
+            value_field.write(item[1], fields)
+            return fields
+
+        compiled = _Type(name, label, "repeated")
+        compiled.encode = lambda mapping: [encode_entry(i) for i in mapping.items()]
+        compiled.decode = lambda entries: {
+            key_field.read(entry): value_field.read(entry) for entry in entries
+        }
+        return compiled
+
+    def _tuple(self, args) -> _Type:
+        labels = [self.compile(arg).label for arg in args]
+        name = "".join(labels) + "Tuple"
+        fields = self._fields((f"item_{i}", arg) for i, arg in enumerate(args))
+        self._define(name, _message(name, fields))
+        pairs = [(field.read, field.write) for field in fields]
+
+        def encode(value):
+            out = {}
+            for (_, write), item in zip(pairs, value):
+                write(item, out)
+            return out
+
+        def decode(message):
+            return tuple(read(message) for read, _ in pairs)
+
+        return _Type(name, name, encode=encode, decode=decode)
+
+    def _enum(self, cls) -> _Type:
+        name = self._unique_name(cls)
+        prefix = _snake(name).upper()
+        members = list(cls)
+        lines = [f"enum {name} {{", f"  {prefix}_UNSPECIFIED = 0;"]
+        for number, member in enumerate(members, start=1):
+            lines.append(f"  {prefix}_{member.name.upper()} = {number};")
+        self._define(name, "\n".join(lines + ["}"]))
+
+        numbers = {member: number for number, member in enumerate(members, 1)}
+        by_number = [None] + members
+
+        def encode(value):
+            number = numbers.get(value)
+            if number is None:
+                # A raw value, such as "red" for Color.RED
+                number = numbers[cls(value)]
+            return number
+
+        def decode(number):
+            return by_number[number] if number < len(by_number) else None
+
+        return _Type(name, name, encode=encode, decode=decode)
+
+    def _model(self, cls) -> _Type:
+        name = self._unique_name(cls)
+        compiled = _Type(name, name)
+        # Registered before the fields, so that recursive models terminate
+        self._types[cls] = compiled
+
+        if is_model(cls):
+            keys = {
+                field_name: info.alias or field_name
+                for field_name, info in cls.model_fields.items()
+            }
+            annotations = [
+                (field_name, info.annotation)
+                for field_name, info in cls.model_fields.items()
+            ]
+            build = cls.model_validate
+        else:
+            hints = typing.get_type_hints(cls)
+            keys = {field.name: field.name for field in dataclasses.fields(cls)}
+            annotations = [(field_name, hints.get(field_name)) for field_name in keys]
+            build = lambda data: cls(**data)  # noqa: E731
+
+        def encode(value):
+            if not isinstance(value, cls):
+                value = build(value)
+            out = {}
+            for field_name, _, field in accessors:
+                field.write(getattr(value, field_name), out)
+            return out
+
+        def decode(message):
+            return build({key: field.read(message) for _, key, field in accessors})
+
+        # Set before the fields are compiled, for fields of the model's own type
+        compiled.encode = encode
+        compiled.decode = decode
+        fields = self._fields(annotations)
+        self._define(name, _message(name, fields))
+        accessors = [(field.name, keys[field.name], field) for field in fields]
+        return compiled
+
+    # Well-known and shared types
+
+    def _import(self, proto: str):
+        self._imports.add(_IMPORTS[proto])
+
+    def _value(self) -> _Type:
+        self._import("google.protobuf.Value")
+        return _VALUE
+
+    def _timestamp(self) -> _Type:
+        self._import("google.protobuf.Timestamp")
+        return _TIMESTAMP
+
+    def _duration(self) -> _Type:
+        self._import("google.protobuf.Duration")
+        return _DURATION
+
+    def _tensor(self) -> _Type:
+        # Arrays travel as raw bytes plus dtype and shape
+        self._define(
+            "Tensor",
+            "message Tensor {\n"
+            "  bytes data = 1;\n"
+            "  string dtype = 2;\n"
+            "  repeated int64 shape = 3;\n"
+            "}",
+        )
+        return _TENSOR
+
+
+def _message(name: str, fields: list) -> str:
+    lines = [f"message {name} {{"]
+    for field in fields:
+        lines += field.lines()
+    return "\n".join(lines + ["}"])
+
+
+def _snake(name: str) -> str:
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])", "_", name).lower()
+
+
+def _matcher(annotation):
+    """
+    The exact types and the predicate recognising values of one member of a
+    ``Union``. Exact types are tried first, so ``Union[float, int]`` keeps
+    ints as ints.
+    """
+
+    origin = get_origin(annotation)
+    if origin is Annotated:
+        return _matcher(get_args(annotation)[0])
+    if annotation in _SCALARS:
+        if annotation is bool:
+            return (bool,), lambda value: isinstance(value, bool)
+        if annotation is int:
+            return (int,), lambda value: (
+                isinstance(value, int) and not isinstance(value, bool)
+            ) or hasattr(value, "__index__")
+        if annotation is float:
+            return (float,), lambda value: isinstance(value, (int, float))
+        return (annotation,), lambda value: isinstance(value, annotation)
+    if origin is Literal:
+        values = get_args(annotation)
+        return (), lambda value: value in values
+    if is_ndarray(annotation):
+        return (), lambda value: hasattr(value, "__array__")
+    if annotation is tuple or origin is tuple:
+        return (tuple,), lambda value: isinstance(value, (tuple, list))
+    if annotation in _SEQUENCES or origin in _SEQUENCES:
+        return (list,), lambda value: isinstance(value, (list, tuple, set, frozenset))
+    if annotation in _MAPPINGS or origin in _MAPPINGS:
+        return (dict,), lambda value: isinstance(value, collections.abc.Mapping)
+    if is_model(annotation) or (
+        inspect.isclass(annotation) and dataclasses.is_dataclass(annotation)
+    ):
+        # Models can also be given as dicts of their fields
+        kinds = (annotation, collections.abc.Mapping)
+        return (annotation,), lambda value: isinstance(value, kinds)
+    if inspect.isclass(annotation) and annotation not in (Any, object):
+        return (annotation,), lambda value: isinstance(value, annotation)
+    return (), lambda value: True
+
+
+def _batch_tools(tools):
+    """
+    The tools callable through the ``Batch`` RPC: every unary tool, unless a
+    tool is itself named ``Batch``. A tool named ``error`` would clash with
+    the error field of ``BatchResult``, so it is left out.
+    """
+    if any(tool.name == "Batch" for tool in tools):
+        return []
+    return [tool for tool in tools if not tool.stream and tool.name != "error"]
+
+
+_BATCH_MESSAGES = (
+    "BatchError",
+    "BatchCall",
+    "BatchResult",
+    "BatchRequest",
+    "BatchResponse",
+)
+
+
+def _batch_messages(tools):
+    """
+    Messages of the ``Batch`` RPC. Each call holds the request of one tool
+    and each result the response of that tool, or a ``BatchError``.
+    """
+    calls = [
+        f"    {tool.name}Request {tool.name} = {number};"
+        for number, tool in enumerate(tools, start=1)
+    ]
+    results = [
+        f"    {tool.name}Response {tool.name} = {number};"
+        for number, tool in enumerate(tools, start=2)
+    ]
+    return {
+        "BatchError": (
+            "message BatchError {\n"
+            "  string code = 1;\n"
+            "  string message = 2;\n"
+            "}"
+        ),
+        "BatchCall": (
+            "message BatchCall {\n  oneof call {\n" + "\n".join(calls) + "\n  }\n}"
+        ),
+        "BatchResult": (
+            "message BatchResult {\n  oneof result {\n    BatchError error = 1;\n"
+            + "\n".join(results)
+            + "\n  }\n}"
+        ),
+        "BatchRequest": "message BatchRequest {\n  repeated BatchCall calls = 1;\n}",
+        "BatchResponse": (
+            "message BatchResponse {\n  repeated BatchResult results = 1;\n}"
+        ),
+    }
+
+
+# Scalars
+
+
+def _int(value):
+    return value if type(value) is int else int(value)
+
+
+def _float(value):
+    return value if type(value) is float else float(value)
+
+
+def _str(value):
+    return value if type(value) is str else str(value)
+
+
+def _bytes(value):
+    if type(value) is bytes:
+        return value
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+
+_SCALAR_ENCODERS = {bool: bool, int: _int, float: _float, str: _str, bytes: _bytes}
+_SCALAR_PROTOS = {proto for proto, _ in _SCALARS.values()}
+
+
+def _scalar(annotation) -> _Type:
+    proto, label = _SCALARS[annotation]
+    return _Type(proto, label, encode=_SCALAR_ENCODERS[annotation])
+
+
+# Dates and times
+
+
+def _encode_timestamp(value: datetime.datetime) -> dict:
+    if value.tzinfo is None:
+        # Naive datetimes are taken to be in UTC
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return _encode_duration(value - _EPOCH)
+
+
+def _decode_timestamp(message) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(
+        seconds=message.seconds, microseconds=message.nanos // 1000
+    )
+
+
+def _encode_duration(value: datetime.timedelta) -> dict:
+    microseconds = (value.days * 86400 + value.seconds) * 10**6 + value.microseconds
+    # Seconds and nanos must have the same sign
+    seconds, remainder = divmod(abs(microseconds), 10**6)
+    sign = -1 if microseconds < 0 else 1
+    return {"seconds": sign * seconds, "nanos": sign * remainder * 1000}
+
+
+def _decode_duration(message) -> datetime.timedelta:
+    return datetime.timedelta(
+        seconds=message.seconds, microseconds=int(message.nanos / 1000)
+    )
+
+
+_TIMESTAMP = _Type(
+    "google.protobuf.Timestamp",
+    "Timestamp",
+    encode=_encode_timestamp,
+    decode=_decode_timestamp,
+)
+_DURATION = _Type(
+    "google.protobuf.Duration",
+    "Duration",
+    encode=_encode_duration,
+    decode=_decode_duration,
+)
+_TYPE_ISO = {
+    datetime.date: _Type(
+        "string",
+        "Date",
+        encode=lambda value: value.isoformat(),
+        decode=datetime.date.fromisoformat,
+    ),
+    datetime.time: _Type(
+        "string",
+        "Time",
+        encode=lambda value: value.isoformat(),
+        decode=datetime.time.fromisoformat,
+    ),
+}
+
+
+# Tensors
+
+
+def _encode_tensor(value):
+    from truffle_python_sdk.tensor import encode_tensor
+
+    return encode_tensor(value)
+
+
+def _decode_tensor(message):
+    from truffle_python_sdk.tensor import decode_tensor
+
+    return decode_tensor(message)
+
+
+_TENSOR = _Type("Tensor", "Tensor", encode=_encode_tensor, decode=_decode_tensor)
+
+
+# JSON-like values
+
+
+def _encode_value(value) -> dict:
+    value = _plain(value)
+    if value is None:
+        return {"null_value": 0}
+    if isinstance(value, bool):
+        return {"bool_value": value}
+    if isinstance(value, (int, float)):
+        return {"number_value": value}
+    if isinstance(value, str):
+        return {"string_value": value}
+    # Struct and ListValue fields are built from plain dicts and lists
+    if isinstance(value, dict):
+        return {"struct_value": value}
+    return {"list_value": value}
+
+
+def _plain(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, collections.abc.Mapping):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [_plain(item) for item in value]
+
+    from truffle_python_sdk._utils import standardize
+
+    standardized = standardize(value)
+    if type(standardized) is type(value):
+        return str(value)
+    return _plain(standardized)
+
+
+def _decode_value(message):
+    kind = message.WhichOneof("kind")
+    if kind == "struct_value":
+        return {
+            key: _decode_value(item)
+            for key, item in message.struct_value.fields.items()
+        }
+    if kind == "list_value":
+        return [_decode_value(item) for item in message.list_value.values]
+    if kind is None or kind == "null_value":
+        return None
+    return getattr(message, kind)
+
+
+_VALUE = _Type(
+    "google.protobuf.Value", "Value", encode=_encode_value, decode=_decode_value
+)
@@ -0,0 +1,103 @@
+import inspect
+from typing import Any, List, Union, get_args, get_origin
+
+from truffle_python_sdk.utils import is_model, is_ndarray
+
+# Scalars that are already JSON/protobuf-friendly
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _generic(value):
+    from truffle_python_sdk._utils import standardize
+
+    return standardize(value)
+
+
+def _scalar(value):
+    if type(value) in _SCALARS:
+        return value
+    if hasattr(value, "item"):
+        # numpy scalars returned from a tool annotated as float
+        return value.item()
+    return _generic(value)
+
+
+def _passthrough(value):
+    return value
+
+
+def _ndarray(value):
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return _generic(value)
+
+
+def _model(value):
+    if hasattr(value, "model_dump"):
+        # Dump through the instance so subclasses keep all their fields
+        return value.model_dump(mode="json")
+    return _generic(value)
+
+
+def _scalar_list(value):
+    if type(value) is list:
+        return value
+    if hasattr(value, "tolist"):
+        # numpy arrays convert to a list of Python scalars in C
+        return value.tolist()
+    return [_scalar(item) for item in value]
+
+
+def _native_scalar_list(value):
+    if type(value) is list or hasattr(value, "tolist"):
+        # numpy arrays are left for a numpy-aware encoder
+        return value
+    return [_scalar(item) for item in value]
+
+
+def _adapter(annotation):
+    from pydantic import TypeAdapter
+
+    adapter = TypeAdapter(annotation)
+
+    def serialize(value):
+        try:
+            return adapter.dump_python(value, mode="json", warnings=False)
+        except Exception:
+            # The tool returned something its annotation does not describe
+            return _generic(value)
+
+    return serialize
+
+
+def compile_serializer(annotation, numpy_native: bool = False):
+    """
+    Build a function converting a tool result described by ``annotation``
+    into primitive Python values (str, int, float, bool, None, lists and
+    dicts) that JSON can encode.
+
+    The work of inspecting the annotation is done once, here, rather than on
+    every call. Unannotated or ``Any`` results fall back to ``standardize``.
+    With ``numpy_native``, numpy arrays are passed through untouched for an
+    encoder that serialises them directly.
+    """
+    if annotation in (inspect.Signature.empty, Any, object):
+        return _generic
+    if annotation in _SCALARS:
+        return _scalar
+    if is_ndarray(annotation):
+        return _passthrough if numpy_native else _ndarray
+    if is_model(annotation):
+        return _model
+
+    origin = get_origin(annotation)
+    args = get_args(annotation)
+    if origin in (list, List) and args and args[0] in _SCALARS:
+        return _native_scalar_list if numpy_native else _scalar_list
+    if origin is Union and all(arg in _SCALARS for arg in args):
+        return _scalar
+
+    try:
+        return _adapter(annotation)
+    except Exception:
+        return _generic
@@ -0,0 +1,29 @@
+import sys
+
+import numpy as np
+
+
+def estimate_size(value, _seen=None) -> int:
+    """
+    Rough number of bytes held by ``value`` and everything it references.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes + sys.getsizeof(value)
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if isinstance(value, dict):
+        return size + sum(
+            estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, _seen) for item in value)
+    if hasattr(value, "__dict__"):
+        return size + estimate_size(vars(value), _seen)
+    return size
@@ -0,0 +1,289 @@
+import os
+import socket
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit, urlunsplit
+
+# Seconds before a lookup that failed is tried again
+_FAILED_LOOKUP_TTL = 5.0
+
+
+class _ResolvingTransport:
+    """
+    Base class for transports that cache the resolved upstream address.
+
+    Only plain ``http`` URLs are rewritten to the resolved IP address; for
+    ``https`` the hostname is needed for SNI and certificate checks, so it is
+    left untouched.
+
+    With a ``MetricsRegistry`` as ``metrics``, the latency, size and outcome
+    of every request are recorded per upstream endpoint.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 10,
+        timeout: float | tuple = (3.05, 60.0),
+        dns_ttl: float = 300.0,
+        metrics=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.metrics = metrics
+        self._upstreams = {}
+
+        self._resolved_url = None
+        self._resolved_at = 0.0
+        self._resolved_ttl = dns_ttl
+
+    def _cached_url(self):
+        if (
+            self._resolved_url is not None
+            and time.monotonic() - self._resolved_at < self._resolved_ttl
+        ):
+            return self._resolved_url
+        return None
+
+    def _lookup_target(self):
+        """
+        Return the ``(host, port)`` to resolve, or None if the base URL
+        should be used as is.
+        """
+        parts = urlsplit(self.base_url)
+        if parts.scheme == "http" and parts.hostname:
+            return parts.hostname, parts.port or 80
+        return None
+
+    def _store_resolved(self, infos, failed: bool = False):
+        parts = urlsplit(self.base_url)
+        resolved = self.base_url
+        # Retry failed lookups soon rather than skipping DNS for the full TTL
+        self._resolved_ttl = (
+            min(self.dns_ttl, _FAILED_LOOKUP_TTL) if failed else self.dns_ttl
+        )
+        if infos:
+            family, _, _, _, sockaddr = infos[0]
+            address = sockaddr[0]
+            if family == socket.AF_INET6:
+                address = f"[{address}]"
+            resolved = urlunsplit(
+                (parts.scheme, f"{address}:{parts.port or 80}", parts.path, "", "")
+            )
+
+        self._resolved_url = resolved
+        self._resolved_at = time.monotonic()
+        return resolved
+
+    def _host_header(self):
+        return urlsplit(self.base_url).netloc
+
+    def _upstream(self, path: str):
+        if self.metrics is None:
+            return None
+        upstream = self._upstreams.get(path)
+        if upstream is None:
+            from truffle_python_sdk.metrics import UpstreamMetrics
+
+            upstream = self._upstreams[path] = UpstreamMetrics(self.metrics, path)
+        return upstream
+
+
+class HTTPTransport(_ResolvingTransport):
+    """
+    Shared HTTP transport used by the Client for upstream calls.
+
+    Wraps a single ``requests.Session`` so that connections are pooled and
+    kept alive between calls, and caches the resolved address of the upstream
+    host so that ``truffle-18008.local`` is not looked up over mDNS on every
+    request.
+    """
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+
+        self._session = None
+        self._lock = threading.Lock()
+
+        # Pooled connections must not be shared with forked worker processes
+        if hasattr(os, "register_at_fork"):
+            ref = weakref.WeakMethod(self._after_fork)
+            os.register_at_fork(after_in_child=lambda: ref() and ref()())
+
+    def _after_fork(self):
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            pool_block=True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _resolve(self):
+        """
+        Return the base URL with its host replaced by a cached IP address.
+        """
+        url = self._cached_url()
+        if url is not None:
+            return url
+
+        infos = []
+        target = self._lookup_target()
+        if target is not None:
+            try:
+                infos = socket.getaddrinfo(*target, type=socket.SOCK_STREAM)
+            except socket.gaierror:
+                pass
+        return self._store_resolved(infos, failed=target is not None and not infos)
+
+    def post(self, path: str, json=None, stream: bool = False, **kwargs):
+        """
+        POST ``json`` to ``path`` on the upstream server.
+        """
+        headers = kwargs.pop("headers", {})
+        headers.setdefault("Host", self._host_header())
+        upstream = self._upstream(path)
+        if upstream is not None:
+            start = upstream.start()
+        response = None
+        try:
+            response = self.session.post(
+                f"{self._resolve()}{path}",
+                json=json,
+                headers=headers,
+                timeout=kwargs.pop("timeout", self.timeout),
+                stream=stream,
+                **kwargs,
+            )
+            return response
+        except OSError:
+            # The cached address may have gone stale; resolve again next time.
+            self._resolved_url = None
+            raise
+        finally:
+            if upstream is not None:
+                body = response.request.body if response is not None else None
+                upstream.finish(start, response, len(body) if body else None)
+
+    def close(self):
+        """
+        Close all pooled connections.
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            self._resolved_url = None
+
+
+class AsyncHTTPTransport(_ResolvingTransport):
+    """
+    Asyncio counterpart of ``HTTPTransport`` backed by an ``httpx.AsyncClient``
+    connection pool.
+    """
+
+    def __init__(self, base_url: str, **kwargs):
+        super().__init__(base_url, **kwargs)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+
+            timeout = self.timeout
+            if isinstance(timeout, tuple):
+                connect, read = timeout
+                timeout = httpx.Timeout(read, connect=connect)
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+                timeout=timeout,
+            )
+        return self._client
+
+    async def _resolve(self):
+        import asyncio
+
+        url = self._cached_url()
+        if url is not None:
+            return url
+
+        infos = []
+        target = self._lookup_target()
+        if target is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                infos = await loop.getaddrinfo(*target, type=socket.SOCK_STREAM)
+            except socket.gaierror:
+                pass
+        return self._store_resolved(infos, failed=target is not None and not infos)
+
+    async def _request(self, path: str, json, headers: dict):
+        headers.setdefault("Host", self._host_header())
+        return self.client.build_request(
+            "POST", f"{await self._resolve()}{path}", json=json, headers=headers
+        )
+
+    async def post(self, path: str, json=None, **kwargs):
+        """
+        POST ``json`` to ``path`` on the upstream server.
+        """
+        request = await self._request(path, json, kwargs.pop("headers", {}))
+        return await self._send(path, request, stream=False)
+
+    async def _send(self, path: str, request, stream: bool):
+        import httpx
+
+        upstream = self._upstream(path)
+        if upstream is not None:
+            start = upstream.start()
+        response = None
+        try:
+            response = await self.client.send(request, stream=stream)
+            return response
+        except (OSError, httpx.TransportError):
+            self._resolved_url = None
+            raise
+        finally:
+            if upstream is not None:
+                upstream.finish(start, response, len(request.content))
+
+    async def stream(self, path: str, json=None, **kwargs):
+        """
+        POST ``json`` to ``path`` and return the response without reading
+        its body. The caller must ``aclose()`` the response.
+        """
+        request = await self._request(path, json, kwargs.pop("headers", {}))
+        return await self._send(path, request, stream=True)
+
+    async def aclose(self):
+        """
+        Close all pooled connections.
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._resolved_url = None
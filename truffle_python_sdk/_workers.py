@@ -0,0 +1,286 @@
+import hashlib
+import os
+import shutil
+import signal
+import socket
+import tempfile
+from typing import Literal
+
+# Header (REST) and metadata key (gRPC) naming the session of a call
+SESSION_HEADER = "X-Truffle-Session"
+SESSION_METADATA = "x-truffle-session"
+
+_SESSION_HEADER_KEY = SESSION_HEADER.lower().encode("latin-1")
+
+# Hop-by-hop headers that must not be copied when proxying a response
+_HOP_BY_HOP = {b"connection", b"keep-alive", b"transfer-encoding"}
+
+
+def shard_for(key: str, workers: int) -> int:
+    """
+    The worker owning ``key``. Stable across processes, unlike ``hash()``.
+    """
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % workers
+
+
+def reuseport_socket(host: str, port: int) -> socket.socket:
+    """
+    A listening TCP socket that other processes can bind to the same port.
+    The kernel spreads incoming connections across them.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerContext:
+    """
+    Where a worker process sits in a group of ``workers`` processes serving
+    the same port, and how it treats the app state.
+
+    With the ``replicated`` policy every worker has its own copy of the app
+    and calls go to whichever worker the kernel picks. With ``sharded``, a
+    call naming a session (``X-Truffle-Session`` header or
+    ``x-truffle-session`` metadata) is forwarded over a Unix socket to the
+    worker owning that session, so all calls of a session see the same state.
+    """
+
+    def __init__(
+        self,
+        worker_id: int,
+        workers: int,
+        state_policy: Literal["replicated", "sharded"],
+        socket_dir: str,
+    ):
+        self.worker_id = worker_id
+        self.workers = workers
+        self.state_policy = state_policy
+        self.socket_dir = socket_dir
+
+    def address(self, worker_id: int) -> str:
+        return os.path.join(self.socket_dir, f"worker-{worker_id}.sock")
+
+    def owner(self, key: str) -> int:
+        if self.state_policy != "sharded" or key is None:
+            return self.worker_id
+        return shard_for(key, self.workers)
+
+    def serve_rest(self, asgi_app, host: str, port: int, log_level: str):
+        import uvicorn
+
+        sockets = [reuseport_socket(host, port)]
+        if self.state_policy == "sharded":
+            asgi_app = _ShardRouter(asgi_app, self)
+            internal = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            internal.bind(self.address(self.worker_id))
+            internal.listen(2048)
+            sockets.append(internal)
+        config = uvicorn.Config(asgi_app, log_level=log_level)
+        uvicorn.Server(config).run(sockets=sockets)
+
+    def grpc_options(self) -> list:
+        return [("grpc.so_reuseport", 1)]
+
+    def grpc_interceptors(self) -> list:
+        if self.state_policy == "sharded":
+            return [_shard_interceptor(self)]
+        return []
+
+    def grpc_addresses(self, host: str, port: int) -> list:
+        addresses = [f"{host}:{port}"]
+        if self.state_policy == "sharded":
+            addresses.append(f"unix:{self.address(self.worker_id)}")
+        return addresses
+
+
+class _ShardRouter:
+    """
+    ASGI middleware forwarding requests to the worker owning their session.
+    """
+
+    def __init__(self, app, worker: WorkerContext):
+        self.app = app
+        self.worker = worker
+        self._clients = {}
+
+    def _client(self, owner: int):
+        import httpx
+
+        client = self._clients.get(owner)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=self.worker.address(owner))
+            client = httpx.AsyncClient(
+                transport=transport, base_url="http://worker", timeout=None
+            )
+            self._clients[owner] = client
+        return client
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            key = None
+            for name, value in scope["headers"]:
+                if name == _SESSION_HEADER_KEY:
+                    key = value.decode("latin-1")
+                    break
+            owner = self.worker.owner(key)
+            if owner != self.worker.worker_id:
+                return await self._forward(owner, scope, receive, send)
+        elif scope["type"] == "lifespan":
+            return await self._lifespan(scope, receive, send)
+        await self.app(scope, receive, send)
+
+    async def _lifespan(self, scope, receive, send):
+        async def send_with_cleanup(message):
+            if message["type"] == "lifespan.shutdown.complete":
+                for client in self._clients.values():
+                    await client.aclose()
+            await send(message)
+
+        await self.app(scope, receive, send_with_cleanup)
+
+    async def _forward(self, owner: int, scope, receive, send):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        path = scope.get("raw_path") or scope["path"].encode("utf-8")
+        if scope["query_string"]:
+            path += b"?" + scope["query_string"]
+        client = self._client(owner)
+        request = client.build_request(
+            scope["method"],
+            path.decode("latin-1"),
+            headers=scope["headers"],
+            content=body,
+        )
+        response = await client.send(request, stream=True)
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": [
+                        (name, value)
+                        for name, value in response.headers.raw
+                        if name.lower() not in _HOP_BY_HOP
+                    ],
+                }
+            )
+            # Relay chunks as they arrive so streaming tools keep streaming
+            async for chunk in response.aiter_raw():
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+
+def _shard_interceptor(worker: WorkerContext):
+    import grpc
+
+    class ShardInterceptor(grpc.ServerInterceptor):
+        """
+        Forwards calls to the worker owning their session, passing the
+        serialised request and responses through untouched.
+        """
+
+        def __init__(self):
+            self._channels = {}
+
+        def _channel(self, owner: int):
+            channel = self._channels.get(owner)
+            if channel is None:
+                channel = grpc.insecure_channel(f"unix:{worker.address(owner)}")
+                self._channels[owner] = channel
+            return channel
+
+        def intercept_service(self, continuation, handler_call_details):
+            metadata = handler_call_details.invocation_metadata or ()
+            key = dict(metadata).get(SESSION_METADATA)
+            owner = worker.owner(key)
+            handler = continuation(handler_call_details)
+            if owner == worker.worker_id or handler is None:
+                return handler
+
+            method = handler_call_details.method
+            channel = self._channel(owner)
+            metadata = tuple(metadata)
+
+            if handler.response_streaming:
+                call = channel.unary_stream(method)
+
+                def forward_stream(request, context):
+                    try:
+                        yield from call(request, metadata=metadata)
+                    except grpc.RpcError as e:
+                        context.abort(e.code(), e.details())
+
+                return grpc.unary_stream_rpc_method_handler(forward_stream)
+
+            call = channel.unary_unary(method)
+
+            def forward(request, context):
+                try:
+                    return call(request, metadata=metadata)
+                except grpc.RpcError as e:
+                    context.abort(e.code(), e.details())
+
+            return grpc.unary_unary_rpc_method_handler(forward)
+
+    return ShardInterceptor()
+
+
+def run_workers(
+    workers: int,
+    serve,
+    state_policy: Literal["replicated", "sharded"] = "replicated",
+):
+    """
+    Fork ``workers`` processes each running ``serve(worker_context)``, and
+    wait for them to exit. SIGINT and SIGTERM are passed on to the workers.
+    """
+    import multiprocessing
+
+    if state_policy not in ("replicated", "sharded"):
+        raise ValueError(f"Invalid state policy: {state_policy}")
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("workers > 1 requires SO_REUSEPORT support")
+
+    socket_dir = tempfile.mkdtemp(prefix="truffle-workers-")
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=serve,
+            args=(WorkerContext(i, workers, state_policy, socket_dir),),
+            name=f"truffle-worker-{i}",
+        )
+        for i in range(workers)
+    ]
+
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    previous = {
+        signum: signal.signal(signum, stop)
+        for signum in (signal.SIGINT, signal.SIGTERM)
+    }
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+        shutil.rmtree(socket_dir, ignore_errors=True)
@@ -0,0 +1,285 @@
+import threading
+from typing import List
+
+import numpy as np
+
+from truffle_python_sdk.vector_store import (
+    SearchResult,
+    VectorStore,
+    normalize_rows,
+    top_k,
+)
+
+
+def spherical_kmeans(vectors: np.ndarray, n_clusters: int, n_iter: int = 10, seed=0):
+    """
+    Cluster unit-length ``vectors`` by cosine similarity. Returns the
+    (unit-length) centroids, one per row.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        # Restart empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class IVFIndex(VectorStore):
+    """
+    Approximate nearest-neighbour index over embeddings (inverted file).
+
+    Vectors are stored like in ``VectorStore``, and additionally grouped into
+    ``n_lists`` clusters found by k-means. A search only scores the vectors in
+    the ``nprobe`` clusters whose centroids are closest to the query, so its
+    cost grows with ``N * nprobe / n_lists`` instead of ``N``. Raising
+    ``nprobe`` trades latency for recall; ``nprobe == n_lists`` is an exact
+    search.
+
+    Until the index holds ``min_train_size`` vectors it searches exactly. It
+    then trains itself on the first search (call ``train()`` up front to
+    keep that out of a request); vectors added afterwards go straight into
+    the list of their nearest centroid. Call ``train()`` again to re-cluster
+    after the data has changed a lot. Deleted vectors are dropped from the
+    lists once they make up more than ``compact_fraction`` of them.
+    """
+
+    def __init__(
+        self,
+        dim: int = None,
+        n_lists: int = None,
+        nprobe: int = 8,
+        min_train_size: int = 10_000,
+        capacity: int = 1024,
+        seed: int = 0,
+        compact_fraction: float = 0.2,
+    ):
+        """
+        Args:
+            dim: Dimension of the vectors. Inferred from the first vector
+                added if not given.
+            n_lists: Number of clusters. Defaults to ``4 * sqrt(N)`` when the
+                index is trained.
+            nprobe: Number of clusters scored per search.
+            min_train_size: Number of vectors needed before the index is
+                trained; smaller indexes are searched exactly.
+            capacity: Number of rows to allocate up front.
+            seed: Seed for the k-means initialisation.
+            compact_fraction: Fraction of deleted vectors in the lists above
+                which the lists are compacted.
+        """
+        super().__init__(dim=dim, capacity=capacity)
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.seed = seed
+        self.compact_fraction = compact_fraction
+        self._deleted = np.zeros(0, dtype=bool)
+        self._n_deleted = 0
+        # (centroids, lists, list sizes), replaced as a whole when training
+        # so that searches never see the lists of other centroids
+        self._clusters = None
+        # Deleted vectors still in the lists
+        self._tombstones = 0
+        # Serialises training, compaction and appends to the lists
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size - self._n_deleted
+
+    def __getstate__(self):
+        # Locks cannot be copied or pickled; copies get a lock of their own
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def centroids(self):
+        return None if self._clusters is None else self._clusters[0]
+
+    @property
+    def is_trained(self) -> bool:
+        return self._clusters is not None
+
+    def add_many(self, vectors, texts: List[str], metadata: List[dict] = None):
+        ids = super().add_many(vectors, texts, metadata)
+        if not ids:
+            return ids
+        if self._deleted.shape[0] < self._matrix.shape[0]:
+            deleted = np.zeros(self._matrix.shape[0], dtype=bool)
+            deleted[: self._deleted.shape[0]] = self._deleted
+            self._deleted = deleted
+        if self.is_trained:
+            with self._lock:
+                self._assign(self._clusters, np.asarray(ids))
+        return ids
+
+    def delete(self, index: int):
+        """
+        Remove the vector at ``index`` from search results. Row indices of
+        other vectors do not change.
+        """
+        if not 0 <= index < self._size:
+            raise IndexError(f"No vector at index {index}")
+        if not self._deleted[index]:
+            self._deleted[index] = True
+            self._n_deleted += 1
+            if self.is_trained:
+                self._tombstones += 1
+                if self._tombstones > self.compact_fraction * self._size:
+                    self._compact()
+
+    def train(self, sample_size: int = None):
+        """
+        Cluster the stored vectors and rebuild the inverted lists.
+        """
+        with self._lock:
+            self._train(sample_size)
+
+    def _train(self, sample_size: int = None):
+        alive = np.flatnonzero(~self._deleted[: self._size])
+        if len(alive) == 0:
+            raise ValueError("Cannot train an empty index")
+        n_lists = self.n_lists or max(1, int(4 * np.sqrt(len(alive))))
+        sample_size = sample_size or 256 * n_lists
+        rng = np.random.default_rng(self.seed)
+        sample = alive
+        if len(alive) > sample_size:
+            sample = np.sort(rng.choice(alive, sample_size, replace=False))
+        centroids = spherical_kmeans(self._matrix[sample], n_lists, seed=self.seed)
+        clusters = (
+            centroids,
+            [np.empty(16, dtype=np.int64) for _ in range(len(centroids))],
+            np.zeros(len(centroids), dtype=np.int64),
+        )
+        self._assign(clusters, alive)
+        self.n_lists = len(centroids)
+        self._tombstones = 0
+        self._clusters = clusters
+
+    def _assign(self, clusters: tuple, ids: np.ndarray, chunk_size: int = 65536):
+        centroids = clusters[0]
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start : start + chunk_size]
+            assignments = np.argmax(self._matrix[chunk] @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind="stable")
+            lists, starts = np.unique(assignments[order], return_index=True)
+            for list_id, members in zip(lists, np.split(chunk[order], starts[1:])):
+                self._append_to_list(clusters, list_id, members)
+
+    @staticmethod
+    def _append_to_list(clusters: tuple, list_id: int, ids: np.ndarray):
+        _, lists, sizes = clusters
+        size = sizes[list_id]
+        needed = size + len(ids)
+        if needed > len(lists[list_id]):
+            grown = np.empty(max(needed, 2 * len(lists[list_id])), np.int64)
+            grown[:size] = lists[list_id][:size]
+            lists[list_id] = grown
+        lists[list_id][size:needed] = ids
+        sizes[list_id] = needed
+
+    def _compact(self):
+        # Drop deleted vectors from the lists, so searches stop scoring them
+        with self._lock:
+            centroids, lists, sizes = self._clusters
+            compacted = []
+            for members in (lists[i][: sizes[i]] for i in range(len(lists))):
+                compacted.append(members[~self._deleted[members]])
+            new_sizes = np.array([len(members) for members in compacted], np.int64)
+            self._tombstones = 0
+            self._clusters = (centroids, compacted, new_sizes)
+
+    def _candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        centroids, lists, sizes = self._clusters
+        probes = top_k(centroids @ query, nprobe)
+        candidates = np.concatenate([lists[i][: sizes[i]] for i in probes])
+        return candidates[~self._deleted[candidates]]
+
+    def search(self, query, k: int = 3, nprobe: int = None) -> List[SearchResult]:
+        """
+        Return about the ``k`` stored entries most similar to ``query``, best
+        first, scoring ``nprobe`` clusters.
+        """
+        return self.search_many([query], k, nprobe)[0]
+
+    def search_many(
+        self, queries, k: int = 3, nprobe: int = None
+    ) -> List[List[SearchResult]]:
+        if len(self) == 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._as_matrix(queries)
+        if not self.is_trained and len(self) >= self.min_train_size:
+            with self._lock:
+                # Concurrent first searches train only once
+                if not self.is_trained:
+                    self._train()
+
+        if not self.is_trained:
+            # Small indexes are scanned exactly
+            scores = queries @ self.vectors.T
+            scores[:, self._deleted[: self._size]] = -np.inf
+            indices = top_k(scores, min(k, len(self)))
+            return [
+                self._results(row_scores[row], row)
+                for row_scores, row in zip(scores, indices)
+            ]
+
+        nprobe = nprobe or self.nprobe
+        results = []
+        for query in queries:
+            candidates = self._candidates(query, nprobe)
+            scores = self._matrix[candidates] @ query
+            best = top_k(scores, k)
+            results.append(self._results(scores[best], candidates[best]))
+        return results
+
+    def _results(self, scores, indices) -> List[SearchResult]:
+        return [
+            SearchResult(float(score), int(i), self.texts[i], self.metadata[i])
+            for score, i in zip(scores, indices)
+        ]
+
+    @property
+    def snapshot_version(self):
+        settings = (self.n_lists, self.nprobe, self.min_train_size)
+        return super().snapshot_version + settings + (self._n_deleted,)
+
+    def to_dict(self) -> dict:
+        data = super().to_dict()
+        data.update(
+            n_lists=self.n_lists,
+            nprobe=self.nprobe,
+            min_train_size=self.min_train_size,
+            seed=self.seed,
+            compact_fraction=self.compact_fraction,
+            deleted=np.flatnonzero(self._deleted[: self._size]).tolist(),
+        )
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IVFIndex":
+        index = cls(
+            dim=data.get("dim"),
+            n_lists=data.get("n_lists"),
+            nprobe=data.get("nprobe", 8),
+            min_train_size=data.get("min_train_size", 10_000),
+            seed=data.get("seed", 0),
+            compact_fraction=data.get("compact_fraction", 0.2),
+        )
+        vectors = data.get("vectors")
+        if vectors is not None and len(data.get("texts", [])):
+            index.add_many(vectors, data["texts"], data.get("metadata"))
+        for i in data.get("deleted", []):
+            index.delete(i)
+        return index
@@ -1,13 +1,61 @@
-from typing import TYPE_CHECKING
+import threading
+from typing import TYPE_CHECKING, ClassVar
 from pydantic import BaseModel, PrivateAttr
 
 from truffle_python_sdk.utils import tool
+from truffle_python_sdk._registry import ToolRegistry, build_tool_registry
 
 if TYPE_CHECKING:
     from truffle_python_sdk.client import Client
 
+
+class _StateLock:
+    """
+    A reentrant lock that copies and pickles as a fresh lock, and compares
+    equal to any other, so apps still copy and compare by their fields.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._lock.__exit__(*exc_info)
+
+    def __eq__(self, other):
+        return isinstance(other, _StateLock)
+
+    __hash__ = object.__hash__
+
+    def __deepcopy__(self, memo):
+        return _StateLock()
+
+    def __reduce__(self):
+        return _StateLock, ()
+
+
 class TruffleApp(BaseModel):
     _client: "Client" = PrivateAttr()
+    _state_lock: _StateLock = PrivateAttr(default_factory=_StateLock)
+
+    # Tools of the class, built once when the class is created
+    __truffle_tools__: ClassVar[ToolRegistry]
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        super().__pydantic_init_subclass__(**kwargs)
+        cls.__truffle_tools__ = build_tool_registry(cls)
+
+    @property
+    def state_lock(self):
+        """
+        Reentrant lock held while the app's fields are read for a snapshot.
+        Tools that update several fields together can hold it, so that no
+        checkpoint sees half of the update.
+        """
+        return self._state_lock
 
     @tool()
     def save(self) -> BaseModel:
@@ -16,3 +64,6 @@ class TruffleApp(BaseModel):
     @tool()
     def load(self, state: BaseModel):
         self.__dict__.update(state.__dict__)
+
+
+TruffleApp.__truffle_tools__ = build_tool_registry(TruffleApp)
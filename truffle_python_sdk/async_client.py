@@ -0,0 +1,253 @@
+import asyncio
+import json
+
+
+class AsyncClient:
+    """
+    Asyncio client for the Truffle inference server.
+
+    Mirrors the ``completion``/``embed`` API of ``Client`` for use from
+    ``async def`` tools, so that several upstream calls can be in flight at
+    once without tying up a thread each::
+
+        docs, answer = await asyncio.gather(
+            self._client.aio.embed(message),
+            self._client.aio.completion(prompt),
+        )
+    """
+
+    truffle_magic_number = 18008
+
+    def __init__(
+        self,
+        base_url: str = None,
+        pool_size: int = 10,
+        timeout: float | tuple = (3.05, 60.0),
+        dns_ttl: float = 300.0,
+        cache=None,
+        metrics=True,
+    ):
+        """
+        Args:
+            base_url: URL of the Truffle inference server. Defaults to the
+                local Truffle computer.
+            pool_size: Maximum number of pooled keep-alive connections.
+            timeout: Request timeout in seconds, or a ``(connect, read)`` tuple.
+            dns_ttl: Seconds to cache the resolved upstream address.
+            cache: A ``ResponseCache`` caching embeddings, and completions
+                requested with ``temperature=0``.
+            metrics: ``MetricsRegistry`` recording upstream request metrics,
+                the default registry if ``True``, or ``None`` for none.
+        """
+        from truffle_python_sdk._transport import AsyncHTTPTransport
+        from truffle_python_sdk.metrics import as_registry
+
+        self._base_url = base_url
+        self.pool_size = pool_size
+        self.cache = cache
+        self.metrics = as_registry(metrics)
+        self.transport = AsyncHTTPTransport(
+            self.base_url,
+            pool_size=pool_size,
+            timeout=timeout,
+            dns_ttl=dns_ttl,
+            metrics=self.metrics,
+        )
+
+    @property
+    def base_url(self):
+        if self._base_url is not None:
+            return self._base_url
+        return f"http://truffle-{self.truffle_magic_number}.local"
+
+    async def aclose(self):
+        """
+        Close the pooled upstream connections held by this client.
+        """
+        await self.transport.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def completion(
+        self,
+        input: str,
+        model: str = "meta-llama/Llama-3.2-1b-instruct",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
+        stop: list = None,
+        top_k: int = 40,
+        repeat_penalty: float = 1.1,
+    ):
+        payload = {
+            "model": model,
+            "prompt": input,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+            "stop": stop,
+            "top_k": top_k,
+            "repeat_penalty": repeat_penalty,
+        }
+        # Only greedy (temperature 0) completions are deterministic
+        if self.cache is not None and temperature == 0:
+            key = self.cache.key("/v1/completions", payload)
+            return await self.cache.aget_or_compute(
+                key, lambda: self._complete(payload)
+            )
+        return await self._complete(payload)
+
+    async def _complete(self, payload: dict):
+        response = await self.transport.post("/v1/completions", json=payload)
+        response.raise_for_status()
+        return response.json()["choices"][0]["text"]
+
+    async def stream_completion(
+        self,
+        input: str,
+        model: str = "meta-llama/Llama-3.2-1b-instruct",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
+        stop: list = None,
+        top_k: int = 40,
+        repeat_penalty: float = 1.1,
+    ):
+        """
+        Like ``completion``, but yields the generated text chunk by chunk as
+        the server produces it.
+        """
+        response = await self.transport.stream(
+            "/v1/completions",
+            json={
+                "model": model,
+                "prompt": input,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "top_p": top_p,
+                "frequency_penalty": frequency_penalty,
+                "presence_penalty": presence_penalty,
+                "stop": stop,
+                "top_k": top_k,
+                "repeat_penalty": repeat_penalty,
+                "stream": True,
+            },
+        )
+        try:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: only "data:" lines carry payloads
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["text"]
+                if text:
+                    yield text
+        finally:
+            await response.aclose()
+
+    async def embed(
+        self,
+        input: str,
+        model: str = "meta-llama/Llama-3.2-1b",
+        encoding_format: str = "float",
+        normalize: bool = True,
+    ):
+        if self.cache is not None:
+            from truffle_python_sdk.client import _embedding_key
+
+            key = _embedding_key(self.cache, input, model, encoding_format, normalize)
+            return await self.cache.aget_or_compute(
+                key, lambda: self._embed(input, model, encoding_format, normalize)
+            )
+        return await self._embed(input, model, encoding_format, normalize)
+
+    async def _embed(
+        self, input: str, model: str, encoding_format: str, normalize: bool
+    ):
+        embeddings = await self._embed_batch([input], model, encoding_format, normalize)
+        return embeddings[0]
+
+    async def embed_many(
+        self,
+        inputs: list,
+        model: str = "meta-llama/Llama-3.2-1b",
+        encoding_format: str = "float",
+        normalize: bool = True,
+        batch_size: int = 64,
+    ):
+        """
+        Embed a list of strings, sending them upstream in chunks of
+        ``batch_size`` that run concurrently.
+
+        Returns:
+            One embedding per input, in input order.
+        """
+        inputs = list(inputs)
+        if self.cache is None:
+            return await self._embed_many(
+                inputs, model, encoding_format, normalize, batch_size
+            )
+
+        # Only send the inputs that are not cached
+        from truffle_python_sdk.cache import MISSING
+        from truffle_python_sdk.client import _embedding_key
+
+        keys = [
+            _embedding_key(self.cache, input, model, encoding_format, normalize)
+            for input in inputs
+        ]
+        embeddings = [self.cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is MISSING]
+        fetched = await self._embed_many(
+            [inputs[i] for i in missing], model, encoding_format, normalize, batch_size
+        )
+        for i, embedding in zip(missing, fetched):
+            self.cache.set(keys[i], embedding)
+            embeddings[i] = embedding
+        return embeddings
+
+    async def _embed_many(
+        self,
+        inputs: list,
+        model: str,
+        encoding_format: str,
+        normalize: bool,
+        batch_size: int,
+    ):
+        chunks = [inputs[i : i + batch_size] for i in range(0, len(inputs), batch_size)]
+        results = await asyncio.gather(
+            *(
+                self._embed_batch(chunk, model, encoding_format, normalize)
+                for chunk in chunks
+            )
+        )
+        return [embedding for chunk in results for embedding in chunk]
+
+    async def _embed_batch(
+        self, inputs: list, model: str, encoding_format: str, normalize: bool
+    ):
+        response = await self.transport.post(
+            "/v1/embeddings",
+            json={
+                "model": model,
+                "input": inputs,
+                "encoding_format": encoding_format,
+                "normalize": normalize,
+            },
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
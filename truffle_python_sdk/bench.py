@@ -0,0 +1,533 @@
+"""
+Load generator for the tools of an app, over the direct Python call, REST
+and gRPC paths.
+
+The upstream completion and embedding server is replaced by a local
+``FakeBackend`` so that runs are offline and repeatable.
+"""
+
+import copy
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
+import platform
+import socket
+import threading
+import time
+import typing
+from typing import Literal
+
+import numpy as np
+
+PATHS = ("python", "rest", "grpc")
+
+BACKEND_REPLY = "A short completion from the local stand-in backend."
+
+# Relative change in a metric reported as a regression by ``compare``
+REGRESSION_THRESHOLD = 0.1
+
+
+def sample_value(annotation):
+    """
+    A representative value of ``annotation``, used as a tool argument.
+    Raises ``TypeError`` for types it cannot make up.
+    """
+    from truffle_python_sdk.utils import is_ndarray
+
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if is_ndarray(annotation):
+        return np.ones(16, dtype=np.float32)
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return 3
+    if annotation is float:
+        return 1.5
+    if annotation is str:
+        return "The quick brown fox jumps over the lazy dog"
+    if origin in (list, typing.List, set, typing.Set):
+        return [sample_value(args[0] if args else str) for _ in range(4)]
+    if origin in (tuple, typing.Tuple):
+        if len(args) == 2 and args[1] is Ellipsis:
+            return [sample_value(args[0]) for _ in range(4)]
+        return [sample_value(arg) for arg in args]
+    if origin in (dict, typing.Dict):
+        return {"key": sample_value(args[1] if args else str)}
+    if origin is typing.Union:
+        return sample_value(next(arg for arg in args if arg is not type(None)))
+    if inspect.isclass(annotation) and hasattr(annotation, "model_fields"):
+        return {
+            name: sample_value(field.annotation)
+            for name, field in annotation.model_fields.items()
+            if field.is_required()
+        }
+    raise TypeError(f"Cannot generate a sample value of {annotation!r}")
+
+
+def sample_kwargs(tool) -> dict:
+    """
+    Sample arguments for the required parameters of ``tool``.
+    """
+    return {
+        parameter.name: sample_value(parameter.annotation)
+        for parameter in tool.signature.parameters.values()
+        if parameter.name != "self" and parameter.default is inspect.Parameter.empty
+    }
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank ``q``-th percentile of already sorted values."""
+    if not sorted_values:
+        return math.nan
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(latencies: list, elapsed: float, errors: int = 0) -> dict:
+    """
+    Throughput and latency percentiles (in milliseconds) of a run.
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "rps": count / elapsed if elapsed > 0 else math.nan,
+        "mean_ms": sum(latencies) / count * 1e3 if count else math.nan,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+        "max_ms": latencies[-1] * 1e3 if count else math.nan,
+    }
+
+
+def run_load(call, requests: int = 1000, concurrency: int = 8, warmup: int = 2):
+    """
+    Call ``call()`` ``requests`` times from ``concurrency`` threads and
+    summarise the latencies. Each thread first makes ``warmup`` untimed calls,
+    so connections are open before timing starts.
+    """
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies = []
+    errors = 0
+    start = None
+
+    def begin():
+        nonlocal start
+        start = time.perf_counter()
+
+    barrier = threading.Barrier(concurrency, action=begin)
+
+    def worker():
+        nonlocal errors
+        local, failed = [], 0
+        for _ in range(warmup):
+            try:
+                call()
+            except Exception:
+                pass
+        barrier.wait()
+        while next(counter) < requests:
+            before = time.perf_counter()
+            try:
+                call()
+            except Exception:
+                failed += 1
+                continue
+            local.append(time.perf_counter() - before)
+        with lock:
+            latencies.extend(local)
+            errors += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def invoke(tool, app, kwargs: dict):
+    """
+    Call ``tool`` on ``app`` directly, awaiting async tools and draining
+    streams.
+    """
+    from truffle_python_sdk._utils import iterate_async, run_coroutine
+
+    result = tool.function(app, **kwargs)
+    if inspect.isawaitable(result):
+        return run_coroutine(result)
+    if hasattr(result, "__aiter__"):
+        return list(iterate_async(result))
+    if tool.stream:
+        return list(result)
+    return result
+
+
+def _per_call(func, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+def measure_stages(tool, app, kwargs: dict, number: int = 200) -> dict:
+    """
+    Per-call time, in microseconds, of each stage of serving ``tool`` over
+    REST: validating the JSON body, the tool itself, dispatching it through
+    the worker pool (on top of the tool's own time) and serialising the
+    result. ``dispatch_us`` is ``None`` for streaming tools, which are not
+    dispatched. The tool runs on a deep copy of ``app``, whose state is left
+    untouched.
+    """
+    from truffle_python_sdk._dispatch import ToolDispatcher
+    from truffle_python_sdk._utils import run_coroutine
+    from truffle_python_sdk.responses import TruffleJSONResponse, dumps
+
+    # Copy the fields only; private attributes such as the client are shared
+    copied = type(app).model_construct(**copy.deepcopy(app.__dict__))
+    copied._client = getattr(app, "_client", None)
+    app = copied
+    body = dumps(_wire_kwargs(tool, kwargs))
+    validation = 0.0
+    if tool.request_model is not None:
+        kwargs = tool.request_model.model_validate_json(body).__dict__
+        validation = _per_call(
+            lambda: tool.request_model.model_validate_json(body), number
+        )
+
+    result = invoke(tool, app, kwargs)
+    call = _per_call(lambda: invoke(tool, app, kwargs), number)
+
+    dispatch = None
+    if not tool.stream:
+        dispatcher = ToolDispatcher(app)
+
+        async def dispatch_all():
+            for _ in range(number):
+                await dispatcher.call(tool, kwargs)
+
+        try:
+            start = time.perf_counter()
+            run_coroutine(dispatch_all())
+            dispatch = (time.perf_counter() - start) / number - call
+        finally:
+            dispatcher.shutdown()
+        dispatch = max(dispatch, 0.0) * 1e6
+
+    serialize = (
+        tool.native_serializer if TruffleJSONResponse.numpy_native else tool.serializer
+    )
+    if tool.stream:
+        serialization = _per_call(
+            lambda: [dumps({"result": serialize(chunk)}) for chunk in result], number
+        )
+    else:
+        serialization = _per_call(lambda: dumps({"result": serialize(result)}), number)
+
+    return {
+        "validation_us": validation * 1e6,
+        "call_us": call * 1e6,
+        "dispatch_us": dispatch,
+        "serialization_us": serialization * 1e6,
+    }
+
+
+def _wire_kwargs(tool, kwargs: dict) -> dict:
+    # Arrays travel as base64 JSON tensors over REST
+    from truffle_python_sdk.tensor import encode_tensor_base64
+
+    return {
+        name: encode_tensor_base64(value) if isinstance(value, np.ndarray) else value
+        for name, value in kwargs.items()
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, process, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise RuntimeError(f"Server exited with code {process.exitcode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"Server on port {port} did not start")
+
+
+def _serve(module: str, mode: str, port: int, backend_url: str):
+    from truffle_python_sdk.__main__ import load_app
+    from truffle_python_sdk.client import Client
+
+    Client(base_url=backend_url).start(
+        load_app(module), mode=mode, host="127.0.0.1", port=port, log_level="error"
+    )
+
+
+def start_server(module: str, mode: Literal["rest", "grpc"], backend_url: str):
+    """
+    Serve the app of ``module`` in a separate process, so the server does not
+    compete with the load generator for the GIL. Returns the process and its
+    port.
+    """
+    port = _free_port()
+    process = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(module, mode, port, backend_url), daemon=True
+    )
+    process.start()
+    try:
+        _wait_for_port(port, process)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, port
+
+
+class _RestCaller:
+    def __init__(self, port: int):
+        self.url = f"http://127.0.0.1:{port}"
+        self._local = threading.local()
+
+    def __call__(self, tool, kwargs: dict):
+        import requests
+
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.post(
+            f"{self.url}/{tool.name}",
+            json=kwargs,
+            stream=tool.stream,
+        )
+        response.raise_for_status()
+        if tool.stream:
+            # Drain the event stream
+            for _ in response.iter_content(chunk_size=None):
+                pass
+        else:
+            response.content
+
+    def close(self):
+        pass
+
+
+class _GrpcCaller:
+    def __init__(self, tools, port: int):
+        import grpc
+        from truffle_python_sdk._proto import compile_proto, load_proto_messages
+
+        messages = load_proto_messages(compile_proto(tools.proto))
+        self.codecs = tools.schema.codecs
+        self.channel = grpc.insecure_channel(f"127.0.0.1:{port}")
+        self.rpcs = {}
+        for name, tool in tools.items():
+            request_class = messages[f"{name}Request"]
+            response_class = messages[f"{name}Response"]
+            method = (
+                self.channel.unary_stream if tool.stream else self.channel.unary_unary
+            )
+            rpc = method(
+                f"/truffle.Truffle/{name}",
+                request_serializer=request_class.SerializeToString,
+                response_deserializer=response_class.FromString,
+            )
+            self.rpcs[name] = (request_class, rpc)
+
+    def request_fields(self, tool, kwargs: dict) -> dict:
+        # Arrays travel as Tensor messages, models as their messages, and so on
+        return self.codecs[tool.name].request_fields(kwargs)
+
+    def __call__(self, tool, kwargs: dict):
+        request_class, rpc = self.rpcs[tool.name]
+        response = rpc(request_class(**kwargs))
+        if tool.stream:
+            for _ in response:
+                pass
+
+    def close(self):
+        self.channel.close()
+
+
+def run_benchmark(
+    module: str,
+    paths=PATHS,
+    tools=None,
+    kwargs: dict = None,
+    requests: int = 1000,
+    concurrency: int = 8,
+    stage_number: int = 200,
+    log=print,
+) -> dict:
+    """
+    Benchmark the tools of the app in ``module`` over each of ``paths``.
+
+    Args:
+        module: Importable name of the module holding the app instance.
+        paths: Any of ``"python"`` (calling the tool directly), ``"rest"``
+            and ``"grpc"``.
+        tools: Names of the tools to benchmark. All those defined by the
+            app, if not given.
+        kwargs: Arguments per tool name. Tools without an entry get sample
+            arguments made up from their annotations, or are skipped if that
+            is not possible.
+        requests: Timed calls per tool and path.
+        concurrency: Threads making calls at the same time.
+        stage_number: Calls per stage when measuring per-stage overhead.
+        log: Called with a line of progress for each measurement.
+
+    Returns:
+        A JSON-serialisable report, suitable for ``compare``.
+    """
+    from truffle_python_sdk.__main__ import load_app
+    from truffle_python_sdk.app import TruffleApp
+    from truffle_python_sdk.client import Client
+    from truffle_python_sdk.testing import FakeBackend
+
+    unknown = set(paths) - set(PATHS)
+    if unknown:
+        raise ValueError(f"Invalid paths: {sorted(unknown)}")
+    kwargs = dict(kwargs or {})
+
+    app = load_app(module)
+    registry = type(app).__truffle_tools__
+    selected = {}
+    for name, tool in registry.items():
+        if tools is None:
+            # The built-in save and load tools only run when asked for
+            if name in TruffleApp.__truffle_tools__:
+                continue
+        elif name not in tools:
+            continue
+        if name not in kwargs:
+            try:
+                kwargs[name] = sample_kwargs(tool)
+            except TypeError as e:
+                log(f"skipping {name}: {e}")
+                continue
+        selected[name] = tool
+
+    report = {
+        "module": module,
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": requests,
+        "concurrency": concurrency,
+        "results": [],
+        "stages": [],
+    }
+
+    # A fixed reply keeps prompts that include earlier replies from growing
+    with FakeBackend(reply=BACKEND_REPLY, record=False) as backend:
+        app._client = Client(base_url=backend.url)
+        try:
+            for name, tool in selected.items():
+                stages = measure_stages(tool, app, kwargs[name], stage_number)
+                report["stages"].append({"tool": name, **stages})
+                log(_format_stages(name, stages))
+
+            for path in paths:
+                if path == "python":
+                    caller = lambda tool, kwargs: invoke(tool, app, kwargs)  # noqa
+                    _run_path(report, path, caller, selected, kwargs, log)
+                    continue
+                process, port = start_server(module, path, backend.url)
+                try:
+                    if path == "rest":
+                        caller = _RestCaller(port)
+                    else:
+                        caller = _GrpcCaller(registry, port)
+                    try:
+                        _run_path(report, path, caller, selected, kwargs, log)
+                    finally:
+                        caller.close()
+                finally:
+                    process.terminate()
+                    process.join(timeout=10)
+        finally:
+            app._client.close()
+    return report
+
+
+def _run_path(report, path, caller, tools, kwargs, log):
+    for name, tool in tools.items():
+        if path == "python":
+            arguments = kwargs[name]
+        elif path == "rest":
+            arguments = _wire_kwargs(tool, kwargs[name])
+        else:
+            arguments = caller.request_fields(tool, kwargs[name])
+        result = run_load(
+            lambda: caller(tool, arguments),
+            requests=report["requests"],
+            concurrency=report["concurrency"],
+        )
+        report["results"].append({"tool": name, "path": path, **result})
+        log(_format_result(name, path, result))
+
+
+def _format_stages(name: str, stages: dict) -> str:
+    dispatch = stages["dispatch_us"]
+    dispatch = "-" if dispatch is None else f"{dispatch:.1f}"
+    return (
+        f"{name:<24}{'stages':<8} validation {stages['validation_us']:.1f} us"
+        f"  call {stages['call_us']:.1f} us  dispatch {dispatch} us"
+        f"  serialization {stages['serialization_us']:.1f} us"
+    )
+
+
+def _format_result(name: str, path: str, result: dict) -> str:
+    return (
+        f"{name:<24}{path:<8}{result['rps']:>10.0f} req/s"
+        f"  p50 {result['p50_ms']:.2f} ms  p95 {result['p95_ms']:.2f} ms"
+        f"  p99 {result['p99_ms']:.2f} ms  errors {result['errors']}"
+    )
+
+
+def compare(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD):
+    """
+    Regressions of ``current`` against ``baseline`` (two ``run_benchmark``
+    reports): every tool and path whose throughput dropped, or whose median
+    or p99 latency grew, by more than ``threshold``. Returns a list of
+    ``(tool, path, metric, before, after)``.
+    """
+    before = {(r["tool"], r["path"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous = before.get((result["tool"], result["path"]))
+        if previous is None:
+            continue
+        for metric, higher_is_better in (
+            ("rps", True),
+            ("p50_ms", False),
+            ("p99_ms", False),
+        ):
+            old, new = previous[metric], result[metric]
+            if not old:
+                # Nothing served, or too fast to measure: no relative change
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > threshold:
+                regressions.append((result["tool"], result["path"], metric, old, new))
+    return regressions
+
+
+def save_report(report: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
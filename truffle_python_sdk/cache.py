@@ -0,0 +1,355 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+from truffle_python_sdk._sizing import estimate_size
+
+# Returned by ``ResponseCache.get`` for keys that are not cached
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    # Calls that waited for an identical call already in flight
+    coalesced: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _DiskTier:
+    """
+    SQLite table of JSON-encoded values, evicting the least recently used
+    rows beyond ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int, metrics=None):
+        self.max_bytes = max_bytes
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB, size INTEGER, "
+            "expires REAL, used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache (used)")
+        self._db.commit()
+        (size,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        self._size = 0
+        self._resize(size)
+
+    def _resize(self, delta: int):
+        self._size += delta
+        if self._metrics is not None:
+            self._metrics.bytes["disk"].inc(delta)
+
+    def get(self, key: str):
+        """
+        Return ``(value, expires)`` for ``key``, with ``expires`` in
+        ``time.time()`` seconds or ``None``, or ``MISSING``.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISSING
+            value, expires = row
+            if expires is not None and expires < time.time():
+                self._delete(key)
+                return MISSING
+            self._db.execute(
+                "UPDATE cache SET used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+        return json.loads(value), expires
+
+    def set(self, key: str, value, expires: float = None) -> int:
+        data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        evicted = 0
+        with self._lock:
+            self._delete(key, commit=False)
+            self._db.execute(
+                "INSERT INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), expires, time.time()),
+            )
+            self._resize(len(data))
+            while self._size > self.max_bytes:
+                row = self._db.execute(
+                    "SELECT key FROM cache ORDER BY used LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    break
+                self._delete(row[0], commit=False)
+                evicted += 1
+            self._db.commit()
+        if evicted and self._metrics is not None:
+            self._metrics.evictions["disk"].inc(evicted)
+        return evicted
+
+    def _delete(self, key: str, commit: bool = True):
+        row = self._db.execute(
+            "SELECT size FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._resize(-row[0])
+        if commit:
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+            self._resize(-self._size)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """
+    Cache of upstream responses keyed by a hash of the full request payload.
+
+    Entries live in an in-memory LRU bounded by ``max_bytes`` (estimated
+    size of the cached values), and optionally in an SQLite file at ``path``
+    bounded by ``max_disk_bytes``, which survives restarts and is consulted
+    on memory misses. Entries expire after ``ttl`` seconds if set.
+
+    Concurrent lookups of the same missing key are coalesced: one caller
+    computes the value while the others wait for it (single flight).
+
+    ``stats`` counts this cache's hits, misses and evictions; they are also
+    recorded in a ``MetricsRegistry`` (``truffle_cache_*``), so that they
+    show up in ``GET /metrics``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = None,
+        path: str = None,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+        metrics=True,
+    ):
+        """
+        Args:
+            max_bytes: Memory budget of the in-memory tier, in bytes.
+            ttl: Seconds after which entries expire. Never, if not given.
+            path: SQLite file of the on-disk tier. No disk tier if not given.
+            max_disk_bytes: Size budget of the on-disk tier, in bytes.
+            metrics: ``MetricsRegistry`` recording the cache's metrics. The
+                default registry if ``True``, or ``None`` to record nothing.
+        """
+        from truffle_python_sdk.metrics import CacheMetrics, as_registry
+
+        registry = as_registry(metrics)
+        self._metrics = CacheMetrics(registry) if registry is not None else None
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._ainflight = weakref.WeakKeyDictionary()
+        self._disk = None
+        if path is not None:
+            self._disk = _DiskTier(path, max_disk_bytes, self._metrics)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Estimated size of the in-memory entries, in bytes."""
+        return self._size
+
+    @staticmethod
+    def key(kind: str, payload: dict) -> str:
+        """
+        Cache key of a request: a hash of its kind (e.g. the endpoint) and
+        its canonically encoded payload.
+        """
+        data = json.dumps([kind, payload], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """
+        Return the cached value of ``key``, or ``MISSING``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    if self._metrics is not None:
+                        self._metrics.hits["memory"].inc()
+                    return _copy(value)
+                self._remove(key)
+        if self._disk is not None:
+            found = self._disk.get(key)
+            if found is not MISSING:
+                value, expires = found
+                if expires is not None:
+                    # Keep what is left of the entry's TTL, not a fresh one
+                    expires = time.monotonic() + expires - time.time()
+                self._store(key, value, expires)
+                with self._lock:
+                    self.stats.hits += 1
+                    self.stats.disk_hits += 1
+                if self._metrics is not None:
+                    self._metrics.hits["disk"].inc()
+                return _copy(value)
+        with self._lock:
+            self.stats.misses += 1
+        if self._metrics is not None:
+            self._metrics.misses.inc()
+        return MISSING
+
+    def set(self, key: str, value):
+        """
+        Cache ``value`` under ``key``, in memory and on disk.
+        """
+        self._store(key, value)
+        if self._disk is not None:
+            expires = time.time() + self.ttl if self.ttl is not None else None
+            evicted = self._disk.set(key, value, expires)
+            with self._lock:
+                self.stats.evictions += evicted
+
+    def _store(self, key: str, value, expires: float = MISSING):
+        # ``expires`` is in ``time.monotonic()`` seconds; ``ttl`` from now if
+        # not given
+        size = estimate_size(value)
+        if expires is MISSING:
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (_copy(value), size, expires)
+            self._resize(size)
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.stats.evictions += 1
+                if self._metrics is not None:
+                    self._metrics.evictions["memory"].inc()
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._resize(-size)
+
+    def _resize(self, delta: int):
+        # Called with the lock held
+        self._size += delta
+        if self._metrics is not None:
+            self._metrics.bytes["memory"].inc(delta)
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Return the cached value of ``key``, calling ``compute()`` to fill it
+        on a miss. Concurrent calls for the same key wait for one
+        ``compute()``.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.stats.coalesced += 1
+        if not leader:
+            if self._metrics is not None:
+                self._metrics.coalesced.inc()
+            return _copy(future.result())
+
+        try:
+            value = compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    async def aget_or_compute(self, key: str, compute):
+        """
+        Like ``get_or_compute``, for an ``async`` ``compute()``.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+
+        loop = asyncio.get_running_loop()
+        inflight = self._ainflight.setdefault(loop, {})
+        future = inflight.get(key)
+        if future is not None:
+            self.stats.coalesced += 1
+            if self._metrics is not None:
+                self._metrics.coalesced.inc()
+            return _copy(await asyncio.shield(future))
+
+        future = inflight[key] = loop.create_future()
+        try:
+            value = await compute()
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Waiters receive the error; do not warn if there are none
+            future.exception()
+            raise
+        finally:
+            del inflight[key]
+
+    def clear(self):
+        """
+        Drop every entry, in memory and on disk.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._resize(-self._size)
+        if self._disk is not None:
+            self._disk.clear()
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+
+def _copy(value):
+    # Callers may mutate the lists they get back; keep the cached one intact
+    if type(value) is list:
+        return list(value)
+    return value
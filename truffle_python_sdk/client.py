@@ -5,6 +5,71 @@ from truffle_python_sdk.app import TruffleApp
 class Client:
     truffle_magic_number = 18008
 
+    def __init__(
+        self,
+        base_url: str = None,
+        pool_size: int = 10,
+        timeout: float | tuple = (3.05, 60.0),
+        dns_ttl: float = 300.0,
+        embed_batching: bool = False,
+        embed_batch_size: int = 64,
+        embed_batch_wait: float = 0.005,
+        cache=None,
+        metrics=True,
+    ):
+        """
+        Args:
+            base_url: URL of the Truffle inference server. Defaults to the
+                local Truffle computer.
+            pool_size: Maximum number of pooled keep-alive connections.
+            timeout: Request timeout in seconds, or a ``(connect, read)`` tuple.
+            dns_ttl: Seconds to cache the resolved upstream address.
+            embed_batching: Merge concurrent ``embed`` calls into one upstream
+                request.
+            embed_batch_size: Maximum number of inputs merged into one request.
+            embed_batch_wait: Maximum seconds a call waits for others to join
+                its batch.
+            cache: A ``ResponseCache`` (or ``True`` for one with default
+                settings) caching embeddings, and completions requested with
+                ``temperature=0``.
+            metrics: ``MetricsRegistry`` recording upstream request metrics
+                and, when serving, tool call metrics. The default registry
+                (``truffle_python_sdk.metrics.REGISTRY``) if ``True``, or
+                ``None`` to record nothing.
+        """
+        from weakref import WeakKeyDictionary
+        from truffle_python_sdk._transport import HTTPTransport
+        from truffle_python_sdk._batching import MicroBatcher
+        from truffle_python_sdk.metrics import as_registry
+
+        self._base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self._async_clients = WeakKeyDictionary()
+        self.metrics = as_registry(metrics)
+        self.transport = HTTPTransport(
+            self.base_url,
+            pool_size=pool_size,
+            timeout=timeout,
+            dns_ttl=dns_ttl,
+            metrics=self.metrics,
+        )
+
+        if cache is True:
+            from truffle_python_sdk.cache import ResponseCache
+
+            cache = ResponseCache(metrics=self.metrics)
+        self.cache = cache
+
+        self._embed_batcher = None
+        if embed_batching:
+            self._embed_batcher = MicroBatcher(
+                lambda key, inputs: self._embed_batch(inputs, *key),
+                max_batch_size=embed_batch_size,
+                max_wait=embed_batch_wait,
+            )
+
     def start(
         self,
         app: TruffleApp,
@@ -13,84 +78,308 @@ class Client:
         port: int = None,
         log_level: str = "info",
         reload: bool = False,
+        executor: Literal["thread", "process"] = "thread",
+        max_workers: int = None,
+        max_queue: int = 100,
+        response_class: type = None,
+        snapshot_dir: str = None,
+        snapshot_interval: float = 30.0,
+        workers: int = 1,
+        state_policy: Literal["replicated", "sharded"] = "replicated",
+        sessions=None,
+        profiler=None,
+        grpc_runtime: Literal["thread", "aio"] = "thread",
+        max_concurrent_rpcs: int = None,
+        max_send_message_size: int = None,
+        max_receive_message_size: int = None,
+        compression: Literal["gzip", "deflate"] = None,
+        keepalive_time: float = None,
+        keepalive_timeout: float = None,
     ):
+        """
+        Serve the app's tools over gRPC or REST until the server shuts down.
+
+        In REST mode, synchronous tools run in a pool of ``max_workers``
+        threads (or processes, with ``executor="process"``) so that they do
+        not block the event loop. At most ``max_queue`` calls wait for a free
+        worker; beyond that requests are rejected with ``503`` and a
+        ``Retry-After`` header. A stream from a synchronous generator tool
+        holds a worker until it ends. Results are encoded with ``response_class``,
+        ``TruffleJSONResponse`` by default.
+
+        In gRPC mode, calls run in a pool of ``max_workers`` threads (10 by
+        default), with at most ``max_queue`` calls waiting for a thread
+        unless ``max_concurrent_rpcs`` is given; ``executor="process"``
+        needs the aio runtime. With ``grpc_runtime="aio"``, the server runs on an asyncio
+        event loop instead: async tools are awaited directly and synchronous
+        ones are dispatched as in REST mode, with calls beyond ``max_queue``
+        rejected with ``RESOURCE_EXHAUSTED``. Either way, calls beyond
+        ``max_concurrent_rpcs`` are rejected too. ``max_send_message_size``
+        and ``max_receive_message_size`` (bytes, ``-1`` for no limit) lift
+        gRPC's 4 MB default, ``compression`` compresses responses, and
+        ``keepalive_time``/``keepalive_timeout`` (seconds) ping idle
+        connections and drop those that do not answer.
+
+        With ``snapshot_dir``, the app's state is restored from that directory
+        on startup, checkpointed there every ``snapshot_interval`` seconds in
+        the background, and checkpointed once more on shutdown.
+
+        With ``workers > 1``, the server forks that many processes listening
+        on the same port with ``SO_REUSEPORT``. Each worker has its own copy
+        of the app, as it was when the workers were forked. With the
+        ``replicated`` state policy calls go to any worker, so tools should
+        treat app state as read-only (or keep it in a shared store such as
+        ``MemmapVectorStore``). With ``sharded``, calls carrying an
+        ``X-Truffle-Session`` header (``x-truffle-session`` gRPC metadata) are
+        routed to the worker owning that session. Each worker snapshots into
+        its own ``worker-<n>`` subdirectory of ``snapshot_dir``.
+
+        With ``sessions`` (``True`` or a ``SessionPool``), calls carrying an
+        ``X-Truffle-Session`` header (``x-truffle-session`` gRPC metadata)
+        run on their own copy of the app, and calls within a session are
+        serialised. Calls without a session use ``app`` itself.
+
+        Several calls can be sent at once with ``POST /_batch`` (REST) or
+        the ``Batch`` RPC (gRPC). They run concurrently, at most
+        ``max_workers`` at a time, and each gets its own result or error, in
+        order.
+
+        With ``profiler`` (``True`` or a ``Profiler``), tool calls sampled by
+        the profiler or carrying an ``X-Truffle-Profile`` header
+        (``x-truffle-profile`` gRPC metadata) are profiled, and the last
+        profiles can be fetched from ``/_profiles`` (REST) or the
+        ``truffle.Admin`` gRPC service, e.g. with
+        ``python -m truffle_python_sdk profiles``.
+        """
         app._client = self
-        
-        if mode == "grpc":
-            if port is None:
-                port = 50051  # Default gRPC port
-            self._start_grpc_server(app, host, port, log_level)
-        elif mode == "rest":
-            if port is None:
-                port = 8000  # Default REST port
-            self._start_rest_server(app, host, port, log_level, reload)
-        else:
+
+        if mode not in ("grpc", "rest"):
             raise ValueError(f"Invalid mode: {mode}")
+        if port is None:
+            # Default gRPC and REST ports
+            port = 50051 if mode == "grpc" else 8000
+        if sessions is True:
+            from truffle_python_sdk.sessions import SessionPool
 
-    def _get_tools(self, app: TruffleApp):
-        import inspect
-        from pydantic import BaseModel
-
-        tools = []
-        for attr_name in dir(app):
-            attr = getattr(app, attr_name)
-            if callable(attr) and hasattr(attr, "__truffle_tool__"):
-                tool_name = attr.__truffle_tool__["name"]
-                sig = inspect.signature(attr)
-                parameters = list(sig.parameters.values())[1:]  # Exclude 'self'
-                return_type = sig.return_annotation
-
-                # Collect parameter info
-                param_list = []
-                fields = {}
-                for param in parameters:
-                    param_annotation = (
-                        param.annotation
-                        if param.annotation != inspect.Parameter.empty
-                        else str
-                    )
-                    param_list.append(
-                        {
-                            "name": param.name,
-                            "annotation": param_annotation,
-                        }
-                    )
-                    fields[param.name] = (param_annotation, ...)
-
-                # Create RequestModel if necessary
-                RequestModel = None
-                if fields:
-                    RequestModel = type(
-                        f"{stringcase.capitalize(tool_name)}Request",
-                        (BaseModel,),
-                        fields,
-                    )
+            sessions = SessionPool(app)
+        elif sessions is False:
+            sessions = None
+        if sessions is not None and executor == "process":
+            raise ValueError("Sessions cannot be used with executor='process'")
+        if profiler is True:
+            from truffle_python_sdk.profiling import Profiler
 
-                tools.append(
-                    {
-                        "name": tool_name,
-                        "function": attr,
-                        "parameters": param_list,
-                        "return_type": return_type,
-                        "request_model": RequestModel,
-                    }
+            profiler = Profiler()
+        elif profiler is False:
+            profiler = None
+        if mode == "grpc" and grpc_runtime == "aio" and state_policy == "sharded":
+            raise ValueError("The aio gRPC runtime does not support sharded workers")
+        if mode == "grpc" and grpc_runtime == "thread" and executor != "thread":
+            raise ValueError(
+                f"The thread gRPC runtime cannot use executor={executor!r}; "
+                "use grpc_runtime='aio'"
+            )
+
+        options = dict(
+            app=app,
+            mode=mode,
+            host=host,
+            port=port,
+            log_level=log_level,
+            reload=reload,
+            executor=executor,
+            max_workers=max_workers,
+            max_queue=max_queue,
+            response_class=response_class,
+            snapshot_dir=snapshot_dir,
+            snapshot_interval=snapshot_interval,
+            sessions=sessions,
+            profiler=profiler,
+            grpc_options=dict(
+                runtime=grpc_runtime,
+                max_concurrent_rpcs=max_concurrent_rpcs,
+                max_send_message_size=max_send_message_size,
+                max_receive_message_size=max_receive_message_size,
+                compression=compression,
+                keepalive_time=keepalive_time,
+                keepalive_timeout=keepalive_timeout,
+            ),
+        )
+        if workers <= 1:
+            self._serve(None, **options)
+            return
+
+        from truffle_python_sdk._workers import run_workers
+
+        if mode == "grpc":
+            from truffle_python_sdk._proto import compile_proto
+
+            # Compile the schema once, before forking, instead of in every worker
+            compile_proto(type(app).__truffle_tools__.proto)
+        try:
+            run_workers(
+                workers, lambda worker: self._serve(worker, **options), state_policy
+            )
+        finally:
+            self.close()
+
+    def _serve(
+        self,
+        worker,
+        app: TruffleApp,
+        mode: str,
+        host: str,
+        port: int,
+        log_level: str,
+        reload: bool,
+        executor: str,
+        max_workers: int,
+        max_queue: int,
+        response_class: type,
+        snapshot_dir: str,
+        snapshot_interval: float,
+        sessions,
+        profiler,
+        grpc_options: dict,
+    ):
+        snapshotter = None
+        if snapshot_dir is not None:
+            from truffle_python_sdk.snapshot import Snapshotter
+
+            if worker is not None:
+                import os
+
+                snapshot_dir = os.path.join(snapshot_dir, f"worker-{worker.worker_id}")
+            snapshotter = Snapshotter(app, snapshot_dir)
+            snapshotter.restore()
+            snapshotter.start(snapshot_interval)
+
+        try:
+            if mode == "grpc":
+                self._start_grpc_server(
+                    app,
+                    host,
+                    port,
+                    log_level,
+                    worker=worker,
+                    sessions=sessions,
+                    profiler=profiler,
+                    executor=executor,
+                    max_workers=max_workers,
+                    max_queue=max_queue,
+                    **grpc_options,
                 )
+            else:
+                self._start_rest_server(
+                    app,
+                    host,
+                    port,
+                    log_level,
+                    reload,
+                    executor=executor,
+                    max_workers=max_workers,
+                    max_queue=max_queue,
+                    response_class=response_class,
+                    worker=worker,
+                    sessions=sessions,
+                    profiler=profiler,
+                )
+        finally:
+            if sessions is not None:
+                # Spill the sessions still in memory
+                sessions.close()
+            if snapshotter is not None:
+                snapshotter.stop()
+            # Release pooled upstream connections once the server shuts down
+            self.close()
+
+    def close(self):
+        """
+        Close the pooled upstream connections held by this client.
+        """
+        self.transport.close()
 
-        return tools
+    @property
+    def aio(self):
+        """
+        An ``AsyncClient`` with the same settings, for use from ``async def``
+        tools. One is created per event loop, since pooled async connections
+        cannot be shared between loops.
+        """
+        import asyncio
+        from truffle_python_sdk.async_client import AsyncClient
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncClient(
+                base_url=self.base_url,
+                pool_size=self.pool_size,
+                timeout=self.timeout,
+                dns_ttl=self.dns_ttl,
+                cache=self.cache,
+                metrics=self.metrics,
+            )
+            self._async_clients[loop] = client
+        return client
 
-    def _start_grpc_server(self, app: TruffleApp, host: str, port: int, log_level: str):
-        from ._utils import start_grpc_server
+    async def aclose(self):
+        """
+        Close the async connections opened from the running event loop.
+        """
+        import asyncio
 
-        # Extract tools
-        tools = self._get_tools(app)
-        start_grpc_server(tools, app, host, port, log_level)
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
 
-    def generate_proto_files(self, app: TruffleApp):
-        from ._utils import generate_proto_file
+    def __enter__(self):
+        return self
 
-        # Extract tools
-        tools = self._get_tools(app)
-        generate_proto_file(tools)
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_tools(self, app: TruffleApp):
+        # Tools are registered once, when the app class is created
+        return list(type(app).__truffle_tools__.values())
+
+    def _start_grpc_server(
+        self,
+        app: TruffleApp,
+        host: str,
+        port: int,
+        log_level: str,
+        worker=None,
+        sessions=None,
+        profiler=None,
+        **options,
+    ):
+        from ._grpc_server import start_grpc_server
+
+        start_grpc_server(
+            type(app).__truffle_tools__,
+            app,
+            host,
+            port,
+            log_level,
+            worker=worker,
+            sessions=sessions,
+            metrics=self.metrics,
+            profiler=profiler,
+            **options,
+        )
+
+    def generate_proto_files(
+        self,
+        app: TruffleApp,
+        proto_file_path: str = "truffle.proto",
+        python_out: str = None,
+    ):
+        from ._proto import generate_proto_file
+
+        generate_proto_file(
+            type(app).__truffle_tools__, proto_file_path, python_out=python_out
+        )
 
     def _start_rest_server(
         self,
@@ -99,28 +388,262 @@ class Client:
         port: int,
         log_level: str,
         reload: bool,
+        executor: str = "thread",
+        max_workers: int = None,
+        max_queue: int = 100,
+        response_class: type = None,
+        worker=None,
+        sessions=None,
+        profiler=None,
     ):
+        import asyncio
+        import json
         import uvicorn
-        from fastapi import FastAPI
-        from fastapi.responses import JSONResponse
-        from typing import Callable
+        from fastapi import FastAPI, Request
+        from fastapi.responses import Response, StreamingResponse
+        from pydantic import ValidationError
+        from truffle_python_sdk._dispatch import ToolDispatcher, ServerOverloaded
+        from truffle_python_sdk._workers import SESSION_HEADER
+        from truffle_python_sdk.utils import is_ndarray
+        from truffle_python_sdk.metrics import ToolMetrics
+        from truffle_python_sdk.profiling import PROFILE_HEADER
+        from truffle_python_sdk.responses import TruffleJSONResponse
+
+        if response_class is None:
+            response_class = TruffleJSONResponse
+        numpy_native = getattr(response_class, "numpy_native", False)
+
+        dispatcher = ToolDispatcher(
+            app,
+            executor=executor,
+            max_workers=max_workers,
+            max_queue=max_queue,
+            metrics=self.metrics,
+            profiler=profiler,
+        )
+        fastapi_app = FastAPI(
+            default_response_class=response_class,
+            on_shutdown=[dispatcher.shutdown, self.aclose],
+        )
+
+        if self.metrics is not None:
+            registry = self.metrics
+
+            @fastapi_app.get("/metrics", include_in_schema=False)
+            def metrics():
+                return Response(
+                    registry.render(),
+                    media_type="text/plain; version=0.0.4; charset=utf-8",
+                )
 
-        fastapi_app = FastAPI()
+        if profiler is not None:
+            _add_profile_routes(fastapi_app, profiler)
 
         # Register tool endpoints
-        for tool_name, attr, RequestModel in self._get_tools(app):
+        batch_calls = {}
+        for tool in self._get_tools(app):
 
-            def create_endpoint(func: Callable, request_model):
-                async def endpoint(request_data: request_model = None):
-                    kwargs = request_data.dict() if request_data else {}
-                    result = func(app, **kwargs)
-                    return JSONResponse(content={"result": result})
+            def create_endpoint(tool):
+                request_model = tool.request_model
+                serialize = tool.native_serializer if numpy_native else tool.serializer
+                tool_metrics = None
+                if self.metrics is not None:
+                    tool_metrics = ToolMetrics(self.metrics, tool.name)
 
+                async def endpoint(request: Request):
+                    if tool_metrics is None:
+                        return await handle(request)
+                    # The body is cached on the request, so it is read only once
+                    start = tool_metrics.start(len(await request.body()))
+                    try:
+                        response = await handle(request)
+                    except BaseException:
+                        tool_metrics.finish(start, error=True)
+                        raise
+                    if isinstance(response, StreamingResponse):
+                        # Record the call when the stream ends
+                        response.body_iterator = _measured_events(
+                            response.body_iterator, tool_metrics, start
+                        )
+                    else:
+                        tool_metrics.finish(
+                            start,
+                            error=response.status_code >= 400,
+                            response_bytes=len(response.body),
+                        )
+                    return response
+
+                async def handle(request: Request):
+                    kwargs = {}
+                    if request_model is not None:
+                        # Validate straight from the raw body bytes
+                        try:
+                            body = await request.body()
+                            content_type = request.headers.get("content-type", "")
+                            if content_type.startswith("application/octet-stream"):
+                                request_data = _validate_tensor_body(
+                                    tool, request, body
+                                )
+                            else:
+                                request_data = request_model.model_validate_json(
+                                    body or b"{}"
+                                )
+                        except ValidationError as e:
+                            return response_class(
+                                status_code=422,
+                                content={
+                                    "detail": e.errors(
+                                        include_url=False, include_context=False
+                                    )
+                                },
+                            )
+                        except ValueError as e:
+                            return response_class(
+                                status_code=400, content={"detail": str(e)}
+                            )
+                        # Validated values as they are: parameters annotated
+                        # with a model get instances of it, not dicts
+                        kwargs = request_data.__dict__
+
+                    session_id = None
+                    if sessions is not None:
+                        session_id = request.headers.get(SESSION_HEADER)
+                    if session_id is None:
+                        return await run(app, request, kwargs)
+                    if tool.stream:
+                        try:
+                            dispatcher.check_capacity()
+                        except ServerOverloaded as e:
+                            return overloaded(e)
+                        # Hold the session for as long as the stream runs
+                        return StreamingResponse(
+                            _session_events(
+                                sessions,
+                                session_id,
+                                dispatcher,
+                                tool,
+                                kwargs,
+                                serialize,
+                                request.headers.get(PROFILE_HEADER),
+                            ),
+                            media_type="text/event-stream",
+                        )
+                    async with sessions.asession(session_id) as session_app:
+                        return await run(session_app, request, kwargs)
+
+                async def run(target, request, kwargs):
+                    profile = request.headers.get(PROFILE_HEADER)
+                    try:
+                        if tool.stream:
+                            # Chunks are pulled lazily, as the response is sent
+                            chunks = dispatcher.stream(
+                                tool, kwargs, app=target, profile=profile
+                            )
+                            return StreamingResponse(
+                                _sse_events(chunks, serialize),
+                                media_type="text/event-stream",
+                            )
+                        result = await dispatcher.call(
+                            tool, kwargs, app=target, profile=profile
+                        )
+                    except ServerOverloaded as e:
+                        return overloaded(e)
+                    if is_ndarray(tool.return_type) and _accepts_octet_stream(request):
+                        return _tensor_response(result)
+                    return response_class(content={"result": serialize(result)})
+
+                def overloaded(e):
+                    return response_class(
+                        status_code=503,
+                        content={"detail": str(e)},
+                        headers={"Retry-After": str(e.retry_after)},
+                    )
+
+                async def batch_call(args, target, profile):
+                    # One call of a batch: its result, or its error
+                    if tool.stream:
+                        detail = "Streaming tools cannot be batched"
+                        return {"error": {"status": 400, "detail": detail}}
+                    kwargs = {}
+                    if request_model is not None:
+                        try:
+                            kwargs = request_model.model_validate(
+                                {} if args is None else args
+                            ).__dict__
+                        except ValidationError as e:
+                            detail = e.errors(include_url=False, include_context=False)
+                            return {"error": {"status": 422, "detail": detail}}
+                    start = None
+                    if tool_metrics is not None:
+                        start = tool_metrics.start()
+                    try:
+                        result = await dispatcher.call(
+                            tool, kwargs, app=target, profile=profile
+                        )
+                        item = {"result": serialize(result)}
+                    except ServerOverloaded as e:
+                        item = {"error": {"status": 503, "detail": str(e)}}
+                    except Exception as e:
+                        detail = f"{type(e).__name__}: {e}"
+                        item = {"error": {"status": 500, "detail": detail}}
+                    if start is not None:
+                        tool_metrics.finish(start, error="error" in item)
+                    return item
+
+                batch_calls[tool.name] = batch_call
                 return endpoint
 
-            endpoint_func = create_endpoint(attr, RequestModel)
-            fastapi_app.post(f"/{tool_name}")(endpoint_func)
+            openapi_extra = None
+            if tool.request_model is not None:
+                # The body is parsed by hand, so describe it for the docs
+                openapi_extra = {
+                    "requestBody": {
+                        "required": True,
+                        "content": {
+                            "application/json": {
+                                "schema": tool.request_model.model_json_schema()
+                            }
+                        },
+                    }
+                }
+            fastapi_app.post(f"/{tool.name}", openapi_extra=openapi_extra)(
+                create_endpoint(tool)
+            )
+
+        @fastapi_app.post("/_batch", include_in_schema=False)
+        async def batch(request: Request):
+            try:
+                calls = json.loads(await request.body() or b"null")
+            except ValueError as e:
+                return response_class(status_code=400, content={"detail": str(e)})
+            if not isinstance(calls, list):
+                detail = "Expected a list of {tool, args} objects"
+                return response_class(status_code=400, content={"detail": detail})
 
+            profile = request.headers.get(PROFILE_HEADER)
+
+            async def run_call(call, target):
+                name = call.get("tool") if isinstance(call, dict) else None
+                batch_call = batch_calls.get(name)
+                if batch_call is None:
+                    detail = f"Unknown tool: {name}"
+                    return {"error": {"status": 404, "detail": detail}}
+                return await batch_call(call.get("args"), target, profile)
+
+            session_id = None
+            if sessions is not None:
+                session_id = request.headers.get(SESSION_HEADER)
+            if session_id is None:
+                results = await dispatcher.gather(run_call(call, app) for call in calls)
+            else:
+                # Calls within a session are serialised, so run them in order
+                async with sessions.asession(session_id) as session_app:
+                    results = [await run_call(call, session_app) for call in calls]
+            return response_class(content={"results": list(results)})
+
+        if worker is not None:
+            worker.serve_rest(fastapi_app, host, port, log_level)
+            return
         uvicorn.run(
             fastapi_app,
             host=host,
@@ -131,6 +654,8 @@ class Client:
 
     @property
     def base_url(self):
+        if self._base_url is not None:
+            return self._base_url
         return f"http://truffle-{self.truffle_magic_number}.local"
 
     def completion(
@@ -146,10 +671,50 @@ class Client:
         top_k: int = 40,
         repeat_penalty: float = 1.1,
     ):
-        import requests
+        payload = {
+            "model": model,
+            "prompt": input,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty,
+            "stop": stop,
+            "top_k": top_k,
+            "repeat_penalty": repeat_penalty,
+        }
+        # Only greedy (temperature 0) completions are deterministic
+        if self.cache is not None and temperature == 0:
+            key = self.cache.key("/v1/completions", payload)
+            return self.cache.get_or_compute(key, lambda: self._complete(payload))
+        return self._complete(payload)
+
+    def _complete(self, payload: dict):
+        response = self.transport.post("/v1/completions", json=payload)
+        response.raise_for_status()
+        return response.json()["choices"][0]["text"]
+
+    def stream_completion(
+        self,
+        input: str,
+        model: str = "meta-llama/Llama-3.2-1b-instruct",
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0,
+        stop: list = None,
+        top_k: int = 40,
+        repeat_penalty: float = 1.1,
+    ):
+        """
+        Like ``completion``, but yields the generated text chunk by chunk as
+        the server produces it.
+        """
+        import json
 
-        response = requests.post(
-            f"{self.base_url}/v1/completions",
+        response = self.transport.post(
+            "/v1/completions",
             json={
                 "model": model,
                 "prompt": input,
@@ -161,10 +726,22 @@ class Client:
                 "stop": stop,
                 "top_k": top_k,
                 "repeat_penalty": repeat_penalty,
+                "stream": True,
             },
+            stream=True,
         )
-        response.raise_for_status()
-        return response.json()["choices"][0]["text"]
+        with response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                # Server-sent events: only "data:" lines carry payloads
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[len(b"data:") :].strip()
+                if data == b"[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["text"]
+                if text:
+                    yield text
 
     def embed(
         self,
@@ -173,16 +750,231 @@ class Client:
         encoding_format: str = "float",
         normalize: bool = True,
     ):
-        import requests
+        if self.cache is not None:
+            key = _embedding_key(self.cache, input, model, encoding_format, normalize)
+            return self.cache.get_or_compute(
+                key, lambda: self._embed(input, model, encoding_format, normalize)
+            )
+        return self._embed(input, model, encoding_format, normalize)
 
-        response = requests.post(
-            f"{self.base_url}/v1/embeddings",
+    def _embed(self, input: str, model: str, encoding_format: str, normalize: bool):
+        if self._embed_batcher is not None:
+            return self._embed_batcher.submit(
+                (model, encoding_format, normalize), input
+            )
+        return self._embed_batch([input], model, encoding_format, normalize)[0]
+
+    def embed_many(
+        self,
+        inputs: list,
+        model: str = "meta-llama/Llama-3.2-1b",
+        encoding_format: str = "float",
+        normalize: bool = True,
+        batch_size: int = 64,
+    ):
+        """
+        Embed a list of strings, sending them upstream in chunks of
+        ``batch_size`` that run concurrently.
+
+        Returns:
+            One embedding per input, in input order.
+        """
+        inputs = list(inputs)
+        if self.cache is None:
+            return self._embed_many(
+                inputs, model, encoding_format, normalize, batch_size
+            )
+
+        # Only send the inputs that are not cached
+        from truffle_python_sdk.cache import MISSING
+
+        keys = [
+            _embedding_key(self.cache, input, model, encoding_format, normalize)
+            for input in inputs
+        ]
+        embeddings = [self.cache.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is MISSING]
+        fetched = self._embed_many(
+            [inputs[i] for i in missing], model, encoding_format, normalize, batch_size
+        )
+        for i, embedding in zip(missing, fetched):
+            self.cache.set(keys[i], embedding)
+            embeddings[i] = embedding
+        return embeddings
+
+    def _embed_many(
+        self,
+        inputs: list,
+        model: str,
+        encoding_format: str,
+        normalize: bool,
+        batch_size: int,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+
+        chunks = [inputs[i : i + batch_size] for i in range(0, len(inputs), batch_size)]
+        if len(chunks) <= 1:
+            return [
+                embedding
+                for chunk in chunks
+                for embedding in self._embed_batch(
+                    chunk, model, encoding_format, normalize
+                )
+            ]
+
+        with ThreadPoolExecutor(
+            max_workers=min(len(chunks), self.pool_size)
+        ) as executor:
+            results = executor.map(
+                lambda chunk: self._embed_batch(
+                    chunk, model, encoding_format, normalize
+                ),
+                chunks,
+            )
+            return [embedding for chunk in results for embedding in chunk]
+
+    def _embed_batch(
+        self, inputs: list, model: str, encoding_format: str, normalize: bool
+    ):
+        response = self.transport.post(
+            "/v1/embeddings",
             json={
                 "model": model,
-                "input": input,
+                "input": inputs,
                 "encoding_format": encoding_format,
                 "normalize": normalize,
             },
         )
         response.raise_for_status()
-        return response.json()["data"][0]["embedding"]
+        data = sorted(response.json()["data"], key=lambda item: item.get("index", 0))
+        return [item["embedding"] for item in data]
+
+
+def _validate_tensor_body(tool, request, body):
+    """
+    Build the request model of a tool with a single ``np.ndarray`` parameter
+    from an ``application/octet-stream`` body. The array's dtype and shape
+    come from headers, and the other parameters from the query string.
+    """
+    import numpy as np
+    from truffle_python_sdk.tensor import DTYPE_HEADER, SHAPE_HEADER, from_bytes
+
+    if len(tool.tensor_params) != 1:
+        raise ValueError(
+            f"Tool '{tool.name}' does not take exactly one array parameter, "
+            "so it cannot accept an application/octet-stream body"
+        )
+    dtype = request.headers.get(DTYPE_HEADER, "<f4")
+    shape = request.headers.get(SHAPE_HEADER)
+    if shape:
+        shape = [int(dim) for dim in shape.split(",") if dim.strip()]
+    else:
+        shape = [len(body) // np.dtype(dtype).itemsize]
+
+    kwargs = dict(request.query_params)
+    kwargs[tool.tensor_params[0]] = from_bytes(body, dtype, shape)
+    return tool.request_model.model_validate(kwargs)
+
+
+def _accepts_octet_stream(request):
+    return "application/octet-stream" in request.headers.get("accept", "")
+
+
+def _tensor_response(array):
+    """
+    Return an array result as raw bytes, with its dtype and shape in headers.
+    """
+    import numpy as np
+    from starlette.responses import Response
+    from truffle_python_sdk.tensor import DTYPE_HEADER, SHAPE_HEADER
+
+    array = np.ascontiguousarray(array)
+    return Response(
+        content=array.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            DTYPE_HEADER: array.dtype.str,
+            SHAPE_HEADER: ",".join(str(dim) for dim in array.shape),
+        },
+    )
+
+
+async def _sse_events(chunks, serialize):
+    """
+    Format the chunks of a streaming tool (from ``ToolDispatcher.stream``)
+    as server-sent events.
+    """
+    from truffle_python_sdk.responses import dumps
+
+    async for chunk in chunks:
+        yield b"data: " + dumps({"result": serialize(chunk)}) + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
+
+def _add_profile_routes(fastapi_app, profiler):
+    """
+    Admin routes listing the kept profiles and returning one of them.
+    """
+    from fastapi import HTTPException
+    from fastapi.responses import JSONResponse, Response
+
+    @fastapi_app.get("/_profiles", include_in_schema=False)
+    def list_profiles():
+        return JSONResponse(profiler.profiles())
+
+    @fastapi_app.get("/_profiles/{profile_id}", include_in_schema=False)
+    def get_profile(profile_id: int, format: str = "text"):
+        try:
+            content = profiler.render(profile_id, format)
+        except KeyError:
+            raise HTTPException(404, f"No profile {profile_id}")
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        if format == "pstats":
+            return Response(content, media_type="application/octet-stream")
+        return Response(content, media_type="text/plain; charset=utf-8")
+
+
+async def _measured_events(events, tool_metrics, start):
+    """
+    Pass on the events of a streaming response, recording the tool call once
+    they are all sent.
+    """
+    size = 0
+    error = True
+    try:
+        async for event in events:
+            size += len(event)
+            yield event
+        error = False
+    except GeneratorExit:
+        # The client went away; the tool did not fail
+        error = False
+        raise
+    finally:
+        tool_metrics.finish(start, error=error, response_bytes=size)
+
+
+def _embedding_key(cache, input, model, encoding_format, normalize):
+    return cache.key(
+        "/v1/embeddings",
+        {
+            "model": model,
+            "input": input,
+            "encoding_format": encoding_format,
+            "normalize": normalize,
+        },
+    )
+
+
+async def _session_events(
+    sessions, session_id, dispatcher, tool, kwargs, serialize, profile
+):
+    """
+    Server-sent events of a streaming tool run on a session's app, holding
+    the session until the stream ends.
+    """
+    async with sessions.asession(session_id) as app:
+        chunks = dispatcher.stream(tool, kwargs, app=app, profile=profile)
+        async for event in _sse_events(chunks, serialize):
+            yield event
@@ -0,0 +1,283 @@
+"""
+Disk-backed vector store.
+
+A store is a directory holding:
+
+- ``meta.json``: the vector dimension;
+- ``vectors.f32``: the (normalised) vectors as raw float32 rows, memory-mapped
+  with ``np.memmap``. The file is grown in place with ``truncate`` and never
+  rewritten;
+- ``records.jsonl``: one ``{"text", "metadata"}`` JSON line per vector,
+  append-only;
+- ``records.idx``: the int64 end offset of each line in ``records.jsonl``.
+
+Rows are committed by appending to ``records.idx`` once the vector has been
+flushed (``msync``) and its record written and ``fsync``-ed, so the number of
+rows is the size of that file and a crash or power loss mid-append leaves no
+partial rows behind. Opening a store only reads
+``records.idx``; vectors and records are paged in as they are used.
+"""
+
+import json
+import os
+from typing import Any, List
+
+import numpy as np
+
+from truffle_python_sdk.vector_store import VectorStore
+
+_META = "meta.json"
+_VECTORS = "vectors.f32"
+_RECORDS = "records.jsonl"
+_INDEX = "records.idx"
+
+
+class _RecordField:
+    """
+    Read-only sequence view of one field of the records sidecar.
+    """
+
+    def __init__(self, store: "MemmapVectorStore", field: str):
+        self._store = store
+        self._field = field
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._store._read_record(index)[self._field]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class MemmapVectorStore(VectorStore):
+    """
+    ``VectorStore`` kept in a directory on disk instead of in memory.
+
+    Reopening an existing store is instant: the vector matrix is
+    memory-mapped, and texts and metadata are read from the sidecar file only
+    for search results. Several processes can open the same store with
+    ``read_only=True`` and share its pages through the OS page cache, while
+    one process appends to it; readers pick up new rows on their next search.
+
+    Declared as a ``TruffleApp`` field, the store serialises to its path
+    rather than its contents::
+
+        class ChatApp(TruffleApp):
+            knowledge_base: MemmapVectorStore = Field(
+                default_factory=lambda: MemmapVectorStore("knowledge_base")
+            )
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: int = None,
+        capacity: int = 1024,
+        read_only: bool = False,
+    ):
+        """
+        Args:
+            path: Directory of the store. Created if it does not exist.
+            dim: Dimension of the vectors. Read from the store if it exists,
+                otherwise inferred from the first vector added if not given.
+            capacity: Number of rows to allocate when the vector file is
+                created.
+            read_only: Open the store for searching only.
+        """
+        self.path = os.fspath(path)
+        self.read_only = read_only
+        self.dim = dim
+        self._capacity = capacity
+        self._matrix = None
+        self._size = 0
+        self._ends = np.zeros(0, dtype=np.int64)
+        self._records_fd = None
+
+        if not read_only:
+            os.makedirs(self.path, exist_ok=True)
+        meta_path = os.path.join(self.path, _META)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored_dim = json.load(f)["dim"]
+            if dim is not None and dim != stored_dim:
+                raise ValueError(
+                    f"Store at {self.path} has dimension {stored_dim}, not {dim}"
+                )
+            self.dim = stored_dim
+        elif read_only:
+            raise FileNotFoundError(f"No vector store at {self.path}")
+        elif dim is not None:
+            self._write_meta()
+        self.refresh()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}({self.path!r}, dim={self.dim}, size={self._size})"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def texts(self) -> _RecordField:
+        return _RecordField(self, "text")
+
+    @property
+    def metadata(self) -> _RecordField:
+        return _RecordField(self, "metadata")
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_meta(self):
+        tmp_path = self._file(_META + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim}, f)
+        os.replace(tmp_path, self._file(_META))
+
+    def _map(self, rows: int):
+        mode = "r" if self.read_only else "r+"
+        self._matrix = np.memmap(
+            self._file(_VECTORS), dtype=np.float32, mode=mode, shape=(rows, self.dim)
+        )
+
+    def refresh(self):
+        """
+        Pick up rows appended since the store was opened, e.g. by another
+        process.
+        """
+        try:
+            index_size = os.path.getsize(self._file(_INDEX))
+        except FileNotFoundError:
+            return
+        rows = index_size // 8
+        if rows == self._size:
+            return
+        # Only the new end offsets are read
+        with open(self._file(_INDEX), "rb") as f:
+            f.seek(self._size * 8)
+            new_ends = np.frombuffer(f.read((rows - self._size) * 8), dtype=np.int64)
+        self._ends = np.concatenate([self._ends[: self._size], new_ends])
+        vector_rows = os.path.getsize(self._file(_VECTORS)) // (4 * self.dim)
+        if self._matrix is None or self._matrix.shape[0] != vector_rows:
+            self._map(vector_rows)
+        self._size = rows
+
+    def _reserve(self, count: int):
+        needed = self._size + count
+        rows = 0 if self._matrix is None else self._matrix.shape[0]
+        if needed <= rows:
+            return
+        if rows == 0:
+            rows = max(self._capacity, needed)
+        else:
+            rows = max(needed, 2 * rows)
+            self._matrix.flush()
+        # Growing the file keeps the rows already written in place
+        with open(self._file(_VECTORS), "ab") as f:
+            f.truncate(rows * self.dim * 4)
+        self._map(rows)
+
+    def add_many(self, vectors, texts: List[str], metadata: List[dict] = None):
+        """
+        Add several vectors with their texts. Returns their row indices.
+        """
+        if self.read_only:
+            raise PermissionError(f"Vector store at {self.path} is read-only")
+        if len(texts) == 0:
+            return []
+        new_store = self.dim is None
+        vectors = self._as_matrix(vectors)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} vectors but {len(texts)} texts")
+        if new_store:
+            self._write_meta()
+
+        self._reserve(len(vectors))
+        start = self._size
+        self._matrix[start : start + len(vectors)] = vectors
+        # The vectors must be on disk before the index commits their rows
+        self._matrix.flush()
+
+        lines = [
+            json.dumps({"text": text, "metadata": meta}).encode("utf-8") + b"\n"
+            for text, meta in zip(texts, metadata or [None] * len(texts))
+        ]
+        offset = self._ends[start - 1] if start else 0
+        ends = offset + np.cumsum([len(line) for line in lines], dtype=np.int64)
+        with open(self._file(_RECORDS), "ab") as f:
+            # Drop anything left by an append that did not commit
+            f.truncate(offset)
+            f.write(b"".join(lines))
+            # The records must be on disk before the index commits them too
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self._file(_INDEX), "ab") as f:
+            f.write(ends.tobytes())
+
+        self._ends = np.concatenate([self._ends[:start], ends])
+        self._size += len(vectors)
+        return list(range(start, self._size))
+
+    def _read_record(self, index: int) -> dict:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError(f"No record at index {index}")
+        if self._records_fd is None:
+            self._records_fd = os.open(self._file(_RECORDS), os.O_RDONLY)
+        start = int(self._ends[index - 1]) if index else 0
+        data = os.pread(self._records_fd, int(self._ends[index]) - start, start)
+        return json.loads(data)
+
+    def search_many(self, queries, k: int = 3):
+        if self.read_only:
+            self.refresh()
+        return super().search_many(queries, k)
+
+    def flush(self):
+        """
+        Write the vector matrix back to disk.
+        """
+        if self._matrix is not None and not self.read_only:
+            self._matrix.flush()
+
+    def close(self):
+        self.flush()
+        if self._records_fd is not None:
+            os.close(self._records_fd)
+            self._records_fd = None
+
+    def to_dict(self) -> dict:
+        return {"path": self.path, "read_only": self.read_only}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MemmapVectorStore":
+        return cls(data["path"], read_only=data.get("read_only", False))
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler):
+        from pydantic_core import core_schema
+
+        def validate(value):
+            if isinstance(value, cls):
+                return value
+            if isinstance(value, (str, os.PathLike)):
+                return cls(value)
+            if isinstance(value, dict):
+                return cls.from_dict(value)
+            raise ValueError(f"Cannot build a {cls.__name__} from {type(value)}")
+
+        return core_schema.no_info_plain_validator_function(
+            validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda value: value.to_dict()
+            ),
+        )
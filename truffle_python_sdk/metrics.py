@@ -0,0 +1,432 @@
+"""
+Counters, gauges and latency histograms of tool calls and upstream requests,
+exposed in the Prometheus text format (``GET /metrics`` in REST mode) or
+read in process with ``MetricsRegistry.snapshot()``.
+"""
+
+import bisect
+import math
+import threading
+import time
+
+__all__ = [
+    "CacheMetrics",
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "MetricsRegistry",
+    "REGISTRY",
+    "ToolMetrics",
+    "UpstreamMetrics",
+]
+
+# Each power-of-two range of values is split into 16 linear sub-buckets, so
+# recorded values are kept to within 1/16 (about 6%) of their true value
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+_BUCKETS = 64 * _SUB_COUNT
+
+# Histogram units: (recorded integer steps per unit, Prometheus buckets)
+_UNITS = {
+    "seconds": (
+        1e6,
+        (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+        + (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+    ),
+    "bytes": (1, tuple(float(4**i) for i in range(3, 14))),
+}
+
+
+def _bucket_index(value: int) -> int:
+    if value < _SUB_COUNT:
+        return value
+    # Shift the value so that it falls in [_SUB_COUNT, 2 * _SUB_COUNT)
+    shift = value.bit_length() - _SUB_BITS - 1
+    return (shift + 1) * _SUB_COUNT + (value >> shift) - _SUB_COUNT
+
+
+def _bucket_bounds(index: int) -> tuple:
+    if index < _SUB_COUNT:
+        return index, index
+    shift = index // _SUB_COUNT - 1
+    sub = index % _SUB_COUNT + _SUB_COUNT
+    return sub << shift, ((sub + 1) << shift) - 1
+
+
+class Counter:
+    """A value that only goes up."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that goes up and down."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """
+    HDR-style histogram: log-linear buckets covering the whole range of
+    64-bit values with a bounded relative error, so percentiles are accurate
+    for microsecond latencies and multi-second outliers alike without
+    choosing buckets up front.
+
+    Values are recorded in ``unit`` (``"seconds"`` or ``"bytes"``). Counts
+    for the fixed ``prometheus_buckets`` are kept exactly alongside.
+    """
+
+    def __init__(self, unit: str = "seconds"):
+        self.unit = unit
+        self._scale, self.prometheus_buckets = _UNITS[unit]
+        self._counts = [0] * _BUCKETS
+        self._le_counts = [0] * (len(self.prometheus_buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._min = None
+        self._max = None
+        self._lock = threading.Lock()
+
+    def record(self, value: float):
+        steps = max(int(value * self._scale), 0)
+        index = _bucket_index(steps)
+        le_index = bisect.bisect_left(self.prometheus_buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._le_counts[le_index] += 1
+            self.count += 1
+            self.sum += value
+            if self._min is None or steps < self._min:
+                self._min = steps
+            if self._max is None or steps > self._max:
+                self._max = steps
+
+    @property
+    def min(self) -> float:
+        return math.nan if self._min is None else self._min / self._scale
+
+    @property
+    def max(self) -> float:
+        return math.nan if self._max is None else self._max / self._scale
+
+    def percentile(self, q: float) -> float:
+        """
+        The ``q``-th percentile (0-100) of the recorded values, or NaN if
+        there are none.
+        """
+        with self._lock:
+            if not self.count:
+                return math.nan
+            target = max(math.ceil(q / 100 * self.count), 1)
+            seen = 0
+            for index, count in enumerate(self._counts):
+                seen += count
+                if seen >= target:
+                    low, high = _bucket_bounds(index)
+                    value = min(max((low + high) / 2, self._min), self._max)
+                    return value / self._scale
+        return self.max
+
+    def cumulative_counts(self) -> list:
+        """
+        Number of recorded values at most each of ``prometheus_buckets``, as
+        in the ``le`` buckets of a Prometheus histogram.
+        """
+        with self._lock:
+            counts = self._le_counts[:-1]
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            counts[i] = seen
+        return counts
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else math.nan,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "p999": self.percentile(99.9),
+            "max": self.max,
+        }
+
+
+class _Family:
+    def __init__(self, kind: str, help: str, factory):
+        self.kind = kind
+        self.help = help
+        self.factory = factory
+        self.children = {}
+
+
+class MetricsRegistry:
+    """
+    A set of named metric families, each with one metric per set of label
+    values. Look metrics up once and keep them: updating a metric is cheap,
+    looking it up is not.
+    """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _metric(self, kind: str, name: str, help: str, factory, labels: dict):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(kind, help, factory)
+            elif family.kind != kind:
+                raise ValueError(f"{name} is already a {family.kind}")
+            metric = family.children.get(key)
+            if metric is None:
+                metric = family.children[key] = family.factory()
+            return metric
+
+    def counter(self, name: str, help: str = "", **labels) -> Counter:
+        return self._metric("counter", name, help, Counter, labels)
+
+    def gauge(self, name: str, help: str = "", **labels) -> Gauge:
+        return self._metric("gauge", name, help, Gauge, labels)
+
+    def histogram(
+        self, name: str, help: str = "", unit: str = "seconds", **labels
+    ) -> Histogram:
+        return self._metric("histogram", name, help, lambda: Histogram(unit), labels)
+
+    def _items(self):
+        with self._lock:
+            return [
+                (name, family, list(family.children.items()))
+                for name, family in sorted(self._families.items())
+            ]
+
+    def snapshot(self) -> dict:
+        """
+        Current values as ``{name: [{"labels": {...}, "value": ...}]}``.
+        Histogram values are dicts of count, sum, mean, min, max and
+        percentiles.
+        """
+        snapshot = {}
+        for name, family, children in self._items():
+            snapshot[name] = [
+                {
+                    "labels": dict(key),
+                    "value": (
+                        metric.snapshot()
+                        if family.kind == "histogram"
+                        else metric.value
+                    ),
+                }
+                for key, metric in children
+            ]
+        return snapshot
+
+    def render(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, family, children in self._items():
+            if family.help:
+                lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for key, metric in children:
+                if family.kind != "histogram":
+                    lines.append(f"{name}{_labels(key)} {_number(metric.value)}")
+                    continue
+                bounds = metric.prometheus_buckets
+                for bound, count in zip(bounds, metric.cumulative_counts()):
+                    labels = _labels(key + (("le", _number(bound)),))
+                    lines.append(f"{name}_bucket{labels} {count}")
+                labels = _labels(key + (("le", "+Inf"),))
+                lines.append(f"{name}_bucket{labels} {metric.count}")
+                lines.append(f"{name}_sum{_labels(key)} {_number(metric.sum)}")
+                lines.append(f"{name}_count{_labels(key)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for name, value in key
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Registry used by clients and servers unless given another one
+REGISTRY = MetricsRegistry()
+
+
+def as_registry(metrics):
+    """
+    The registry for a ``metrics=`` argument: ``True`` for ``REGISTRY``, a
+    ``MetricsRegistry``, or ``None``/``False`` to record nothing.
+    """
+    if metrics is True:
+        return REGISTRY
+    return metrics or None
+
+
+class ToolMetrics:
+    """
+    The metrics of one tool, looked up once when the server starts.
+    """
+
+    def __init__(self, registry: MetricsRegistry, tool: str):
+        self.duration = registry.histogram(
+            "truffle_tool_duration_seconds", "Time to handle a tool call", tool=tool
+        )
+        self.in_flight = registry.gauge(
+            "truffle_tool_in_flight", "Tool calls being handled", tool=tool
+        )
+        self.errors = registry.counter(
+            "truffle_tool_errors_total",
+            "Tool calls that raised or returned an error response",
+            tool=tool,
+        )
+        self.request_bytes = registry.histogram(
+            "truffle_tool_request_bytes",
+            "Size of tool call requests",
+            unit="bytes",
+            tool=tool,
+        )
+        self.response_bytes = registry.histogram(
+            "truffle_tool_response_bytes",
+            "Size of tool call responses",
+            unit="bytes",
+            tool=tool,
+        )
+
+    def start(self, request_bytes: int = None) -> float:
+        self.in_flight.inc()
+        if request_bytes is not None:
+            self.request_bytes.record(request_bytes)
+        return time.perf_counter()
+
+    def finish(self, start: float, error: bool = False, response_bytes: int = None):
+        self.duration.record(time.perf_counter() - start)
+        self.in_flight.dec()
+        if error:
+            self.errors.inc()
+        if response_bytes is not None:
+            self.response_bytes.record(response_bytes)
+
+
+class CacheMetrics:
+    """
+    The metrics of a ``ResponseCache``, by tier (``memory`` or ``disk``).
+    Caches sharing a registry add up.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.hits = {
+            tier: registry.counter(
+                "truffle_cache_hits_total",
+                "Cache lookups that found a value",
+                tier=tier,
+            )
+            for tier in ("memory", "disk")
+        }
+        self.misses = registry.counter(
+            "truffle_cache_misses_total", "Cache lookups that found nothing"
+        )
+        self.coalesced = registry.counter(
+            "truffle_cache_coalesced_total",
+            "Calls that waited for an identical call already in flight",
+        )
+        self.evictions = {
+            tier: registry.counter(
+                "truffle_cache_evictions_total",
+                "Entries dropped to stay within the size budget",
+                tier=tier,
+            )
+            for tier in ("memory", "disk")
+        }
+        self.bytes = {
+            tier: registry.gauge(
+                "truffle_cache_bytes", "Size of the cached entries", tier=tier
+            )
+            for tier in ("memory", "disk")
+        }
+
+
+class UpstreamMetrics:
+    """
+    The metrics of one upstream endpoint (such as ``/v1/completions``).
+    """
+
+    def __init__(self, registry: MetricsRegistry, endpoint: str):
+        self.duration = registry.histogram(
+            "truffle_upstream_duration_seconds",
+            "Time until the upstream response headers arrived",
+            endpoint=endpoint,
+        )
+        self.in_flight = registry.gauge(
+            "truffle_upstream_in_flight", "Upstream requests waiting", endpoint=endpoint
+        )
+        self.errors = registry.counter(
+            "truffle_upstream_errors_total",
+            "Upstream requests that failed or returned an error status",
+            endpoint=endpoint,
+        )
+        self.request_bytes = registry.histogram(
+            "truffle_upstream_request_bytes",
+            "Size of upstream request bodies",
+            unit="bytes",
+            endpoint=endpoint,
+        )
+        self.response_bytes = registry.histogram(
+            "truffle_upstream_response_bytes",
+            "Size of upstream response bodies, when known up front",
+            unit="bytes",
+            endpoint=endpoint,
+        )
+
+    def start(self) -> float:
+        self.in_flight.inc()
+        return time.perf_counter()
+
+    def finish(self, start: float, response=None, request_bytes: int = None):
+        """
+        Record a request started at ``start`` that got ``response`` (a
+        ``requests`` or ``httpx`` response), or failed if it is ``None``.
+        """
+        self.duration.record(time.perf_counter() - start)
+        self.in_flight.dec()
+        if request_bytes is not None:
+            self.request_bytes.record(request_bytes)
+        if response is None or response.status_code >= 400:
+            self.errors.inc()
+        if response is not None:
+            length = response.headers.get("content-length")
+            if length is not None:
+                self.response_bytes.record(int(length))
@@ -0,0 +1,496 @@
+"""
+Opt-in profiling of tool calls with ``cProfile`` (CPU) or ``tracemalloc``
+(memory). A ``Profiler`` picks calls to profile (a random sample, or calls
+that ask for it) and keeps the most recent profiles in a ring buffer.
+"""
+
+import collections
+import io
+import itertools
+import json
+import marshal
+import os
+import random
+import threading
+import time
+from typing import Literal
+
+__all__ = [
+    "PROFILE_HEADER",
+    "PROFILE_METADATA",
+    "Profile",
+    "Profiler",
+    "capture",
+    "fetch",
+]
+
+# Header (REST) and metadata key (gRPC) asking for a call to be profiled:
+# "cpu", "memory", or any other non-empty value for the profiler's default
+PROFILE_HEADER = "X-Truffle-Profile"
+PROFILE_METADATA = "x-truffle-profile"
+
+# Deepest call stack written out by ``Profile.collapsed``
+_MAX_DEPTH = 128
+
+# tracemalloc traces every thread, so only one memory profile runs at a time
+_memory_lock = threading.Lock()
+
+# Likewise for CPU profiles: Python 3.12 allows one active profiler per
+# process, and profiles overlapping on one event loop would share its thread
+_cpu_lock = threading.Lock()
+
+
+class Profile:
+    """
+    One profiled tool call.
+
+    CPU profiles hold ``cProfile`` statistics (``stats``, in the format of
+    ``pstats.Stats.stats``). Memory profiles hold the allocations made
+    during the call (``allocations``: ``(size, count, frames)`` tuples, with
+    ``frames`` as ``(filename, lineno)`` from the outermost call inwards).
+    """
+
+    def __init__(self, tool: str, kind: Literal["cpu", "memory"]):
+        self.id = None
+        self.tool = tool
+        self.kind = kind
+        self.started = time.time()
+        self.duration = 0.0
+        self.error = None
+        self.stats = None
+        self.allocations = None
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "tool": self.tool,
+            "kind": self.kind,
+            "started": self.started,
+            "duration": self.duration,
+            "error": self.error,
+        }
+
+    def pstats(self) -> bytes:
+        """
+        CPU statistics in the binary format of ``cProfile.Profile.dump_stats``,
+        readable with ``pstats.Stats`` or tools such as snakeviz.
+        """
+        if self.kind != "cpu":
+            raise ValueError("Only CPU profiles have pstats output")
+        return marshal.dumps(self.stats)
+
+    def text(self, limit: int = 40) -> str:
+        """
+        A human-readable report: the functions with the most cumulative time,
+        or the lines that allocated the most memory.
+        """
+        out = io.StringIO()
+        if self.kind == "cpu":
+            import pstats
+
+            stats = pstats.Stats(_StatsSource(self.stats), stream=out)
+            stats.sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+
+        total = sum(size for size, _, _ in self.allocations)
+        out.write(f"{self.tool}: {total} bytes allocated and not freed\n\n")
+        for size, count, frames in sorted(self.allocations, reverse=True)[:limit]:
+            filename, lineno = frames[-1] if frames else ("?", 0)
+            out.write(f"{size:>12} B {count:>8} blocks  {filename}:{lineno}\n")
+        return out.getvalue()
+
+    def collapsed(self) -> str:
+        """
+        Collapsed stacks (``frame;frame;frame value`` lines) for flame graph
+        tools such as ``flamegraph.pl`` or speedscope. Values are microseconds
+        of CPU profiles or bytes of memory profiles.
+        """
+        if self.kind == "cpu":
+            weights = _collapse_cpu(self.stats)
+        else:
+            weights = collections.Counter()
+            for size, _, frames in self.allocations:
+                if size > 0:
+                    stack = ";".join(_frame_label(*frame) for frame in frames)
+                    weights[stack] += size
+        return "".join(
+            f"{stack} {int(round(value))}\n"
+            for stack, value in sorted(weights.items())
+            if value >= 1
+        )
+
+
+class _StatsSource:
+    # pstats.Stats loads from anything with a ``create_stats``/``stats`` pair
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _frame_label(filename: str, lineno: int, name: str = None) -> str:
+    location = f"{os.path.basename(filename)}:{lineno}"
+    label = location if name is None else f"{name} ({location})"
+    return label.replace(";", ":")
+
+
+def _function_label(func: tuple) -> str:
+    filename, lineno, name = func
+    if filename == "~":
+        # Built-in functions have no source location
+        return name.replace(";", ":")
+    return _frame_label(filename, lineno, name)
+
+
+def _collapse_cpu(stats: dict) -> collections.Counter:
+    """
+    Rebuild call stacks from cProfile's caller/callee edges. cProfile only
+    records one level of callers, so time below a function called from
+    several places is split between them in proportion to the time each
+    call site spent in it.
+    """
+    children = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children[caller].append((func, edge[3]))
+
+    weights = collections.Counter()
+
+    def walk(func, stack, on_stack, share):
+        _, _, inline, cumulative, _ = stats[func]
+        stack = stack + (_function_label(func),)
+        if inline * share > 0:
+            weights[";".join(stack)] += inline * share * 1e6
+        if len(stack) >= _MAX_DEPTH:
+            return
+        on_stack = on_stack | {func}
+        for child, edge_time in children.get(func, ()):
+            child_time = stats[child][3]
+            if child in on_stack or child_time <= 0 or edge_time <= 0:
+                continue
+            walk(child, stack, on_stack, share * edge_time / child_time)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not any(caller in stats for caller in callers):
+            walk(func, (), frozenset(), 1.0)
+    return weights
+
+
+def capture(task, tool: str, kind: Literal["cpu", "memory"]):
+    """
+    Run ``task()`` under a profiler and return ``(profile, result)``. If the
+    task raises, the profile is attached to the exception as
+    ``__truffle_profile__``. A module-level function, so calls can be
+    profiled in worker processes too.
+    """
+    profile = Profile(tool, kind)
+    start = time.perf_counter()
+    try:
+        if kind == "memory":
+            result = _capture_memory(task, profile)
+        else:
+            result = _capture_cpu(task, profile)
+    except Exception as e:
+        profile.duration = time.perf_counter() - start
+        profile.error = repr(e)
+        e.__truffle_profile__ = profile
+        raise
+    profile.duration = time.perf_counter() - start
+    return profile, result
+
+
+def _capture_cpu(task, profile: Profile):
+    profiler = _start_cpu(profile)
+    try:
+        return task()
+    finally:
+        _stop_cpu(profiler, profile)
+
+
+def _start_cpu(profile: Profile):
+    """
+    Start a CPU profiler. Returns it, or ``None`` if another profile (or
+    profiling tool) is active, in which case the call runs unprofiled.
+    """
+    import cProfile
+
+    profile.stats = {}
+    if not _cpu_lock.acquire(blocking=False):
+        profile.error = "skipped: another CPU profile was running"
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # e.g. "Another profiling tool is already active" on Python 3.12+
+        _cpu_lock.release()
+        profile.error = f"skipped: {e}"
+        return None
+    return profiler
+
+
+def _stop_cpu(profiler, profile: Profile):
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        profiler.create_stats()
+        profile.stats = profiler.stats
+    finally:
+        _cpu_lock.release()
+
+
+def _capture_memory(task, profile: Profile):
+    traced = _start_memory(profile)
+    try:
+        return task()
+    finally:
+        _stop_memory(traced, profile)
+
+
+def _start_memory(profile: Profile, frames: int = 25):
+    """
+    Start recording allocations. Returns the state ``_stop_memory`` needs,
+    or ``None`` if another memory profile is running.
+    """
+    import tracemalloc
+
+    profile.allocations = []
+    if not _memory_lock.acquire(blocking=False):
+        # Its traces would be mixed into ours
+        profile.error = "skipped: another memory profile was running"
+        return None
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(frames)
+    return started, tracemalloc.take_snapshot()
+
+
+def _stop_memory(traced, profile: Profile):
+    import tracemalloc
+
+    if traced is None:
+        return
+    started, before = traced
+    try:
+        after = tracemalloc.take_snapshot()
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        differences = after.filter_traces(ignore).compare_to(
+            before.filter_traces(ignore), "traceback"
+        )
+        profile.allocations = [
+            (
+                difference.size_diff,
+                difference.count_diff,
+                [(frame.filename, frame.lineno) for frame in difference.traceback],
+            )
+            for difference in differences
+            if difference.size_diff
+        ]
+    finally:
+        if started:
+            tracemalloc.stop()
+        _memory_lock.release()
+
+
+class Profiler:
+    """
+    Decides which tool calls to profile and keeps the last ``capacity``
+    profiles.
+
+    A fraction ``sample_rate`` of calls is profiled with ``kind``; calls
+    carrying the ``X-Truffle-Profile`` header (``x-truffle-profile`` gRPC
+    metadata) are always profiled, with the kind it names (``cpu`` or
+    ``memory``) or ``kind`` otherwise.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        kind: Literal["cpu", "memory"] = "cpu",
+        capacity: int = 100,
+    ):
+        if kind not in ("cpu", "memory"):
+            raise ValueError(f"Invalid profile kind: {kind}")
+        self.sample_rate = sample_rate
+        self.kind = kind
+        self._profiles = collections.deque(maxlen=capacity)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def choose(self, requested: str = None):
+        """
+        The kind of profile to capture for a call, or ``None`` not to
+        profile it. ``requested`` is the value of the profile header.
+        """
+        if requested:
+            requested = requested.lower()
+            return requested if requested in ("cpu", "memory") else self.kind
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.kind
+        return None
+
+    def add(self, profile: Profile):
+        with self._lock:
+            profile.id = next(self._ids)
+            self._profiles.append(profile)
+
+    def profiles(self) -> list:
+        """Summaries of the kept profiles, oldest first."""
+        with self._lock:
+            return [profile.summary() for profile in self._profiles]
+
+    def get(self, profile_id: int) -> Profile:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        raise KeyError(profile_id)
+
+    def run(self, tool: str, kind: str, task):
+        """
+        Run ``task()``, profiling it and keeping the profile if ``kind`` is
+        not ``None``.
+        """
+        if kind is None:
+            return task()
+        try:
+            profile, result = capture(task, tool, kind)
+        except Exception as e:
+            if hasattr(e, "__truffle_profile__"):
+                self.add(e.__truffle_profile__)
+            raise
+        self.add(profile)
+        return result
+
+    async def arun(self, tool: str, kind: str, coroutine_function):
+        """
+        Await ``coroutine_function()``, profiling it if ``kind`` is not
+        ``None``. Other tasks running on the event loop meanwhile show up in
+        CPU profiles too.
+        """
+        if kind is None:
+            return await coroutine_function()
+        profile = Profile(tool, kind)
+        start = time.perf_counter()
+        try:
+            if kind == "memory":
+                return await _await_memory(coroutine_function, profile)
+            return await _await_cpu(coroutine_function, profile)
+        except Exception as e:
+            profile.error = repr(e)
+            raise
+        finally:
+            profile.duration = time.perf_counter() - start
+            self.add(profile)
+
+    def render(self, profile_id: int, format: str = "text"):
+        """
+        A kept profile as ``text``, ``collapsed`` stacks or binary
+        ``pstats``.
+        """
+        profile = self.get(profile_id)
+        if format == "pstats":
+            return profile.pstats()
+        if format == "collapsed":
+            return profile.collapsed()
+        if format == "text":
+            return profile.text()
+        raise ValueError(f"Invalid profile format: {format}")
+
+
+class StreamCapture:
+    """
+    Profiles a stream whose chunks are produced one call at a time, possibly
+    in different threads: run each with ``step()`` (or ``astep()`` on the
+    event loop), then ``close()`` once the stream ends to keep the profile.
+    """
+
+    def __init__(self, profiler: "Profiler", tool: str, kind: str):
+        self.profiler = profiler
+        self.profile = Profile(tool, kind)
+        self._start = time.perf_counter()
+        self._cpu = self._traced = None
+        if kind == "memory":
+            # tracemalloc traces every thread, so it runs for the whole stream
+            self._traced = _start_memory(self.profile)
+        else:
+            self._cpu = _start_cpu(self.profile)
+            if self._cpu is not None:
+                self._cpu.disable()
+
+    def step(self, task):
+        if self._cpu is None:
+            return task()
+        self._cpu.enable()
+        try:
+            return task()
+        finally:
+            self._cpu.disable()
+
+    async def astep(self, coroutine_function):
+        if self._cpu is None:
+            return await coroutine_function()
+        self._cpu.enable()
+        try:
+            return await coroutine_function()
+        finally:
+            self._cpu.disable()
+
+    def close(self, error: BaseException = None):
+        if self.profile.kind == "memory":
+            _stop_memory(self._traced, self.profile)
+        else:
+            _stop_cpu(self._cpu, self.profile)
+        self.profile.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.profile.error = repr(error)
+        self.profiler.add(self.profile)
+
+
+async def _await_cpu(coroutine_function, profile: Profile):
+    profiler = _start_cpu(profile)
+    try:
+        return await coroutine_function()
+    finally:
+        _stop_cpu(profiler, profile)
+
+
+async def _await_memory(coroutine_function, profile: Profile):
+    traced = _start_memory(profile)
+    try:
+        return await coroutine_function()
+    finally:
+        _stop_memory(traced, profile)
+
+
+def fetch(server: str, profile_id: int = None, format: str = "text"):
+    """
+    Fetch profiles from a running server: the list of kept profiles, or the
+    one with ``profile_id`` in ``format``. ``server`` is the REST base URL
+    (``http://host:port``) or ``grpc://host:port``.
+    """
+    if server.startswith("grpc://"):
+        import grpc
+
+        with grpc.insecure_channel(server[len("grpc://") :]) as channel:
+            if profile_id is None:
+                response = channel.unary_unary("/truffle.Admin/Profiles")(b"")
+                return json.loads(response)
+            query = {"id": profile_id, "format": format}
+            content = channel.unary_unary("/truffle.Admin/Profile")(
+                json.dumps(query).encode("utf-8")
+            )
+    else:
+        import requests
+
+        url = f"{server.rstrip('/')}/_profiles"
+        if profile_id is None:
+            response = requests.get(url)
+            response.raise_for_status()
+            return response.json()
+        response = requests.get(f"{url}/{profile_id}", params={"format": format})
+        response.raise_for_status()
+        content = response.content
+    return content if format == "pstats" else content.decode("utf-8")
@@ -0,0 +1,73 @@
+import base64
+import dataclasses
+import json
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(obj):
+    """
+    Encode values the JSON encoder does not handle natively.
+    """
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "tolist"):
+        # numpy arrays and scalars
+        return obj.tolist()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, bytes):
+        # As the data of base64 JSON tensors
+        return base64.b64encode(obj).decode("ascii")
+    from truffle_python_sdk._utils import standardize
+
+    return standardize(obj)
+
+
+def dumps(content) -> bytes:
+    """
+    Encode ``content`` as compact UTF-8 JSON.
+
+    Uses orjson when it is installed, which serialises numpy arrays,
+    dataclasses and datetimes natively; otherwise falls back to the stdlib
+    encoder with the same extra types handled by ``_default``.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            content,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class TruffleJSONResponse(JSONResponse):
+    """
+    JSON response class used for tool results in REST mode.
+
+    Encodes with orjson when available and understands numpy arrays,
+    pydantic models and dataclasses directly, so tool results do not have to
+    be converted to lists and dicts first.
+
+    Subclasses (or any ``starlette`` response class) can be passed to
+    ``Client.start(response_class=...)``. Set ``numpy_native = False`` on
+    classes that cannot encode numpy arrays themselves.
+    """
+
+    numpy_native = True
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,318 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from truffle_python_sdk._sizing import estimate_size
+from truffle_python_sdk._workers import SESSION_HEADER, SESSION_METADATA
+
+__all__ = ["SessionPool", "SESSION_HEADER", "SESSION_METADATA"]
+
+
+class _Session:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.app = None
+        # Set once ``app`` is created (or restored), or creating it failed
+        self.loaded = threading.Event()
+        self.error = None
+        # Held by ``session()`` and ``asession()`` alike
+        self.lock = threading.Lock()
+        self.users = 0
+        self.size = 0
+        # Calls since the size was last estimated, if it ever was
+        self.unmeasured_calls = None
+        self.last_used = time.monotonic()
+
+
+async def _acquire(lock: threading.Lock):
+    """
+    Acquire a thread lock from an event loop, waiting in the loop's default
+    executor if it is held.
+    """
+    if lock.acquire(blocking=False):
+        return
+    future = asyncio.get_running_loop().run_in_executor(None, lock.acquire)
+    try:
+        await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Hand the lock back once the abandoned acquire gets it
+        future.add_done_callback(lambda _: lock.release())
+        raise
+
+
+def _sweep(pool_ref, stop: threading.Event, interval: float):
+    import logging
+
+    # Hold the pool only while sweeping, so an unused pool can be collected
+    while not stop.wait(interval):
+        pool = pool_ref()
+        if pool is None:
+            return
+        try:
+            pool.evict_expired()
+        except Exception:
+            logging.getLogger(__name__).exception("Session sweep failed")
+        del pool
+
+
+class SessionPool:
+    """
+    One instance of an app per session, so callers do not share (and race
+    on) a single global app.
+
+    Sessions are created on first use as deep copies of the template app.
+    They are evicted least recently used first once there are more than
+    ``max_sessions`` or their estimated size exceeds ``max_memory`` bytes, and
+    when unused for ``ttl`` seconds (checked every ``sweep_interval`` seconds
+    from a background thread). With ``spill_dir``, evicted sessions are
+    snapshotted there and restored when they are used again; otherwise their
+    state is dropped.
+
+    Sessions in use are never evicted: eviction passes over them to the
+    next least recently used idle session, so the pool can stay above its
+    limits while every session is in use. Sizes are estimated on a
+    session's first call and then every ``measure_every`` calls, as
+    estimating walks the whole app.
+
+    Only the bookkeeping runs under the pool lock: copying, restoring,
+    measuring and spilling a session happen outside it, so they do not hold
+    up calls in other sessions.
+
+    Calls within a session are serialised by a per-session lock, whether
+    they come from threads (``session()``) or an event loop
+    (``asession()``).
+    """
+
+    def __init__(
+        self,
+        app,
+        max_sessions: int = 1024,
+        ttl: float = 3600.0,
+        max_memory: int = None,
+        spill_dir: str = None,
+        sweep_interval: float = 60.0,
+        measure_every: int = 16,
+    ):
+        """
+        Args:
+            app: Template app copied for each new session.
+            max_sessions: Maximum number of sessions kept in memory.
+            ttl: Seconds after which an unused session is evicted.
+            max_memory: Maximum total estimated size of the sessions in memory,
+                in bytes.
+            spill_dir: Directory where evicted sessions are snapshotted.
+                Requires msgpack.
+            sweep_interval: Seconds between checks for expired sessions, at
+                most ``ttl``.
+            measure_every: Number of calls between estimates of a session's
+                size, with ``max_memory``.
+        """
+        self.app = app
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.spill_dir = spill_dir
+        self.sweep_interval = min(sweep_interval, ttl)
+        self.measure_every = measure_every
+        self._sessions = OrderedDict()
+        # Sessions being spilled, by ID: restoring one waits for its snapshot
+        self._spilling = {}
+        self._memory = 0
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    @property
+    def memory(self) -> int:
+        """Estimated total size of the sessions in memory, in bytes."""
+        return self._memory
+
+    def _spill_path(self, session_id: str) -> str:
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, digest)
+
+    def _new_app(self, session_id: str):
+        # Copy the fields only; private attributes such as the client are shared
+        app = type(self.app).model_construct(**copy.deepcopy(self.app.__dict__))
+        app._client = getattr(self.app, "_client", None)
+        if self.spill_dir is not None:
+            from truffle_python_sdk.snapshot import Snapshotter
+
+            path = self._spill_path(session_id)
+            if os.path.isdir(path):
+                Snapshotter(app, path).restore()
+        return app
+
+    def _start_sweeper(self):
+        # Called with the pool lock held
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(
+            target=_sweep,
+            args=(weakref.ref(self), self._stop, self.sweep_interval),
+            name="truffle-sessions",
+            daemon=True,
+        )
+        self._sweeper.start()
+
+    def _checkout(self, session_id: str) -> _Session:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            created = session is None
+            if created:
+                session = _Session(session_id)
+                self._sessions[session_id] = session
+                spilling = self._spilling.get(session_id)
+                self._start_sweeper()
+            self._sessions.move_to_end(session_id)
+            session.users += 1
+
+        if created:
+            try:
+                if spilling is not None:
+                    spilling.wait()
+                session.app = self._new_app(session_id)
+            except BaseException as e:
+                session.error = e
+                with self._lock:
+                    session.users -= 1
+                    if self._sessions.get(session_id) is session:
+                        del self._sessions[session_id]
+                raise
+            finally:
+                session.loaded.set()
+        else:
+            session.loaded.wait()
+            if session.error is not None:
+                with self._lock:
+                    session.users -= 1
+                raise session.error
+        return session
+
+    def _checkin(self, session: _Session):
+        size = None
+        if self.max_memory is not None:
+            calls = session.unmeasured_calls
+            if calls is None or calls + 1 >= self.measure_every:
+                size = estimate_size(session.app)
+                session.unmeasured_calls = 0
+            else:
+                session.unmeasured_calls = calls + 1
+        with self._lock:
+            session.users -= 1
+            session.last_used = time.monotonic()
+            if size is not None:
+                self._memory += size - session.size
+                session.size = size
+            evicted = self._evict()
+        self._spill(evicted)
+
+    def _evict(self) -> list:
+        # Called with the pool lock held; the evicted sessions still need
+        # ``_spill()`` once it is released
+        now = time.monotonic()
+        evicted = []
+        for session in list(self._sessions.values()):
+            over_capacity = len(self._sessions) > self.max_sessions or (
+                self.max_memory is not None and self._memory > self.max_memory
+            )
+            expired = now - session.last_used > self.ttl
+            if not (over_capacity or expired):
+                # Sessions are in LRU order, so later ones are newer
+                break
+            # Sessions in use are passed over, not waited for
+            if session.users == 0:
+                evicted.append(self._remove(session))
+        return evicted
+
+    def _remove(self, session: _Session) -> _Session:
+        # Called with the pool lock held
+        del self._sessions[session.session_id]
+        self._memory -= session.size
+        if self.spill_dir is not None and session.app is not None:
+            self._spilling[session.session_id] = threading.Event()
+        return session
+
+    def _spill(self, sessions: list):
+        if self.spill_dir is None:
+            return
+        from truffle_python_sdk.snapshot import Snapshotter
+
+        for session in sessions:
+            done = self._spilling.get(session.session_id)
+            if done is None:
+                continue
+            try:
+                path = self._spill_path(session.session_id)
+                Snapshotter(session.app, path).checkpoint(full=True)
+            finally:
+                with self._lock:
+                    if self._spilling.get(session.session_id) is done:
+                        del self._spilling[session.session_id]
+                done.set()
+
+    def evict_expired(self):
+        """
+        Evict the sessions unused for more than ``ttl`` seconds.
+        """
+        with self._lock:
+            evicted = self._evict()
+        self._spill(evicted)
+
+    @contextlib.contextmanager
+    def session(self, session_id: str):
+        """
+        Hold the lock of a session and yield its app instance.
+        """
+        session = self._checkout(session_id)
+        try:
+            with session.lock:
+                yield session.app
+        finally:
+            self._checkin(session)
+
+    @contextlib.asynccontextmanager
+    async def asession(self, session_id: str):
+        """
+        Like ``session()``, but waits for the lock without blocking the event
+        loop. Waiting for a held lock, creating, restoring and spilling
+        sessions run in the loop's default executor.
+        """
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(None, self._checkout, session_id)
+        try:
+            await _acquire(session.lock)
+            try:
+                yield session.app
+            finally:
+                session.lock.release()
+        finally:
+            await loop.run_in_executor(None, self._checkin, session)
+
+    def close(self):
+        """
+        Evict every session, spilling them to ``spill_dir`` if set, and stop
+        the sweep for expired sessions.
+        """
+        with self._lock:
+            sweeper, self._sweeper = self._sweeper, None
+            evicted = [
+                self._remove(session) for session in list(self._sessions.values())
+            ]
+        if sweeper is not None:
+            self._stop.set()
+            sweeper.join()
+        self._spill(evicted)
@@ -0,0 +1,339 @@
+"""
+Incremental binary snapshots of a ``TruffleApp``'s state.
+
+A snapshot directory holds numbered checkpoint files and a ``MANIFEST``
+naming, for every field of the app, the checkpoint file with its latest
+value. A checkpoint only writes the fields whose value changed since the
+previous one, telling them apart by a cheap fingerprint: arrays are hashed
+in place and objects with a ``snapshot_version`` (such as vector stores)
+contribute only that. Files that no longer hold the latest value of any
+field are removed.
+
+Fields are read under the app's ``state_lock``; encoding and writing them
+happens after it is released.
+
+Each checkpoint file is::
+
+    b"TRFSNAP1" | uint64 header length | msgpack header | buffers
+
+where the header holds the msgpack-encoded field values. Numpy arrays are
+stored out-of-band: the values keep a reference to a 64-byte aligned raw
+buffer after the header, which is wrapped with ``np.frombuffer`` when
+loading.
+
+Files are written to a temporary name, fsynced and moved into place with
+``os.replace``, so a crash never leaves a partial checkpoint or manifest.
+Temporary and unreferenced files left by a crash are removed by
+``restore()``.
+
+Snapshots require the ``msgpack`` package.
+"""
+
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+_MAGIC = b"TRFSNAP1"
+_MANIFEST = "MANIFEST"
+_NDARRAY = 1
+_ALIGNMENT = 64
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise ImportError(
+            "Snapshots require msgpack. Install it with `pip install msgpack`."
+        ) from e
+    return msgpack
+
+
+def _packer(buffers: list):
+    msgpack = _msgpack()
+
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.hasobject:
+                return obj.tolist()
+            array = np.require(obj, requirements="C")
+            buffers.append(array)
+            return msgpack.ExtType(
+                _NDARRAY,
+                msgpack.packb([len(buffers) - 1, array.dtype.str, list(array.shape)]),
+            )
+        if hasattr(obj, "item"):
+            # numpy scalars
+            return obj.item()
+        from pydantic_core import to_jsonable_python
+
+        return to_jsonable_python(obj)
+
+    return msgpack.Packer(default=default, use_bin_type=True)
+
+
+def _aligned(size: int) -> int:
+    return -(-size // _ALIGNMENT) * _ALIGNMENT
+
+
+def encode(values: dict) -> bytes:
+    """
+    Encode a mapping of values as a checkpoint file.
+    """
+    buffers = []
+    packed_values = _packer(buffers).pack(values)
+    offsets, position = [], 0
+    for array in buffers:
+        offsets.append([position, array.nbytes])
+        position += _aligned(array.nbytes)
+    header = _msgpack().packb([offsets, packed_values], use_bin_type=True)
+
+    prefix = _MAGIC + struct.pack("<Q", len(header)) + header
+    chunks = [prefix, bytes(_aligned(len(prefix)) - len(prefix))]
+    for array in buffers:
+        chunks.append(array.reshape(-1).view(np.uint8).data)
+        chunks.append(bytes(_aligned(array.nbytes) - array.nbytes))
+    return b"".join(chunks)
+
+
+def decode(data) -> dict:
+    """
+    Decode a checkpoint file. Arrays are views of ``data``, and read-only
+    unless ``data`` is writable.
+    """
+    msgpack = _msgpack()
+    data = memoryview(data)
+    if bytes(data[: len(_MAGIC)]) != _MAGIC:
+        raise ValueError("Not a Truffle snapshot")
+    (header_size,) = struct.unpack_from("<Q", data, len(_MAGIC))
+    header_end = len(_MAGIC) + 8 + header_size
+    offsets, packed_values = msgpack.unpackb(data[len(_MAGIC) + 8 : header_end])
+    start = _aligned(header_end)
+
+    def ext_hook(code, payload):
+        if code != _NDARRAY:
+            return msgpack.ExtType(code, payload)
+        index, dtype, shape = msgpack.unpackb(payload)
+        offset, size = offsets[index]
+        buffer = data[start + offset : start + offset + size]
+        return np.frombuffer(buffer, dtype=np.dtype(dtype)).reshape(shape)
+
+    return msgpack.unpackb(
+        packed_values, ext_hook=ext_hook, raw=False, strict_map_key=False
+    )
+
+
+def _fingerprint(value) -> bytes:
+    """
+    A digest of a field value that changes when the value does, without
+    encoding it: arrays are hashed in place and objects with a
+    ``snapshot_version`` stand for that version.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+
+    def default(obj):
+        version = getattr(obj, "snapshot_version", None)
+        if version is not None:
+            return [type(obj).__qualname__, version]
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.hasobject:
+                return obj.tolist()
+            digest.update(np.require(obj, requirements="C").data)
+            return [obj.dtype.str, list(obj.shape)]
+        if hasattr(obj, "item"):
+            # numpy scalars
+            return obj.item()
+        from pydantic_core import to_jsonable_python
+
+        return to_jsonable_python(obj)
+
+    packer = _msgpack().Packer(default=default, use_bin_type=True)
+    digest.update(packer.pack(value))
+    return digest.digest()
+
+
+def _write_atomic(path: str, data: bytes):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    # Make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class Snapshotter:
+    """
+    Checkpoints an app's fields to a directory, writing only the fields that
+    changed since the last checkpoint.
+
+    ``start()`` checkpoints periodically from a background thread, so tools
+    never wait for state to be written.
+    """
+
+    def __init__(self, app, path: str):
+        """
+        Args:
+            app: The ``TruffleApp`` to checkpoint.
+            path: Snapshot directory. Created if it does not exist.
+        """
+        _msgpack()
+        self.app = app
+        self.path = os.fspath(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        self._manifest = self._read_manifest()
+        self._sequence = max(self._manifest.values(), default=0)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _file(self, sequence: int) -> str:
+        return os.path.join(self.path, f"{sequence:08d}.snapshot")
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.path, _MANIFEST), "rb") as f:
+                return _msgpack().unpackb(f.read())
+        except FileNotFoundError:
+            return {}
+
+    def checkpoint(self, full: bool = False) -> list:
+        """
+        Write the fields that changed since the last checkpoint, or all of
+        them with ``full``. Returns the names of the fields written.
+        """
+        with self._lock:
+            names = type(self.app).model_fields
+            with self.app.state_lock:
+                fields = self.app.__dict__
+                fingerprints = {
+                    name: _fingerprint(fields[name]) for name in names if name in fields
+                }
+                changed = [
+                    name
+                    for name, fingerprint in fingerprints.items()
+                    if full or self._fingerprints.get(name) != fingerprint
+                ]
+                if not changed:
+                    return []
+                values = self.app.model_dump(include=set(changed))
+                # Arrays are dumped as they are; copy them so tools can keep
+                # writing to them while the checkpoint is encoded
+                for name, value in values.items():
+                    if isinstance(value, np.ndarray):
+                        values[name] = value.copy()
+
+            self._sequence += 1
+            _write_atomic(self._file(self._sequence), encode(values))
+            manifest = {
+                name: sequence
+                for name, sequence in self._manifest.items()
+                if name in fingerprints
+            }
+            manifest.update({name: self._sequence for name in changed})
+            _write_atomic(
+                os.path.join(self.path, _MANIFEST), _msgpack().packb(manifest)
+            )
+            self._remove_unreferenced(set(self._manifest.values()), manifest)
+            self._manifest = manifest
+            self._fingerprints = fingerprints
+            return changed
+
+    def _remove_unreferenced(self, previous: set, manifest: dict):
+        for sequence in previous - set(manifest.values()):
+            try:
+                os.unlink(self._file(sequence))
+            except FileNotFoundError:
+                pass
+
+    def restore(self) -> bool:
+        """
+        Load the latest checkpointed state into the app. Returns False if the
+        directory holds no snapshot.
+        """
+        with self._lock:
+            self._remove_leftovers()
+            if not self._manifest:
+                return False
+            state = {}
+            for sequence in sorted(set(self._manifest.values())):
+                with open(self._file(sequence), "rb") as f:
+                    # Read into a bytearray so restored arrays are writable
+                    data = bytearray(os.fstat(f.fileno()).st_size)
+                    f.readinto(data)
+                values = decode(data)
+                state.update(
+                    (name, value)
+                    for name, value in values.items()
+                    if self._manifest.get(name) == sequence
+                )
+            restored = type(self.app).model_validate(state)
+            with self.app.state_lock:
+                self.app.__dict__.update(restored.__dict__)
+                # The state just loaded does not need to be written again
+                self._fingerprints = {
+                    name: _fingerprint(self.app.__dict__[name])
+                    for name in type(self.app).model_fields
+                    if name in self.app.__dict__
+                }
+            return True
+
+    def _remove_leftovers(self):
+        # Temporary files and checkpoints written by a crashed checkpoint
+        referenced = {os.path.basename(self._file(n)) for n in self._manifest.values()}
+        for name in os.listdir(self.path):
+            if name.startswith(".tmp-") or (
+                name.endswith(".snapshot") and name not in referenced
+            ):
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+    def start(self, interval: float = 30.0):
+        """
+        Checkpoint every ``interval`` seconds from a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name="truffle-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, interval: float):
+        import logging
+
+        while not self._stop.wait(interval):
+            try:
+                self.checkpoint()
+            except Exception:
+                logging.getLogger(__name__).exception("Checkpoint failed")
+
+    def stop(self, checkpoint: bool = True):
+        """
+        Stop background checkpointing, writing a final checkpoint unless
+        ``checkpoint`` is False.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if checkpoint:
+            self.checkpoint()
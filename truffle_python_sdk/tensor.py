@@ -0,0 +1,94 @@
+"""
+Binary encoding of numpy arrays for tool parameters and results.
+
+Tools annotated with ``numpy.ndarray`` exchange arrays as raw bytes plus a
+dtype and shape instead of lists of numbers:
+
+- in gRPC, as a ``Tensor`` message (``bytes data``, ``string dtype``,
+  ``repeated int64 shape``);
+- in REST, either as a base64 JSON object ``{"data", "dtype", "shape"}``, or
+  as an ``application/octet-stream`` body/response with the dtype and shape in
+  the ``X-Tensor-Dtype`` and ``X-Tensor-Shape`` headers.
+
+Arrays are decoded with ``np.frombuffer``, which wraps the received bytes
+without copying them. Such arrays are read-only.
+"""
+
+import base64
+from typing import Annotated, Any
+
+import numpy as np
+from pydantic import PlainValidator, PlainSerializer, WithJsonSchema
+
+DTYPE_HEADER = "X-Tensor-Dtype"
+SHAPE_HEADER = "X-Tensor-Shape"
+
+
+def from_bytes(data, dtype: str, shape) -> np.ndarray:
+    """
+    Wrap ``data`` as an array of ``dtype`` and ``shape`` without copying.
+    """
+    array = np.frombuffer(data, dtype=np.dtype(dtype))
+    return array.reshape(tuple(int(dim) for dim in shape))
+
+
+def encode_tensor(array) -> dict:
+    """
+    Encode an array as ``{"data", "dtype", "shape"}`` with raw ``bytes`` data,
+    ready to build a ``Tensor`` protobuf message.
+    """
+    array = np.ascontiguousarray(array)
+    return {
+        "data": array.tobytes(),
+        "dtype": array.dtype.str,
+        "shape": list(array.shape),
+    }
+
+
+def encode_tensor_base64(array) -> dict:
+    """
+    Encode an array as a JSON-friendly ``{"data", "dtype", "shape"}`` object
+    with base64 data.
+    """
+    tensor = encode_tensor(array)
+    tensor["data"] = base64.b64encode(tensor["data"]).decode("ascii")
+    return tensor
+
+
+def decode_tensor(value: Any) -> np.ndarray:
+    """
+    Decode an array from any of its wire representations: an ndarray, a
+    ``Tensor`` protobuf message, a ``{"data", "dtype", "shape"}`` mapping with
+    raw or base64 data, or a (nested) list of numbers.
+    """
+    if isinstance(value, np.ndarray):
+        return value
+    if hasattr(value, "DESCRIPTOR"):
+        return from_bytes(value.data, value.dtype or "<f4", value.shape)
+    if isinstance(value, dict) and "data" in value:
+        data = value["data"]
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        dtype = value.get("dtype", "<f4")
+        shape = value.get("shape") or [len(data) // np.dtype(dtype).itemsize]
+        return from_bytes(data, dtype, shape)
+    return np.asarray(value)
+
+
+# Annotation used in request models for ``np.ndarray`` parameters
+NDArray = Annotated[
+    np.ndarray,
+    PlainValidator(decode_tensor),
+    PlainSerializer(encode_tensor_base64),
+    WithJsonSchema(
+        {
+            "type": "object",
+            "properties": {
+                "data": {"type": "string", "contentEncoding": "base64"},
+                "dtype": {"type": "string"},
+                "shape": {"type": "array", "items": {"type": "integer"}},
+            },
+            "required": ["data"],
+        }
+    ),
+]
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__all__ = ["FakeBackend", "fake_embedding"]
+
+
+def fake_embedding(text: str, dim: int = 8) -> list:
+    """Deterministic embedding derived from a hash of the text."""
+    digest = hashlib.sha256(text.encode()).digest()
+    return [b / 255.0 for b in digest[:dim]]
+
+
+class _FakeBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; do not let Nagle delay the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.server.record:
+            self.server.requests.append((self.path, payload))
+
+        text = self.server.reply
+        if text is None and self.path == "/v1/completions":
+            text = f"echo: {payload['prompt']}"
+
+        if self.path == "/v1/completions" and payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            words = payload["prompt"] if self.server.reply is None else text
+            for word in words.split():
+                chunk = {"choices": [{"text": word + " "}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+            return
+        elif self.path == "/v1/completions":
+            body = {"choices": [{"text": text}]}
+        elif self.path == "/v1/embeddings":
+            inputs = payload["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            body = {
+                "data": [
+                    {"index": i, "embedding": fake_embedding(text, self.server.dim)}
+                    for i, text in enumerate(inputs)
+                ]
+            }
+        else:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeBackend(ThreadingHTTPServer):
+    """
+    A local stand-in for the Truffle completion and embedding server, for
+    tests and benchmarks that must run offline.
+
+    Completions echo the prompt, or return ``reply`` if given (streamed word
+    by word when requested), and embeddings are derived from a hash of each
+    input. Requests are recorded
+    in ``requests`` as ``(path, payload)`` pairs unless ``record`` is false,
+    and ``connections`` counts the connections accepted.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 8,
+        reply: str = None,
+        record: bool = True,
+    ):
+        super().__init__((host, port), _FakeBackendHandler)
+        self.dim = dim
+        self.reply = reply
+        self.record = record
+        self.connections = 0
+        self.requests = []
+        self.url = f"http://{host}:{self.server_address[1]}"
+        self._thread = None
+
+    def start(self) -> "FakeBackend":
+        """Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
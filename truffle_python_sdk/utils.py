@@ -1,16 +1,57 @@
+import inspect
 from functools import wraps
+from typing import get_args
 
 
 def tool(name: str = None):
     def decorator(func):
-        @wraps(func)
-        def wrapper(self, *args, **kwargs):
-            return func(self, *args, **kwargs)
+        if inspect.iscoroutinefunction(func):
+            # Keep async tools awaitable so that servers can await them natively
+            @wraps(func)
+            async def wrapper(self, *args, **kwargs):
+                return await func(self, *args, **kwargs)
 
-        tool_args = {"name": name or func.__name__}
+        else:
+
+            @wraps(func)
+            def wrapper(self, *args, **kwargs):
+                return func(self, *args, **kwargs)
+
+        tool_args = {
+            "name": name or func.__name__,
+            # Generator tools stream their results chunk by chunk
+            "stream": inspect.isgeneratorfunction(func)
+            or inspect.isasyncgenfunction(func),
+        }
 
         wrapper.__truffle_tool__ = tool_args
 
         return wrapper
 
     return decorator
+
+
+def stream_item_type(return_type):
+    """
+    Return the type of the items yielded by a streaming tool, given its
+    ``Iterator[T]``/``Generator[T, ...]``/``AsyncIterator[T]`` annotation.
+    """
+    args = get_args(return_type)
+    if args:
+        return args[0]
+    return str
+
+
+def is_ndarray(annotation) -> bool:
+    """Whether ``annotation`` is ``numpy.ndarray``, without importing numpy."""
+    return (
+        getattr(annotation, "__module__", None) == "numpy"
+        and getattr(annotation, "__name__", None) == "ndarray"
+    )
+
+
+def is_model(annotation) -> bool:
+    """Whether ``annotation`` is a pydantic model class."""
+    from pydantic import BaseModel
+
+    return inspect.isclass(annotation) and issubclass(annotation, BaseModel)
@@ -0,0 +1,201 @@
+from typing import Any, List, NamedTuple, Optional
+
+import numpy as np
+
+
+class SearchResult(NamedTuple):
+    score: float
+    index: int
+    text: str
+    metadata: Optional[dict]
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale each row of a float32 matrix to unit length, in place. All-zero rows
+    are left as they are.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors /= norms
+    return vectors
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the ``k`` highest scores along the last axis, best first.
+
+    Uses ``argpartition`` so only the top ``k`` entries are sorted.
+    """
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+class VectorStore:
+    """
+    Exact nearest-neighbour store for embeddings, scored by cosine similarity.
+
+    Vectors are kept as rows of one contiguous float32 matrix, normalised when
+    they are added, so a query is a single matrix-vector product followed by
+    an ``argpartition`` top-k. The matrix grows geometrically, so appends are
+    amortised O(1).
+
+    It can be declared as a field of a ``TruffleApp``::
+
+        class ChatApp(TruffleApp):
+            knowledge_base: VectorStore = Field(default_factory=VectorStore)
+    """
+
+    def __init__(self, dim: int = None, capacity: int = 1024):
+        """
+        Args:
+            dim: Dimension of the vectors. Inferred from the first vector
+                added if not given.
+            capacity: Number of rows to allocate up front.
+        """
+        self.dim = dim
+        self.texts: List[str] = []
+        self.metadata: List[Optional[dict]] = []
+        self._capacity = capacity
+        self._matrix = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"{type(self).__name__}(dim={self.dim}, size={self._size})"
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The stored (normalised) vectors, one per row."""
+        if self._matrix is None:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        return self._matrix[: self._size]
+
+    def _reserve(self, count: int):
+        needed = self._size + count
+        if self._matrix is None:
+            capacity = max(self._capacity, needed)
+            self._matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        elif needed > self._matrix.shape[0]:
+            capacity = max(needed, 2 * self._matrix.shape[0])
+            matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            matrix[: self._size] = self._matrix[: self._size]
+            self._matrix = matrix
+
+    def _as_matrix(self, vectors) -> np.ndarray:
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}"
+            )
+        return normalize_rows(vectors)
+
+    def add(self, vector, text: str, metadata: dict = None) -> int:
+        """
+        Add one vector with its text. Returns the row index of the vector.
+        """
+        return self.add_many([vector], [text], [metadata])[0]
+
+    def add_many(self, vectors, texts: List[str], metadata: List[dict] = None):
+        """
+        Add several vectors with their texts. Returns their row indices.
+        """
+        if len(texts) == 0:
+            return []
+        vectors = self._as_matrix(vectors)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} vectors but {len(texts)} texts")
+
+        self._reserve(len(vectors))
+        start = self._size
+        self._matrix[start : start + len(vectors)] = vectors
+        self._size += len(vectors)
+        self.texts.extend(texts)
+        self.metadata.extend(metadata or [None] * len(texts))
+        return list(range(start, self._size))
+
+    def search(self, query, k: int = 3) -> List[SearchResult]:
+        """
+        Return the ``k`` stored entries most similar to ``query``, best first.
+        """
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries, k: int = 3) -> List[List[SearchResult]]:
+        """
+        Search for several queries at once with one matrix product.
+        """
+        if self._size == 0:
+            return [[] for _ in range(len(queries))]
+        queries = self._as_matrix(queries)
+        scores = queries @ self.vectors.T
+        indices = top_k(scores, k)
+        return [
+            [
+                SearchResult(
+                    float(row_scores[i]), int(i), self.texts[i], self.metadata[i]
+                )
+                for i in row_indices
+            ]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+    @property
+    def snapshot_version(self):
+        """
+        A value that changes whenever ``to_dict()`` would, so snapshots can
+        tell the store changed without reading its vectors. Rows are only
+        ever appended, so the number of rows is enough.
+        """
+        return self.dim, self._size
+
+    def to_dict(self) -> dict:
+        return {
+            "dim": self.dim,
+            "vectors": self.vectors,
+            "texts": list(self.texts),
+            "metadata": list(self.metadata),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "VectorStore":
+        store = cls(dim=data.get("dim"))
+        vectors = data.get("vectors")
+        if vectors is not None and len(data.get("texts", [])):
+            store.add_many(vectors, data["texts"], data.get("metadata"))
+        return store
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler):
+        from pydantic_core import core_schema
+
+        def validate(value):
+            if isinstance(value, cls):
+                return value
+            if isinstance(value, dict):
+                return cls.from_dict(value)
+            raise ValueError(f"Cannot build a {cls.__name__} from {type(value)}")
+
+        def serialize(value, info):
+            data = value.to_dict()
+            if info.mode == "json":
+                data["vectors"] = data["vectors"].tolist()
+            return data
+
+        return core_schema.no_info_plain_validator_function(
+            validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                serialize, info_arg=True
+            ),
+        )